@@ -0,0 +1,131 @@
+"""Herd analytics computed over columnar production data.
+
+Takes plain NumPy columns (one row per record, animals as integer codes) so the
+server can pull a finca's history once and summarise it without Python loops.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# A gap longer than this between milk records starts a new lactation
+SECADO_DIAS = 60
+# Days in milk bounds of the lactation stages
+ETAPAS_LACTANCIA = [("temprana", 0, 100), ("media", 101, 200), ("tardia", 201, None)]
+PERCENTILES = (10, 25, 50, 75, 90)
+RANKING = 5
+
+def dias(fechas: List[str]) -> np.ndarray:
+    """Days since epoch for "%Y-%m-%d" strings"""
+    return np.array(fechas, dtype="datetime64[D]").astype(np.int64)
+
+def _redondear(valor, decimales: int = 2) -> Optional[float]:
+    return None if valor is None or np.isnan(valor) else round(float(valor), decimales)
+
+def _percentiles(valores: np.ndarray, decimales: int = 2) -> Optional[Dict[str, float]]:
+    if not valores.size:
+        return None
+    return {f"p{q}": _redondear(v, decimales) for q, v in zip(PERCENTILES, np.percentile(valores, PERCENTILES))}
+
+def _ranking(ids: List[str], codigos: np.ndarray, valores: np.ndarray, campo: str, decimales: int = 2) -> Dict[str, List]:
+    orden = np.argsort(valores, kind="stable")
+    fila = lambda i: {"bovino_id": ids[codigos[i]], campo: _redondear(valores[i], decimales)}
+    return {
+        "mejores": [fila(i) for i in orden[::-1][:RANKING]],
+        "peores": [fila(i) for i in orden[:RANKING]],
+    }
+
+def _tendencia_mensual(dia: np.ndarray, valores: np.ndarray) -> Dict:
+    """Monthly means of a column that may hold NaN, and their least-squares slope per month"""
+    validos = ~np.isnan(valores)
+    if not validos.any():
+        return {"promedio": None, "pendiente_mensual": None, "serie": []}
+    meses = dia[validos].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    primero = meses.min()
+    conteo = np.bincount(meses - primero)
+    suma = np.bincount(meses - primero, weights=valores[validos])
+    con_datos = np.flatnonzero(conteo)
+    medias = suma[con_datos] / conteo[con_datos]
+    pendiente = np.polyfit(con_datos, medias, 1)[0] if con_datos.size > 1 else None
+    return {
+        "promedio": _redondear(valores[validos].mean()),
+        "pendiente_mensual": _redondear(pendiente, 4) if pendiente is not None else None,
+        "serie": [
+            {"mes": str(np.datetime64(int(primero + m), "M")), "promedio": _redondear(v)}
+            for m, v in zip(con_datos, medias)
+        ],
+    }
+
+def resumen_leche(ids: List[str], bovino: np.ndarray, dia: np.ndarray, litros: np.ndarray,
+                  grasa: np.ndarray, proteina: np.ndarray) -> Dict:
+    if not bovino.size:
+        return {"registros": 0, "animales": 0}
+    n = len(ids)
+    conteo = np.bincount(bovino, minlength=n)
+    promedio = np.bincount(bovino, weights=litros, minlength=n)
+    con_leche = np.flatnonzero(conteo)
+    promedio = promedio[con_leche] / conteo[con_leche]
+
+    # Days in milk: sort by animal and date, a new lactation starts at each
+    # animal change or dry gap, and every record measures from its start
+    orden = np.lexsort((dia, bovino))
+    b, d, l = bovino[orden], dia[orden], litros[orden]
+    inicio = np.ones(b.size, dtype=bool)
+    inicio[1:] = (b[1:] != b[:-1]) | (np.diff(d) > SECADO_DIAS)
+    origen = np.maximum.accumulate(np.where(inicio, np.arange(b.size), 0))
+    etapa = np.digitize(d - d[origen], [inicio_etapa for _, inicio_etapa, _ in ETAPAS_LACTANCIA[1:]])
+    registros_etapa = np.bincount(etapa, minlength=len(ETAPAS_LACTANCIA))
+    litros_etapa = np.bincount(etapa, weights=l, minlength=len(ETAPAS_LACTANCIA))
+    animales_etapa = np.bincount(np.unique(b * len(ETAPAS_LACTANCIA) + etapa) % len(ETAPAS_LACTANCIA),
+                                 minlength=len(ETAPAS_LACTANCIA))
+
+    return {
+        "registros": int(bovino.size),
+        "animales": int(con_leche.size),
+        "litros_totales": _redondear(litros.sum()),
+        "litros_promedio_registro": _redondear(litros.mean()),
+        "percentiles_promedio_animal": _percentiles(promedio),
+        **_ranking(ids, con_leche, promedio, "litros_promedio"),
+        "lactancias": int(inicio.sum()),
+        "por_etapa_lactancia": [
+            {
+                "etapa": nombre,
+                "dias_en_leche": f"{desde}-{hasta}" if hasta else f"{desde}+",
+                "animales": int(animales_etapa[i]),
+                "registros": int(registros_etapa[i]),
+                "litros_promedio": _redondear(litros_etapa[i] / registros_etapa[i]) if registros_etapa[i] else None,
+            }
+            for i, (nombre, desde, hasta) in enumerate(ETAPAS_LACTANCIA)
+        ],
+        "grasa": _tendencia_mensual(dia, grasa),
+        "proteina": _tendencia_mensual(dia, proteina),
+    }
+
+def resumen_engorde(ids: List[str], bovino: np.ndarray, dia: np.ndarray, peso: np.ndarray) -> Dict:
+    """Average daily gain per animal as the least-squares slope of its weighings"""
+    if not bovino.size:
+        return {"registros": 0, "animales": 0}
+    n = len(ids)
+    t = (dia - dia.min()).astype(np.float64)
+    suma = lambda pesos: np.bincount(bovino, weights=pesos, minlength=n)
+    conteo = np.bincount(bovino, minlength=n).astype(np.float64)
+    st, sw, stt, stw = suma(t), suma(peso), suma(t * t), suma(t * peso)
+    denominador = conteo * stt - st * st
+    # Two or more weighings on different days give a slope
+    con_ganancia = np.flatnonzero((conteo > 1) & (denominador > 0))
+    ganancia = (conteo * stw - st * sw)[con_ganancia] / denominador[con_ganancia]
+
+    return {
+        "registros": int(bovino.size),
+        "animales": int(np.count_nonzero(conteo)),
+        "animales_con_ganancia": int(con_ganancia.size),
+        "ganancia_diaria_promedio_kg": _redondear(ganancia.mean(), 3) if ganancia.size else None,
+        "percentiles_ganancia_diaria_kg": _percentiles(ganancia, 3),
+        **_ranking(ids, con_ganancia, ganancia, "ganancia_diaria_kg", 3),
+    }
+
+def herd_summary(ids: List[str], leche: Dict[str, np.ndarray], engorde: Dict[str, np.ndarray]) -> Dict:
+    """Milk and weight summary of a herd; `ids[codigo]` maps the integer animal codes back to bovino ids"""
+    return {
+        "leche": resumen_leche(ids, **leche),
+        "engorde": resumen_engorde(ids, **engorde),
+    }
@@ -0,0 +1,27 @@
+"""Chart rendering for report endpoints.
+
+Runs inside the chart process pool, so it only imports matplotlib and draws on
+its own Figure instead of the shared pyplot state.
+"""
+from io import BytesIO
+from typing import List
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+def render_series_chart(titulo: str, unidad: str, fechas: List[str], valores: List[float]) -> bytes:
+    """Render a dated series as a PNG line chart"""
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(fechas, valores, marker='o', linewidth=2, markersize=4)
+    ax.set_title(titulo, fontsize=16)
+    ax.set_xlabel('Fecha', fontsize=12)
+    ax.set_ylabel(unidad, fontsize=12)
+    ax.grid(True, alpha=0.3)
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
+    return buffer.getvalue()
@@ -0,0 +1,81 @@
+"""Point-in-polygon tests for potrero and finca geofences.
+
+Polygons are prepared once per finca (edge arrays plus a bounding box) and then
+tested against whole batches of positions with NumPy: each edge is one
+vectorized ray-casting step over all the points that fall inside the box.
+Coordinates are GeoJSON longitude/latitude; at paddock and farm scale a planar
+test on them is accurate enough.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+class Cerca:
+    """A prepared polygon: its outer ring as edge arrays and its bounding box"""
+    __slots__ = ("id", "x0", "y0", "x1", "y1", "caja")
+
+    def __init__(self, id: Optional[str], anillo):
+        puntos = np.asarray(anillo, dtype=np.float64)
+        if len(puntos) and (puntos[0] != puntos[-1]).any():
+            puntos = np.vstack([puntos, puntos[:1]])
+        self.id = id
+        self.x0, self.y0 = puntos[:-1, 0], puntos[:-1, 1]
+        self.x1, self.y1 = puntos[1:, 0], puntos[1:, 1]
+        self.caja = (puntos[:, 0].min(), puntos[:, 1].min(), puntos[:, 0].max(), puntos[:, 1].max())
+
+def preparar(id: Optional[str], geojson: Optional[dict]) -> Optional[Cerca]:
+    """Cerca for a GeoJSON Polygon; holes are ignored"""
+    if not geojson or not geojson.get("coordinates"):
+        return None
+    return Cerca(id, geojson["coordinates"][0])
+
+def dentro(cerca: Cerca, lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Whether each point is inside `cerca` (even-odd rule)"""
+    xmin, ymin, xmax, ymax = cerca.caja
+    resultado = np.zeros(lng.shape, dtype=bool)
+    candidatos = np.flatnonzero((lng >= xmin) & (lng <= xmax) & (lat >= ymin) & (lat <= ymax))
+    if not candidatos.size:
+        return resultado
+    x, y = lng[candidatos], lat[candidatos]
+    cruces = np.zeros(candidatos.size, dtype=bool)
+    for x0, y0, x1, y1 in zip(cerca.x0, cerca.y0, cerca.x1, cerca.y1):
+        if y0 == y1:
+            continue
+        cruza = (y0 > y) != (y1 > y)
+        cruces ^= cruza & (x < x0 + (y - y0) * (x1 - x0) / (y1 - y0))
+    resultado[candidatos] = cruces
+    return resultado
+
+def localizar(cercas: List[Cerca], lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Index in `cercas` of the first polygon containing each point, or -1"""
+    indice = np.full(lng.shape, -1, dtype=np.int64)
+    for i, cerca in enumerate(cercas):
+        libres = np.flatnonzero(indice < 0)
+        if not libres.size:
+            break
+        indice[libres[dentro(cerca, lng[libres], lat[libres])]] = i
+    return indice
+
+def fuera_de(cercas: List[Cerca], asignada: np.ndarray, lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Whether each point is outside `cercas[asignada[i]]`; points with asignada -1 are never outside"""
+    fuera = np.zeros(lng.shape, dtype=bool)
+    orden = np.argsort(asignada, kind="stable")
+    grupos, inicios = np.unique(asignada[orden], return_index=True)
+    for grupo, puntos in zip(grupos, np.split(orden, inicios[1:])):
+        if grupo >= 0:
+            fuera[puntos] = ~dentro(cercas[grupo], lng[puntos], lat[puntos])
+    return fuera
+
+def evaluar(perimetro: Optional[Cerca], potreros: List[Cerca], asignado: np.ndarray,
+            lng: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Masks of the points outside the farm perimeter and of those outside their assigned
+    potrero (`asignado` indexes `potreros`, -1 for none). A point outside the farm is not
+    also reported as outside its potrero."""
+    fuera_finca = ~dentro(perimetro, lng, lat) if perimetro is not None else np.zeros(lng.shape, dtype=bool)
+    fuera_potrero = fuera_de(potreros, np.where(fuera_finca, -1, asignado), lng, lat)
+    return fuera_finca, fuera_potrero
+
+def ocupacion(potreros: List[Cerca], lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Number of points inside each potrero"""
+    indice = localizar(potreros, lng, lat)
+    return np.bincount(indice[indice >= 0], minlength=len(potreros))
@@ -0,0 +1,79 @@
+"""Tabular PDF reports for the report endpoints.
+
+Runs inside the PDF process pool. Rows come from an NDJSON spool file written by
+the server, one JSON list of cell values per line, and are drawn a page at a
+time, so memory stays bounded by one page no matter how long the report is.
+"""
+import json
+from datetime import datetime
+from itertools import islice
+from typing import List, Tuple
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import inch
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Table, TableStyle
+
+PAGINA = landscape(A4)
+MARGEN = 0.5 * inch
+FILAS_POR_PAGINA = 32
+# Roughly how many characters of a 7pt cell fit in one inch
+CARACTERES_POR_PULGADA = 17
+
+ESTILO_TABLA = TableStyle([
+    ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", 8),
+    ("FONT", (0, 1), (-1, -1), "Helvetica", 7),
+    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#2f6b3a")),
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+    ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f1f5f1")]),
+    ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+])
+
+def _celda(valor, ancho: float) -> str:
+    if valor is None:
+        return ""
+    texto = f"{valor:,.2f}" if isinstance(valor, float) else str(valor)
+    limite = max(4, int(ancho * CARACTERES_POR_PULGADA))
+    return texto if len(texto) <= limite else texto[:limite - 1] + "…"
+
+def _encabezado(canvas: Canvas, titulo: str, subtitulo: str, pagina: int):
+    ancho, alto = PAGINA
+    canvas.setFont("Helvetica-Bold", 14)
+    canvas.drawString(MARGEN, alto - MARGEN, titulo)
+    canvas.setFont("Helvetica", 9)
+    canvas.drawString(MARGEN, alto - MARGEN - 14, subtitulo)
+    canvas.drawRightString(ancho - MARGEN, MARGEN / 2, f"Página {pagina}")
+
+def render_table_pdf(origen: str, destino: str, titulo: str, subtitulo: str,
+                     columnas: List[Tuple[str, float]]) -> int:
+    """Draw the NDJSON rows in `origen` as a paginated table at `destino`; returns the page count.
+    `columnas` are (header, width in inches) pairs."""
+    anchos = [ancho * inch for _, ancho in columnas]
+    encabezados = [nombre for nombre, _ in columnas]
+    subtitulo = f"{subtitulo} · Generado {datetime.now():%Y-%m-%d %H:%M}"
+    canvas = Canvas(destino, pagesize=PAGINA, pageCompression=1)
+    canvas.setTitle(titulo)
+    _, alto = PAGINA
+
+    pagina = 0
+    with open(origen, encoding="utf-8") as filas:
+        while True:
+            lote = [json.loads(linea) for linea in islice(filas, FILAS_POR_PAGINA)]
+            if not lote and pagina:
+                break
+            pagina += 1
+            _encabezado(canvas, titulo, subtitulo, pagina)
+            cuerpo = [[_celda(v, a) for v, (_, a) in zip(fila, columnas)] for fila in lote]
+            if not cuerpo:
+                cuerpo = [["Sin registros"] + [""] * (len(columnas) - 1)]
+            tabla = Table([encabezados] + cuerpo, colWidths=anchos)
+            tabla.setStyle(ESTILO_TABLA)
+            _, alto_tabla = tabla.wrapOn(canvas, sum(anchos), alto)
+            tabla.drawOn(canvas, MARGEN, alto - MARGEN - 28 - alto_tabla)
+            canvas.showPage()
+            if len(lote) < FILAS_POR_PAGINA:
+                break
+    canvas.save()
+    return pagina
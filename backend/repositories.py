@@ -0,0 +1,717 @@
+"""Data access behind one interface, backed by MongoDB or by the relational schema.
+
+MongoRepository reads the collections, counters and rollups the server keeps.
+SQLRepository runs on mysql_schema.sql through a connection pool and answers
+from its views and stored procedures. SQLite stands in for local tests with
+SQLITE_SCHEMA, a reduced copy of the same tables, views and triggers.
+
+The server only serves MongoRepository; nothing writes the relational store, so
+SQLRepository is exercised by the repository benchmark and the unit tests.
+"""
+import asyncio
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from urllib.parse import unquote, urlparse
+
+SERIES = ("leche", "engorde")
+
+class HerdRepository(ABC):
+    """Lookups, bulk loads and report reads shared by every storage backend"""
+    backend: str
+
+    @abstractmethod
+    async def get_finca(self, finca_id: str) -> Optional[Dict]: ...
+
+    @abstractmethod
+    async def get_bovino(self, bovino_id: str) -> Optional[Dict]: ...
+
+    @abstractmethod
+    async def list_bovinos(self, finca_id: Optional[str] = None, tipo_ganado: Optional[str] = None,
+                           limit: int = 100, despues_de: Optional[str] = None) -> List[Dict]:
+        """One page of bovinos ordered by id, starting after `despues_de`"""
+
+    @abstractmethod
+    async def insert_fincas(self, fincas: List[Dict]): ...
+
+    @abstractmethod
+    async def insert_bovinos(self, bovinos: List[Dict]): ...
+
+    @abstractmethod
+    async def insert_produccion_leche(self, registros: List[Dict]): ...
+
+    @abstractmethod
+    async def reporte_produccion(self, bovino_id: str, desde: str, hasta: str,
+                                 series: Sequence[str] = SERIES) -> Dict[str, List[Dict]]:
+        """Dated points per series (sp_reporte_produccion): {"leche": [{"fecha_registro", "valor", ...}], ...}"""
+
+    @abstractmethod
+    async def dashboard_stats(self, finca_id: Optional[str], dias: int) -> Dict:
+        """Dashboard counters (sp_dashboard_stats) with the herd split by type and sale state"""
+
+    @abstractmethod
+    async def produccion_mensual(self, finca_ids: Optional[List[str]], desde: Optional[str],
+                                 hasta: Optional[str]) -> List[Dict]:
+        """Rows of v_produccion_lactea_mensual for the given fincas and "AAAA-MM" bounds"""
+
+    async def close(self):
+        pass
+
+def _promedio(suma, registros) -> Optional[float]:
+    return round(suma / registros, 2) if registros else None
+
+def _conteos(conteos: Dict[str, float]) -> List[Dict]:
+    return [{"_id": k, "count": v} for k, v in conteos.items() if v]
+
+class MongoRepository(HerdRepository):
+    backend = "mongo"
+
+    def __init__(self, db, coleccion_leche: str, coleccion_engorde: str, campo_fecha: str,
+                 fecha_serie: Callable[[str], Any]):
+        self.db = db
+        self.colecciones = {"leche": coleccion_leche, "engorde": coleccion_engorde}
+        self.campos = {"leche": "leche_litros", "engorde": "peso_kg"}
+        self.campo_fecha = campo_fecha
+        self.fecha_serie = fecha_serie
+
+    async def get_finca(self, finca_id: str) -> Optional[Dict]:
+        return await self.db.fincas.find_one({"id": finca_id}, {"_id": 0})
+
+    async def get_bovino(self, bovino_id: str) -> Optional[Dict]:
+        return await self.db.bovinos.find_one({"id": bovino_id}, {"_id": 0, "qr_clave": 0})
+
+    async def list_bovinos(self, finca_id: Optional[str] = None, tipo_ganado: Optional[str] = None,
+                           limit: int = 100, despues_de: Optional[str] = None) -> List[Dict]:
+        query = {}
+        if finca_id:
+            query["finca_id"] = finca_id
+        if tipo_ganado:
+            query["tipo_ganado"] = tipo_ganado
+        if despues_de:
+            query["id"] = {"$gt": despues_de}
+        return await self.db.bovinos.find(query, {"_id": 0, "qr_clave": 0}).sort("id", 1).to_list(limit)
+
+    async def insert_fincas(self, fincas: List[Dict]):
+        await self.db.fincas.insert_many(fincas, ordered=False)
+
+    async def insert_bovinos(self, bovinos: List[Dict]):
+        await self.db.bovinos.insert_many(bovinos, ordered=False)
+
+    async def insert_produccion_leche(self, registros: List[Dict]):
+        if self.campo_fecha != "fecha_registro":
+            registros = [{**r, self.campo_fecha: self.fecha_serie(r["fecha_registro"])} for r in registros]
+        await self.db[self.colecciones["leche"]].insert_many(registros, ordered=False)
+
+    async def reporte_produccion(self, bovino_id: str, desde: str, hasta: str,
+                                 series: Sequence[str] = SERIES) -> Dict[str, List[Dict]]:
+        async def serie(nombre: str) -> List[Dict]:
+            campo = self.campos[nombre]
+            extras = {"grasa_pct": 1, "proteina_pct": 1} if nombre == "leche" else {}
+            docs = await self.db[self.colecciones[nombre]].find(
+                {"bovino_id": bovino_id,
+                 self.campo_fecha: {"$gte": self.fecha_serie(desde), "$lte": self.fecha_serie(hasta)}},
+                {"_id": 0, "fecha_registro": 1, campo: 1, **extras}
+            ).sort(self.campo_fecha, 1).to_list(None)
+            return [{"fecha_registro": d["fecha_registro"], "valor": d.pop(campo), **d} for d in docs]
+
+        return dict(zip(series, await asyncio.gather(*[serie(nombre) for nombre in series])))
+
+    async def dashboard_stats(self, finca_id: Optional[str], dias: int) -> Dict:
+        query = {"finca_id": finca_id} if finca_id else {}
+        stats = await self.db.estadisticas_finca.find(query, {"_id": 0}).to_list(None)
+
+        por_tipo, por_venta = {}, {}
+        for finca in stats:
+            for tipo, count in finca.get("por_tipo", {}).items():
+                por_tipo[tipo] = por_tipo.get(tipo, 0) + count
+            for venta, count in finca.get("por_venta", {}).items():
+                por_venta[venta] = por_venta.get(venta, 0) + count
+
+        fecha_inicio = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d")
+        total_litros_mes = sum(
+            litros
+            for finca in stats
+            for fecha, litros in finca.get("leche_diaria", {}).items()
+            if fecha >= fecha_inicio
+        )
+        return {
+            "total_bovinos": sum(finca.get("bovinos_activos", 0) for finca in stats),
+            "total_fincas": len(stats),
+            "alertas_activas": sum(finca.get("alertas_activas", 0) for finca in stats),
+            "bovinos_por_tipo": _conteos(por_tipo),
+            "bovinos_por_venta": _conteos(por_venta),
+            "total_litros_mes": round(total_litros_mes, 2),
+        }
+
+    async def produccion_mensual(self, finca_ids: Optional[List[str]], desde: Optional[str],
+                                 hasta: Optional[str]) -> List[Dict]:
+        query = {}
+        if finca_ids:
+            query["finca_id"] = {"$in": finca_ids}
+        if desde or hasta:
+            query["mes"] = {k: v for k, v in (("$gte", desde), ("$lte", hasta)) if v}
+
+        meses = await self.db.produccion_mensual_finca.aggregate([
+            {"$match": query},
+            {"$sort": {"finca_id": 1, "mes": 1}},
+            {"$set": {"vacas_productoras": {"$size": "$bovinos"}}},
+            {"$project": {"_id": 0, "bovinos": 0}},
+        ]).to_list(None)
+        nombres = {
+            f["id"]: f["nombre"] async for f in self.db.fincas.find(
+                {"id": {"$in": list({m["finca_id"] for m in meses})}}, {"_id": 0, "id": 1, "nombre": 1}
+            )
+        }
+        return [
+            {
+                "finca_id": m["finca_id"],
+                "finca_nombre": nombres.get(m["finca_id"]),
+                "anio": int(m["mes"][:4]),
+                "mes": int(m["mes"][5:7]),
+                "vacas_productoras": m["vacas_productoras"],
+                "litros_totales": round(m["litros"], 2),
+                "litros_promedio_diario": _promedio(m["litros"], m["registros"]),
+                "grasa_promedio": _promedio(m.get("grasa_suma", 0), m.get("grasa_registros", 0)),
+                "proteina_promedio": _promedio(m.get("proteina_suma", 0), m.get("proteina_registros", 0)),
+            }
+            for m in meses
+            if m["registros"] > 0
+        ]
+
+# Relational backend
+# Catalog ids are fixed by the INSERTs in mysql_schema.sql
+CATALOGOS = {
+    "tipo_ganado": {"leche": 1, "carne": 2, "dual": 3},
+    "estado_ganado": {"activo": 1, "vendido": 2, "reservado": 3, "muerto": 4, "retirado": 5},
+    "estado_venta": {"disponible": 1, "reservado": 2, "vendido": 3},
+}
+
+BOVINO_SELECT = """
+SELECT b.id, b.finca_id, b.caravana, b.arete_oficial, b.nombre, b.sexo, r.nombre AS raza,
+       b.fecha_nacimiento, b.peso_kg, tg.codigo AS tipo_ganado, eg.codigo AS estado_ganado,
+       ev.codigo AS estado_venta, b.precio, b.latitud, b.longitud, b.ultima_ubicacion_fecha,
+       b.foto_url, b.qr_url, b.contacto_nombre, b.contacto_telefono, b.padre_id, b.madre_id,
+       b.observaciones, b.created_at
+FROM bovinos b
+JOIN tipos_ganado tg ON tg.id = b.tipo_ganado_id
+JOIN estados_ganado eg ON eg.id = b.estado_ganado_id
+JOIN estados_venta ev ON ev.id = b.estado_venta_id
+LEFT JOIN razas r ON r.id = b.raza_id"""
+
+# Statements are written once with "?" markers and prepared per dialect
+SENTENCIAS = {
+    "finca": """
+        SELECT id, nombre, codigo_pais, latitud, longitud, perimetro_geojson, area_hectareas,
+               direccion, telefono, created_at
+        FROM fincas WHERE id = ?""",
+    "bovino": BOVINO_SELECT + " WHERE b.id = ?",
+    "insertar_finca": """
+        INSERT INTO fincas (id, nombre, codigo_pais, direccion, telefono, area_hectareas,
+                            latitud, longitud, perimetro_geojson, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    "insertar_bovino": """
+        INSERT INTO bovinos (id, finca_id, caravana, arete_oficial, nombre, sexo, raza_id,
+                             fecha_nacimiento, peso_kg, tipo_ganado_id, estado_ganado_id, estado_venta_id,
+                             precio, latitud, longitud, foto_url, qr_url, contacto_nombre, contacto_telefono,
+                             padre_id, madre_id, observaciones, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, (SELECT id FROM razas WHERE nombre = ?), ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    "insertar_leche": """
+        INSERT INTO produccion_leche (id, bovino_id, fecha_registro, litros, grasa_porcentaje,
+                                      proteina_porcentaje, observaciones, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+    "conteos_dashboard": """
+        SELECT tg.codigo AS tipo, ev.codigo AS venta, COUNT(*) AS n
+        FROM bovinos b
+        JOIN tipos_ganado tg ON tg.id = b.tipo_ganado_id
+        JOIN estados_venta ev ON ev.id = b.estado_venta_id
+        WHERE b.activo = TRUE AND b.estado_ganado_id = 1 AND b.finca_id = COALESCE(?, b.finca_id)
+        GROUP BY tg.codigo, ev.codigo""",
+    "mysql:dashboard": "CALL sp_dashboard_stats(?)",
+    "mysql:reporte_produccion": "CALL sp_reporte_produccion(?, ?, ?)",
+    # SQLite has no stored procedures: the same selects as the procedure bodies
+    "sqlite:dashboard": """
+        SELECT
+          (SELECT COUNT(*) FROM bovinos WHERE finca_id = COALESCE(?1, finca_id) AND activo = TRUE) AS total_bovinos,
+          (SELECT COUNT(*) FROM fincas WHERE id = COALESCE(?1, id) AND activa = TRUE) AS total_fincas,
+          (SELECT COUNT(*) FROM alertas a JOIN bovinos b ON a.bovino_id = b.id
+            WHERE b.finca_id = COALESCE(?1, b.finca_id) AND a.activa = TRUE) AS alertas_activas,
+          (SELECT COALESCE(SUM(pl.litros), 0) FROM produccion_leche pl JOIN bovinos b ON pl.bovino_id = b.id
+            WHERE b.finca_id = COALESCE(?1, b.finca_id) AND pl.fecha_registro >= ?2) AS litros_mes_actual""",
+    "sqlite:reporte_leche": """
+        SELECT 'PRODUCCION_LECHE' AS tipo, fecha_registro, litros AS valor, grasa_porcentaje, proteina_porcentaje
+        FROM produccion_leche
+        WHERE bovino_id = ? AND fecha_registro BETWEEN ? AND ?
+        ORDER BY fecha_registro""",
+    "sqlite:reporte_engorde": """
+        SELECT 'PRODUCCION_ENGORDE' AS tipo, fecha_registro, peso_kg AS valor, ganancia_diaria, condicion_corporal
+        FROM produccion_engorde
+        WHERE bovino_id = ? AND fecha_registro BETWEEN ? AND ?
+        ORDER BY fecha_registro""",
+}
+
+def _num(valor) -> Optional[float]:
+    return float(valor) if isinstance(valor, Decimal) else valor
+
+def _fecha(valor) -> Optional[str]:
+    return valor.isoformat() if isinstance(valor, date) else valor
+
+def _instante(valor) -> Optional[datetime]:
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    return valor if valor.tzinfo else valor.replace(tzinfo=timezone.utc)
+
+def _timestamp(valor) -> Optional[str]:
+    """TIMESTAMP literal in UTC, accepted by both MySQL and SQLite"""
+    if valor is None:
+        return None
+    if valor.tzinfo:
+        valor = valor.astimezone(timezone.utc)
+    return valor.strftime("%Y-%m-%d %H:%M:%S")
+
+def _perimetro_geojson(perimetro: Optional[List[Dict]]) -> Optional[str]:
+    if not perimetro:
+        return None
+    anillo = [[p["lng"], p["lat"]] for p in perimetro]
+    if anillo[0] != anillo[-1]:
+        anillo.append(anillo[0])
+    return json.dumps({"type": "Polygon", "coordinates": [anillo]})
+
+def _perimetro(geojson) -> Optional[List[Dict]]:
+    if not geojson:
+        return None
+    if isinstance(geojson, str):
+        geojson = json.loads(geojson)
+    return [{"lat": lat, "lng": lng} for lng, lat in geojson["coordinates"][0][:-1]]
+
+def _posicion(lat, lng) -> Optional[Dict]:
+    return {"lat": _num(lat), "lng": _num(lng)} if lat is not None and lng is not None else None
+
+class MySQLDriver:
+    """aiomysql pool; parameters are bound by the driver, never formatted into the SQL"""
+    dialect = "mysql"
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @classmethod
+    async def open(cls, url: str, minsize: int, maxsize: int) -> "MySQLDriver":
+        import aiomysql
+        partes = urlparse(url)
+        pool = await aiomysql.create_pool(
+            host=partes.hostname or "localhost", port=partes.port or 3306,
+            user=unquote(partes.username or ""), password=unquote(partes.password or ""),
+            db=partes.path.lstrip("/") or "manea_professional",
+            charset="utf8mb4", autocommit=True, minsize=minsize, maxsize=maxsize
+        )
+        return cls(pool)
+
+    def prepare(self, sql: str) -> str:
+        return sql.replace("?", "%s")
+
+    async def fetch(self, sql: str, params: Sequence = (), conjunto: int = 0) -> List[Dict]:
+        """Rows of the `conjunto`-th result set; CALL results are drained so the connection can be reused"""
+        import aiomysql
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(sql, params)
+                for _ in range(conjunto):
+                    await cur.nextset()
+                filas = await cur.fetchall()
+                while await cur.nextset():
+                    pass
+        return list(filas)
+
+    async def execute_many(self, sql: str, filas: List[Sequence]):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(sql, filas)
+
+    async def close(self):
+        self.pool.close()
+        await self.pool.wait_closed()
+
+class SQLiteDriver:
+    """A fixed set of aiosqlite connections handed out through a queue; sqlite3 caches each prepared statement per connection"""
+    dialect = "sqlite"
+
+    def __init__(self, conexiones: List):
+        self.conexiones = conexiones
+        self.libres: asyncio.Queue = asyncio.Queue()
+        for conn in conexiones:
+            self.libres.put_nowait(conn)
+
+    @classmethod
+    async def open(cls, url: str, minsize: int, maxsize: int) -> "SQLiteDriver":
+        import aiosqlite
+        # sqlite:///relativo.db or sqlite:////ruta/absoluta.db; an in-memory database cannot be shared
+        ruta = url[len("sqlite:///"):] if url.startswith("sqlite:///") else ":memory:"
+        conexiones = []
+        for _ in range(1 if ruta == ":memory:" else max(1, maxsize)):
+            conn = await aiosqlite.connect(ruta, isolation_level=None, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA busy_timeout=5000")
+            conexiones.append(conn)
+        return cls(conexiones)
+
+    def prepare(self, sql: str) -> str:
+        return sql
+
+    @asynccontextmanager
+    async def acquire(self):
+        conn = await self.libres.get()
+        try:
+            yield conn
+        finally:
+            self.libres.put_nowait(conn)
+
+    async def fetch(self, sql: str, params: Sequence = (), conjunto: int = 0) -> List[Dict]:
+        async with self.acquire() as conn:
+            async with conn.execute(sql, params) as cur:
+                return [dict(fila) for fila in await cur.fetchall()]
+
+    async def execute_many(self, sql: str, filas: List[Sequence]):
+        async with self.acquire() as conn:
+            await conn.execute("BEGIN")
+            try:
+                await conn.executemany(sql, filas)
+            except BaseException:
+                await conn.execute("ROLLBACK")
+                raise
+            await conn.execute("COMMIT")
+
+    async def executescript(self, script: str):
+        async with self.acquire() as conn:
+            await conn.executescript(script)
+
+    async def close(self):
+        for conn in self.conexiones:
+            await conn.close()
+
+class SQLRepository(HerdRepository):
+    def __init__(self, driver):
+        self.driver = driver
+        self.backend = driver.dialect
+        self.sentencias: Dict[str, str] = {}
+
+    def _sql(self, nombre: str) -> str:
+        sql = self.sentencias.get(nombre)
+        if sql is None:
+            sql = SENTENCIAS.get(f"{self.backend}:{nombre}") or SENTENCIAS[nombre]
+            sql = self.sentencias[nombre] = self.driver.prepare(sql)
+        return sql
+
+    async def _uno(self, nombre: str, *params) -> Optional[Dict]:
+        filas = await self.driver.fetch(self._sql(nombre), params)
+        return filas[0] if filas else None
+
+    async def get_finca(self, finca_id: str) -> Optional[Dict]:
+        fila = await self._uno("finca", finca_id)
+        if fila is None:
+            return None
+        return {
+            "id": fila["id"],
+            "nombre": fila["nombre"],
+            "codigo_pais": fila["codigo_pais"],
+            "ubicacion": _posicion(fila["latitud"], fila["longitud"]),
+            "perimetro": _perimetro(fila["perimetro_geojson"]),
+            "area_ha": _num(fila["area_hectareas"]),
+            "direccion": fila["direccion"],
+            "telefono": fila["telefono"],
+            "creado_en": _instante(fila["created_at"]),
+        }
+
+    @staticmethod
+    def _bovino(fila: Dict) -> Dict:
+        return {
+            **{k: fila[k] for k in ("id", "finca_id", "caravana", "arete_oficial", "nombre", "sexo", "raza",
+                                    "tipo_ganado", "estado_ganado", "estado_venta", "foto_url", "qr_url",
+                                    "contacto_nombre", "contacto_telefono", "padre_id", "madre_id", "observaciones")},
+            "fecha_nacimiento": _fecha(fila["fecha_nacimiento"]),
+            "peso_kg": _num(fila["peso_kg"]),
+            "precio": _num(fila["precio"]),
+            "ultima_posicion": _posicion(fila["latitud"], fila["longitud"]),
+            "ultima_posicion_capturada_en": _instante(fila["ultima_ubicacion_fecha"]),
+            "creado_en": _instante(fila["created_at"]),
+        }
+
+    async def get_bovino(self, bovino_id: str) -> Optional[Dict]:
+        fila = await self._uno("bovino", bovino_id)
+        return self._bovino(fila) if fila else None
+
+    async def list_bovinos(self, finca_id: Optional[str] = None, tipo_ganado: Optional[str] = None,
+                           limit: int = 100, despues_de: Optional[str] = None) -> List[Dict]:
+        condiciones, params = [], []
+        for condicion, valor in (("b.finca_id = ?", finca_id), ("tg.codigo = ?", tipo_ganado), ("b.id > ?", despues_de)):
+            if valor:
+                condiciones.append(condicion)
+                params.append(valor)
+        nombre = "bovinos:" + ",".join(condiciones)
+        if nombre not in self.sentencias:
+            where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+            self.sentencias[nombre] = self.driver.prepare(f"{BOVINO_SELECT}{where} ORDER BY b.id LIMIT ?")
+        filas = await self.driver.fetch(self.sentencias[nombre], (*params, limit))
+        return [self._bovino(fila) for fila in filas]
+
+    async def insert_fincas(self, fincas: List[Dict]):
+        await self.driver.execute_many(self._sql("insertar_finca"), [
+            (f["id"], f["nombre"], f.get("codigo_pais", "CR"), f.get("direccion"), f.get("telefono"),
+             f.get("area_ha"), (f.get("ubicacion") or {}).get("lat"), (f.get("ubicacion") or {}).get("lng"),
+             _perimetro_geojson(f.get("perimetro")), _timestamp(f.get("creado_en")))
+            for f in fincas
+        ])
+
+    async def insert_bovinos(self, bovinos: List[Dict]):
+        def fila(b: Dict):
+            posicion = b.get("ultima_posicion") or {}
+            return (
+                b["id"], b["finca_id"], b["caravana"], b.get("arete_oficial"), b.get("nombre"),
+                b.get("sexo", "H"), b.get("raza"), b.get("fecha_nacimiento"), b.get("peso_kg"),
+                CATALOGOS["tipo_ganado"][b["tipo_ganado"]],
+                CATALOGOS["estado_ganado"][b.get("estado_ganado", "activo")],
+                CATALOGOS["estado_venta"][b.get("estado_venta", "disponible")],
+                b.get("precio"), posicion.get("lat"), posicion.get("lng"), b.get("foto_url"), b.get("qr_url"),
+                b.get("contacto_nombre"), b.get("contacto_telefono"), b.get("padre_id"), b.get("madre_id"),
+                b.get("observaciones"), _timestamp(b.get("creado_en")),
+            )
+        await self.driver.execute_many(self._sql("insertar_bovino"), [fila(b) for b in bovinos])
+
+    async def insert_produccion_leche(self, registros: List[Dict]):
+        await self.driver.execute_many(self._sql("insertar_leche"), [
+            (r["id"], r["bovino_id"], r["fecha_registro"], r["leche_litros"], r.get("grasa_pct"),
+             r.get("proteina_pct"), r.get("observaciones"), _timestamp(r.get("creado_en")))
+            for r in registros
+        ])
+
+    async def reporte_produccion(self, bovino_id: str, desde: str, hasta: str,
+                                 series: Sequence[str] = SERIES) -> Dict[str, List[Dict]]:
+        params = (bovino_id, desde, hasta)
+        if self.backend == "mysql":
+            # The procedure returns milk first and weight second
+            conjuntos = await asyncio.gather(*[
+                self.driver.fetch(self._sql("reporte_produccion"), params, conjunto=SERIES.index(nombre))
+                for nombre in series
+            ])
+        else:
+            conjuntos = await asyncio.gather(*[
+                self.driver.fetch(self._sql(f"reporte_{nombre}"), params) for nombre in series
+            ])
+
+        def punto(nombre: str, fila: Dict) -> Dict:
+            p = {"fecha_registro": _fecha(fila["fecha_registro"]), "valor": _num(fila["valor"])}
+            if nombre == "leche":
+                p.update(grasa_pct=_num(fila["grasa_porcentaje"]), proteina_pct=_num(fila["proteina_porcentaje"]))
+            return p
+
+        return {nombre: [punto(nombre, f) for f in filas] for nombre, filas in zip(series, conjuntos)}
+
+    async def dashboard_stats(self, finca_id: Optional[str], dias: int) -> Dict:
+        # sp_dashboard_stats covers the last 30 days; the SQLite copy takes the window as a parameter
+        params = (finca_id,) if self.backend == "mysql" else (
+            finca_id, (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d"))
+        totales, conteos = await asyncio.gather(
+            self._uno("dashboard", *params),
+            self.driver.fetch(self._sql("conteos_dashboard"), (finca_id,)),
+        )
+        por_tipo, por_venta = {}, {}
+        for c in conteos:
+            por_tipo[c["tipo"]] = por_tipo.get(c["tipo"], 0) + c["n"]
+            por_venta[c["venta"]] = por_venta.get(c["venta"], 0) + c["n"]
+        return {
+            "total_bovinos": int(totales["total_bovinos"]),
+            "total_fincas": int(totales["total_fincas"]),
+            "alertas_activas": int(totales["alertas_activas"]),
+            "bovinos_por_tipo": _conteos(por_tipo),
+            "bovinos_por_venta": _conteos(por_venta),
+            "total_litros_mes": round(float(totales["litros_mes_actual"]), 2),
+        }
+
+    async def produccion_mensual(self, finca_ids: Optional[List[str]], desde: Optional[str],
+                                 hasta: Optional[str]) -> List[Dict]:
+        condiciones, params = [], []
+        if finca_ids:
+            condiciones.append(f"finca_id IN ({', '.join('?' * len(finca_ids))})")
+            params.extend(finca_ids)
+        for condicion, valor in (("anio * 100 + mes >= ?", desde), ("anio * 100 + mes <= ?", hasta)):
+            if valor:
+                condiciones.append(condicion)
+                params.append(int(valor.replace("-", "")))
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        sql = self.driver.prepare(f"SELECT * FROM v_produccion_lactea_mensual{where} ORDER BY finca_id, anio, mes")
+        redondear = lambda v: round(float(v), 2) if v is not None else None
+        return [
+            {
+                "finca_id": f["finca_id"],
+                "finca_nombre": f["finca_nombre"],
+                "anio": int(f["anio"]),
+                "mes": int(f["mes"]),
+                "vacas_productoras": int(f["vacas_productoras"]),
+                "litros_totales": redondear(f["litros_totales"]),
+                "litros_promedio_diario": redondear(f["litros_promedio_diario"]),
+                "grasa_promedio": redondear(f["grasa_promedio"]),
+                "proteina_promedio": redondear(f["proteina_promedio"]),
+            }
+            for f in await self.driver.fetch(sql, params)
+        ]
+
+    async def ensure_schema(self):
+        """Create the SQLite stand-in schema; MySQL databases are set up from mysql_schema.sql"""
+        if self.backend == "sqlite":
+            await self.driver.executescript(SQLITE_SCHEMA)
+
+    async def close(self):
+        await self.driver.close()
+
+async def open_repository(backend: str, url: Optional[str] = None, pool_min: int = 1, pool_max: int = 10,
+                          **mongo) -> HerdRepository:
+    """Repository for a backend name: "mongo" (needs the MongoRepository arguments), "mysql" or "sqlite" """
+    if backend == "mongo":
+        return MongoRepository(**mongo)
+    if backend == "mysql":
+        return SQLRepository(await MySQLDriver.open(url or "mysql://root@localhost/manea_professional", pool_min, pool_max))
+    if backend == "sqlite":
+        repo = SQLRepository(await SQLiteDriver.open(url or "sqlite:///manea.db", pool_min, pool_max))
+        await repo.ensure_schema()
+        return repo
+    raise ValueError(f"Backend desconocido: {backend}")
+
+# Tables, views and triggers of mysql_schema.sql that the repository touches,
+# in SQLite syntax. Catalog rows keep the ids of the MySQL seed data.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tipos_ganado (id INTEGER PRIMARY KEY, codigo TEXT NOT NULL UNIQUE, nombre TEXT NOT NULL);
+INSERT OR IGNORE INTO tipos_ganado (id, codigo, nombre) VALUES
+  (1, 'leche', 'Producción Láctea'), (2, 'carne', 'Producción de Carne'), (3, 'dual', 'Doble Propósito');
+
+CREATE TABLE IF NOT EXISTS estados_ganado (id INTEGER PRIMARY KEY, codigo TEXT NOT NULL UNIQUE, nombre TEXT NOT NULL);
+INSERT OR IGNORE INTO estados_ganado (id, codigo, nombre) VALUES
+  (1, 'activo', 'Activo'), (2, 'vendido', 'Vendido'), (3, 'reservado', 'Reservado'),
+  (4, 'muerto', 'Muerto'), (5, 'retirado', 'Retirado');
+
+CREATE TABLE IF NOT EXISTS estados_venta (id INTEGER PRIMARY KEY, codigo TEXT NOT NULL UNIQUE, nombre TEXT NOT NULL);
+INSERT OR IGNORE INTO estados_venta (id, codigo, nombre) VALUES
+  (1, 'disponible', 'Disponible'), (2, 'reservado', 'Reservado'), (3, 'vendido', 'Vendido');
+
+CREATE TABLE IF NOT EXISTS tipos_alerta (id INTEGER PRIMARY KEY, codigo TEXT NOT NULL UNIQUE, nombre TEXT NOT NULL);
+INSERT OR IGNORE INTO tipos_alerta (id, codigo, nombre) VALUES
+  (1, 'vencimiento_medico', 'Vencimiento Médico'), (2, 'chequeo_gestacion', 'Chequeo de Gestación'),
+  (3, 'control_peso', 'Control de Peso'), (4, 'falta_leche', 'Registro de Leche Faltante'),
+  (5, 'produccion_baja', 'Producción Baja');
+
+CREATE TABLE IF NOT EXISTS razas (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL UNIQUE);
+INSERT OR IGNORE INTO razas (nombre) VALUES
+  ('Holstein'), ('Jersey'), ('Brahman'), ('Angus'), ('Simmental'), ('Pardo Suizo');
+
+CREATE TABLE IF NOT EXISTS fincas (
+  id TEXT PRIMARY KEY,
+  nombre TEXT NOT NULL,
+  codigo_pais TEXT DEFAULT 'CR',
+  direccion TEXT,
+  telefono TEXT,
+  area_hectareas REAL,
+  latitud REAL,
+  longitud REAL,
+  perimetro_geojson TEXT,
+  activa BOOLEAN DEFAULT TRUE,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS bovinos (
+  id TEXT PRIMARY KEY,
+  finca_id TEXT NOT NULL REFERENCES fincas(id) ON DELETE CASCADE,
+  caravana TEXT NOT NULL,
+  arete_oficial TEXT UNIQUE,
+  nombre TEXT,
+  sexo TEXT NOT NULL DEFAULT 'H' CHECK (sexo IN ('H', 'M')),
+  raza_id INTEGER REFERENCES razas(id),
+  fecha_nacimiento DATE,
+  peso_kg REAL,
+  tipo_ganado_id INTEGER NOT NULL REFERENCES tipos_ganado(id),
+  estado_ganado_id INTEGER NOT NULL DEFAULT 1 REFERENCES estados_ganado(id),
+  estado_venta_id INTEGER NOT NULL DEFAULT 1 REFERENCES estados_venta(id),
+  latitud REAL,
+  longitud REAL,
+  ultima_ubicacion_fecha TIMESTAMP,
+  precio REAL,
+  contacto_nombre TEXT,
+  contacto_telefono TEXT,
+  padre_id TEXT,
+  madre_id TEXT,
+  qr_url TEXT,
+  foto_url TEXT,
+  observaciones TEXT,
+  activo BOOLEAN DEFAULT TRUE,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE (finca_id, caravana)
+);
+CREATE INDEX IF NOT EXISTS idx_bovinos_finca_tipo_estado ON bovinos(finca_id, tipo_ganado_id, estado_ganado_id);
+
+CREATE TABLE IF NOT EXISTS produccion_leche (
+  id TEXT PRIMARY KEY,
+  bovino_id TEXT NOT NULL REFERENCES bovinos(id) ON DELETE CASCADE,
+  fecha_registro DATE NOT NULL,
+  litros REAL NOT NULL CHECK (litros >= 0),
+  grasa_porcentaje REAL CHECK (grasa_porcentaje >= 0 AND grasa_porcentaje <= 100),
+  proteina_porcentaje REAL CHECK (proteina_porcentaje >= 0 AND proteina_porcentaje <= 100),
+  observaciones TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE (bovino_id, fecha_registro)
+);
+CREATE INDEX IF NOT EXISTS idx_produccion_leche_fecha ON produccion_leche(fecha_registro);
+
+CREATE TABLE IF NOT EXISTS produccion_engorde (
+  id TEXT PRIMARY KEY,
+  bovino_id TEXT NOT NULL REFERENCES bovinos(id) ON DELETE CASCADE,
+  fecha_registro DATE NOT NULL,
+  peso_kg REAL NOT NULL CHECK (peso_kg > 0),
+  ganancia_diaria REAL,
+  condicion_corporal INTEGER CHECK (condicion_corporal BETWEEN 1 AND 5),
+  observaciones TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_produccion_engorde_bovino_fecha ON produccion_engorde(bovino_id, fecha_registro);
+
+CREATE TABLE IF NOT EXISTS alertas (
+  id TEXT PRIMARY KEY,
+  bovino_id TEXT NOT NULL REFERENCES bovinos(id) ON DELETE CASCADE,
+  tipo_alerta_id INTEGER NOT NULL REFERENCES tipos_alerta(id),
+  titulo TEXT NOT NULL,
+  mensaje TEXT,
+  severidad INTEGER DEFAULT 2,
+  fecha_vencimiento DATE,
+  activa BOOLEAN DEFAULT TRUE,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_alertas_bovino_activa ON alertas(bovino_id, activa);
+
+CREATE VIEW IF NOT EXISTS v_produccion_lactea_mensual AS
+SELECT
+  b.finca_id,
+  f.nombre AS finca_nombre,
+  CAST(strftime('%Y', pl.fecha_registro) AS INTEGER) AS anio,
+  CAST(strftime('%m', pl.fecha_registro) AS INTEGER) AS mes,
+  COUNT(DISTINCT b.id) AS vacas_productoras,
+  SUM(pl.litros) AS litros_totales,
+  AVG(pl.litros) AS litros_promedio_diario,
+  AVG(pl.grasa_porcentaje) AS grasa_promedio,
+  AVG(pl.proteina_porcentaje) AS proteina_promedio
+FROM produccion_leche pl
+JOIN bovinos b ON pl.bovino_id = b.id
+JOIN fincas f ON b.finca_id = f.id
+WHERE b.activo = TRUE
+GROUP BY b.finca_id, f.nombre, anio, mes;
+
+CREATE TRIGGER IF NOT EXISTS tr_actualizar_peso_bovino
+AFTER INSERT ON produccion_engorde
+FOR EACH ROW
+BEGIN
+  UPDATE bovinos SET peso_kg = NEW.peso_kg, updated_at = CURRENT_TIMESTAMP WHERE id = NEW.bovino_id;
+END;
+"""
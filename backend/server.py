@@ -1,14 +1,16 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response, Query, Header, UploadFile, File
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ValidationError, AfterValidator
+from typing import List, Optional, Dict, Any, Annotated
 import uuid
 from datetime import datetime, timedelta, timezone, date
 from passlib.context import CryptContext
@@ -18,16 +20,29 @@ from enum import Enum
 import qrcode
 from io import BytesIO
 import base64
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
 import json
+import csv
+import io
+import asyncio
+import sys
+import hashlib
+import time
+import socket
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from charts import render_series_chart
+import numpy as np
+from analytics import dias, herd_summary
+from geofence import evaluar, ocupacion, preparar
+try:
+    import orjson
+except ImportError:  # the stdlib encoder still works, only slower
+    orjson = None
+from pdf_reports import render_table_pdf
+from repositories import HerdRepository, MongoRepository
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -36,16 +51,105 @@ load_dotenv(ROOT_DIR / '.env')
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client["manea_db"]
+# Set at startup; routes moved off direct Motor calls read through it
+repo: Optional[HerdRepository] = None
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Raising BCRYPT_ROUNDS makes older hashes "need update"; they are rehashed on login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", "2"))
+HASH_MAX_QUEUE = int(os.environ.get("HASH_MAX_QUEUE", "64"))
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS
+)
 SECRET_KEY = "your-secret-key-here-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "1024"))
+# Build the user from signed token claims (id, rol) instead of reading Mongo
+AUTH_TRUST_TOKEN_CLAIMS = os.environ.get("AUTH_TRUST_TOKEN_CLAIMS") == "1"
 
 security = HTTPBearer()
 
-app = FastAPI(title="Manea - Sistema Integral de Gestión Ganadera")
+# QR codes encode the public scan URL of each bovino
+QR_BASE_URL = os.environ.get("QR_BASE_URL", "https://maneadb.preview.emergentagent.com/qr")
+QR_CACHE_SIZE = int(os.environ.get("QR_CACHE_SIZE", "2048"))
+QR_RENDER_WORKERS = int(os.environ.get("QR_RENDER_WORKERS", "2"))
+
+# Public scan page: cached per bovino, with per-client admission control
+SCAN_CACHE_SIZE = int(os.environ.get("SCAN_CACHE_SIZE", "4096"))
+SCAN_CACHE_TTL = float(os.environ.get("SCAN_CACHE_TTL", "300"))
+SCAN_RATE_PER_IP = float(os.environ.get("SCAN_RATE_PER_IP", "2"))
+SCAN_BURST_PER_IP = int(os.environ.get("SCAN_BURST_PER_IP", "20"))
+
+# Background jobs (cascading deletes, maintenance) drained by in-process workers
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))
+JOB_BATCH_SIZE = int(os.environ.get("JOB_BATCH_SIZE", "1000"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+
+# Store milk and weight series in MongoDB time-series collections (needs MongoDB 7.0+)
+PRODUCCION_TIMESERIES = os.environ.get("PRODUCCION_TIMESERIES") == "1"
+
+# Report charts render in worker processes and are cached by the data they show
+CHART_CACHE_SIZE = int(os.environ.get("CHART_CACHE_SIZE", "256"))
+CHART_RENDER_WORKERS = int(os.environ.get("CHART_RENDER_WORKERS", "2"))
+
+# Herd analytics are cached per finca and stats version, so any write recomputes them
+ANALYTICS_CACHE_SIZE = int(os.environ.get("ANALYTICS_CACHE_SIZE", "128"))
+
+# PDF reports: rows are spooled to disk and drawn in worker processes. Larger
+# reports than PDF_SYNC_MAX_FILAS rows only run as background jobs.
+PDF_REPORT_DIR = Path(os.environ.get("PDF_REPORT_DIR", Path(tempfile.gettempdir()) / "manea-reportes"))
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", "1"))
+PDF_SYNC_MAX_FILAS = int(os.environ.get("PDF_SYNC_MAX_FILAS", "2000"))
+PDF_RETENCION_HORAS = float(os.environ.get("PDF_RETENCION_HORAS", "24"))
+
+# GPS fixes are buffered per worker and flushed in bulk; their history is kept
+# in one document per animal and day for GPS_RETENCION_DIAS
+GPS_FLUSH_INTERVAL = float(os.environ.get("GPS_FLUSH_INTERVAL", "5"))
+GPS_BUFFER_MAX = int(os.environ.get("GPS_BUFFER_MAX", "50000"))
+GPS_RETENCION_DIAS = int(os.environ.get("GPS_RETENCION_DIAS", "180"))
+# Prepared farm and paddock polygons per finca; occupancy is recounted at most
+# once per GEOCERCA_CAPACIDAD_INTERVALO seconds per finca. Geofence alerts this
+# worker raised today are remembered for up to GEOCERCA_ALERTADAS_SIZE animals.
+GEOCERCA_CACHE_SIZE = int(os.environ.get("GEOCERCA_CACHE_SIZE", "1024"))
+GEOCERCA_CACHE_TTL = float(os.environ.get("GEOCERCA_CACHE_TTL", "60"))
+GEOCERCA_CAPACIDAD_INTERVALO = float(os.environ.get("GEOCERCA_CAPACIDAD_INTERVALO", "60"))
+GEOCERCA_ALERTADAS_SIZE = int(os.environ.get("GEOCERCA_ALERTADAS_SIZE", "100000"))
+
+# Time-based alert rules run in one worker, chosen by a lock in Mongo; set
+# ALERT_SCHEDULER=0 to leave them to `python server.py run-alert-rules`
+ALERT_SCHEDULER = os.environ.get("ALERT_SCHEDULER", "1") == "1"
+ALERT_SCHEDULER_TICK = float(os.environ.get("ALERT_SCHEDULER_TICK", "30"))
+
+# Live updates over Server-Sent Events, tailed from one change stream per worker.
+# Change streams need a replica set; a single node started with --replSet and
+# rs.initiate() is enough. EVENTOS=0 turns the feed off.
+EVENTOS = os.environ.get("EVENTOS", "1") == "1"
+EVENTOS_BUFFER = int(os.environ.get("EVENTOS_BUFFER", "4096"))
+EVENTOS_KEEPALIVE = float(os.environ.get("EVENTOS_KEEPALIVE", "15"))
+
+# Serve list routes straight from the projected documents, skipping the model
+# round trip and response-model validation (set to 0 to validate them again)
+FAST_LIST_RESPONSES = os.environ.get("FAST_LIST_RESPONSES", "1") == "1"
+
+def dumps_json(content: Any) -> bytes:
+    if orjson is None:
+        return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson when it is installed"""
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+app = FastAPI(title="Manea - Sistema Integral de Gestión Ganadera", default_response_class=FastJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Enums
@@ -82,12 +186,78 @@ class TipoAlerta(str, Enum):
     CONTROL_PESO = "control_peso"
     FALTA_LECHE = "falta_leche"
     PRODUCCION_BAJA = "produccion_baja"
+    GEOCERCA = "geocerca"
+    CAPACIDAD_POTRERO = "capacidad_potrero"
 
 class TipoUsuario(str, Enum):
     GANADERO = "ganadero"
     VETERINARIO = "veterinario"
     ADMINISTRADOR = "administrador"
 
+# Locations
+# The API speaks {"lat", "lng"} points. Documents also carry a GeoJSON copy of
+# each location in a *_geo field (longitude first, rings closed) so 2dsphere
+# indexes can answer spatial queries; geo_doc() fills them on every write.
+GEO_CAMPOS = {
+    "fincas": {"ubicacion": "ubicacion_geo", "perimetro": "perimetro_geo"},
+    "potreros": {"poligono": "poligono_geo"},
+    "bovinos": {"ultima_posicion": "ultima_posicion_geo"},
+}
+
+def _coordenadas(punto) -> List[float]:
+    try:
+        lat, lng = float(punto["lat"]), float(punto["lng"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Use puntos {"lat": número, "lng": número}')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("Coordenadas fuera de rango")
+    return [lng, lat]
+
+def geo_punto(punto: Optional[Dict]) -> Optional[Dict]:
+    return {"type": "Point", "coordinates": _coordenadas(punto)} if punto else None
+
+def geo_poligono(puntos: Optional[List[Dict]]) -> Optional[Dict]:
+    if not puntos:
+        return None
+    anillo = [_coordenadas(p) for p in puntos]
+    if anillo[0] != anillo[-1]:
+        anillo.append(anillo[0])
+    if len(anillo) < 4:
+        raise ValueError("Un polígono necesita al menos 3 vértices")
+    return {"type": "Polygon", "coordinates": [anillo]}
+
+def validar_posicion(value: Dict) -> Dict:
+    geo_punto(value)
+    return value
+
+def validar_poligono(value: List[Dict]) -> List[Dict]:
+    geo_poligono(value)
+    return value
+
+Posicion = Annotated[Dict, AfterValidator(validar_posicion)]
+Poligono = Annotated[List[Dict], AfterValidator(validar_poligono)]
+
+def geo_doc(coleccion: str, doc: Dict) -> Dict:
+    """`doc` with the GeoJSON copy of every location field it sets"""
+    for campo, destino in GEO_CAMPOS[coleccion].items():
+        if campo in doc:
+            valor = doc[campo]
+            doc[destino] = geo_poligono(valor) if isinstance(valor, list) else geo_punto(valor)
+    return doc
+
+# Mongo refuses to index shapes it considers invalid, such as self-intersecting rings
+GEO_KEYS_ERROR = 16755
+
+@contextmanager
+def geometria_valida():
+    """Turn a write rejected by a 2dsphere index into a 422"""
+    try:
+        yield
+    except pymongo.errors.WriteError as e:
+        if e.code != GEO_KEYS_ERROR:
+            raise
+        raise HTTPException(status_code=422, detail="Geometría inválida: el polígono no puede cruzarse a sí mismo")
+
 # Models
 class Usuario(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -107,6 +277,12 @@ class UsuarioCreate(BaseModel):
     telefono: Optional[str] = None
     especialidad: Optional[str] = None
 
+class UsuarioUpdate(BaseModel):
+    nombre_completo: Optional[str] = None
+    rol: Optional[TipoUsuario] = None
+    telefono: Optional[str] = None
+    especialidad: Optional[str] = None
+
 class UsuarioLogin(BaseModel):
     correo: str
     clave: str
@@ -129,8 +305,8 @@ class Finca(BaseModel):
 class FincaCreate(BaseModel):
     nombre: str
     codigo_pais: str = "CR"
-    ubicacion: Optional[Dict] = None
-    perimetro: Optional[List[Dict]] = None
+    ubicacion: Optional[Posicion] = None
+    perimetro: Optional[Poligono] = None
     area_ha: Optional[float] = None
     direccion: Optional[str] = None
     telefono: Optional[str] = None
@@ -149,10 +325,10 @@ class Bovino(BaseModel):
     estado_ganado: EstadoGanado = EstadoGanado.ACTIVO
     estado_venta: EstadoVenta = EstadoVenta.DISPONIBLE
     precio: Optional[float] = None
+    potrero_id: Optional[str] = None
     ultima_posicion: Optional[Dict] = None  # {"lat": float, "lng": float}
     ultima_posicion_capturada_en: Optional[datetime] = None
     foto_url: Optional[str] = None
-    qr_clave: Optional[str] = None
     qr_url: Optional[str] = None
     contacto_nombre: Optional[str] = None
     contacto_telefono: Optional[str] = None
@@ -174,6 +350,7 @@ class BovinoCreate(BaseModel):
     estado_ganado: EstadoGanado = EstadoGanado.ACTIVO
     estado_venta: EstadoVenta = EstadoVenta.DISPONIBLE
     precio: Optional[float] = None
+    potrero_id: Optional[str] = None
     foto_url: Optional[str] = None
     contacto_nombre: Optional[str] = None
     contacto_telefono: Optional[str] = None
@@ -181,6 +358,9 @@ class BovinoCreate(BaseModel):
     madre_id: Optional[str] = None
     observaciones: Optional[str] = None
 
+class BovinoCercano(Bovino):
+    distancia_m: float
+
 class RegistroMedico(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     bovino_id: str
@@ -209,6 +389,25 @@ class RegistroMedicoCreate(BaseModel):
     costo: Optional[float] = None
     observaciones: Optional[str] = None
 
+def validar_fecha(value: str) -> str:
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("Use el formato AAAA-MM-DD")
+    return value
+
+FechaISO = Annotated[str, AfterValidator(validar_fecha)]
+
+def fecha_hoy(dias: int = 0) -> str:
+    """Today's date plus `dias` days, formatted like fecha_registro"""
+    return (datetime.now() + timedelta(days=dias)).strftime("%Y-%m-%d")
+
+def en_utc(value: datetime) -> datetime:
+    """Naive datetimes are taken as UTC"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+InstanteUTC = Annotated[datetime, AfterValidator(en_utc)]
+
 class ProduccionLeche(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     bovino_id: str
@@ -222,7 +421,7 @@ class ProduccionLeche(BaseModel):
 
 class ProduccionLecheCreate(BaseModel):
     bovino_id: str
-    fecha_registro: str
+    fecha_registro: FechaISO
     leche_litros: float
     grasa_pct: Optional[float] = None
     proteina_pct: Optional[float] = None
@@ -241,7 +440,7 @@ class ProduccionEngorde(BaseModel):
 
 class ProduccionEngordeCreate(BaseModel):
     bovino_id: str
-    fecha_registro: str
+    fecha_registro: FechaISO
     peso_kg: float
     ganancia_kg: Optional[float] = None
     alimentacion: Optional[str] = None
@@ -249,7 +448,9 @@ class ProduccionEngordeCreate(BaseModel):
 
 class Alerta(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    bovino_id: str
+    bovino_id: Optional[str] = None  # None for alerts about a potrero
+    finca_id: Optional[str] = None
+    potrero_id: Optional[str] = None
     tipo_alerta: TipoAlerta
     severidad: int = 2  # 1=baja, 2=media, 3=alta
     titulo: str
@@ -258,6 +459,8 @@ class Alerta(BaseModel):
     activa: bool = True
     creado_por: Optional[str] = None
     creado_en: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    ocurrencias: int = 1  # times the alert was raised within its dedupe window
+    ultima_ocurrencia: Optional[datetime] = None
     resuelto_en: Optional[datetime] = None
     resuelto_por: Optional[str] = None
 
@@ -284,11 +487,478 @@ class PotreroCreate(BaseModel):
     finca_id: str
     nombre: str
     area_ha: Optional[float] = None
-    poligono: List[Dict]
+    poligono: Poligono
     capacidad_bovinos: Optional[int] = None
     tipo_pasto: Optional[str] = None
     observaciones: Optional[str] = None
 
+GPS_LOTE_MAX = 10000
+
+class PosicionGPS(BaseModel):
+    bovino_id: str
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+    capturada_en: InstanteUTC
+
+class LotePosiciones(BaseModel):
+    posiciones: List[PosicionGPS] = Field(max_length=GPS_LOTE_MAX)
+
+# Production series storage
+# In time-series mode the series live in *_ts collections with bovino_id as the
+# metaField and "fecha" (a real date) as the timeField. Documents keep
+# fecha_registro, so models and responses are unchanged; range queries and sorts
+# use CAMPO_FECHA. Time-series collections cannot have unique indexes, so
+# duplicates per (bovino_id, fecha) are only caught by the check before insert.
+COLECCION_LECHE = "produccion_leche_ts" if PRODUCCION_TIMESERIES else "produccion_leche"
+COLECCION_ENGORDE = "produccion_engorde_ts" if PRODUCCION_TIMESERIES else "produccion_engorde"
+CAMPO_FECHA = "fecha" if PRODUCCION_TIMESERIES else "fecha_registro"
+TIMESERIES_OPCIONES = {"timeField": "fecha", "metaField": "bovino_id", "granularity": "hours"}
+
+def fecha_serie(fecha_registro: str):
+    """Value of CAMPO_FECHA for a "%Y-%m-%d" date"""
+    return datetime.strptime(fecha_registro, "%Y-%m-%d") if PRODUCCION_TIMESERIES else fecha_registro
+
+def serie_doc(produccion: BaseModel) -> Dict:
+    doc = produccion.dict()
+    if PRODUCCION_TIMESERIES:
+        doc["fecha"] = fecha_serie(doc["fecha_registro"])
+    return doc
+
+def _serie_indexes(coleccion: str, unica_por_fecha: bool, timeseries: bool = PRODUCCION_TIMESERIES) -> List[pymongo.IndexModel]:
+    if timeseries:
+        return [
+            pymongo.IndexModel([("id", pymongo.ASCENDING)], name=f"idx_{coleccion}_id"),
+            pymongo.IndexModel(
+                [("bovino_id", pymongo.ASCENDING), ("fecha", pymongo.DESCENDING), ("id", pymongo.DESCENDING)],
+                name=f"idx_{coleccion}_bovino_fecha"
+            ),
+            pymongo.IndexModel([("fecha", pymongo.DESCENDING), ("id", pymongo.DESCENDING)], name=f"idx_{coleccion}_fecha"),
+        ]
+    por_bovino = [("bovino_id", pymongo.ASCENDING), ("fecha_registro", pymongo.DESCENDING)]
+    if unica_por_fecha:
+        por_bovino_index = pymongo.IndexModel(por_bovino, name=f"uq_{coleccion}_bovino_fecha", unique=True)
+    else:
+        por_bovino_index = pymongo.IndexModel(
+            por_bovino + [("id", pymongo.DESCENDING)], name=f"idx_{coleccion}_bovino_fecha"
+        )
+    return [
+        pymongo.IndexModel([("id", pymongo.ASCENDING)], name=f"uq_{coleccion}_id", unique=True),
+        por_bovino_index,
+        pymongo.IndexModel(
+            [("fecha_registro", pymongo.DESCENDING), ("id", pymongo.DESCENDING)], name=f"idx_{coleccion}_fecha"
+        ),
+    ]
+
+# Database indexes
+# Every access path the routes use is declared here so it can be created at
+# startup and checked with explain(). Mirrors the composite indexes at the end
+# of mysql_schema.sql.
+INDEXES = {
+    "usuarios": [
+        pymongo.IndexModel([("id", pymongo.ASCENDING)], name="uq_usuarios_id", unique=True),
+        pymongo.IndexModel([("correo", pymongo.ASCENDING)], name="uq_usuarios_correo", unique=True),
+        pymongo.IndexModel([("rol", pymongo.ASCENDING)], name="idx_usuarios_rol"),
+    ],
+    "fincas": [
+        pymongo.IndexModel([("id", pymongo.ASCENDING)], name="uq_fincas_id", unique=True),
+    ],
+    "potreros": [
+        pymongo.IndexModel([("id", pymongo.ASCENDING)], name="uq_potreros_id", unique=True),
+        pymongo.IndexModel(
+            [("finca_id", pymongo.ASCENDING), ("id", pymongo.ASCENDING)],
+            name="idx_potreros_finca_id"
+        ),
+        pymongo.IndexModel(
+            [("poligono_geo", pymongo.GEOSPHERE), ("finca_id", pymongo.ASCENDING)],
+            name="idx_potreros_poligono_geo"
+        ),
+    ],
+    "bovinos": [
+        pymongo.IndexModel([("id", pymongo.ASCENDING)], name="uq_bovinos_id", unique=True),
+        pymongo.IndexModel(
+            [("finca_id", pymongo.ASCENDING), ("caravana", pymongo.ASCENDING)],
+            name="uq_bovinos_finca_caravana", unique=True
+        ),
+        pymongo.IndexModel(
+            [("finca_id", pymongo.ASCENDING), ("tipo_ganado", pymongo.ASCENDING), ("estado_ganado", pymongo.ASCENDING)],
+            name="idx_bovinos_finca_tipo_estado"
+        ),
+        pymongo.IndexModel(
+            [("estado_ganado", pymongo.ASCENDING), ("tipo_ganado", pymongo.ASCENDING)],
+            name="idx_bovinos_estado_tipo"
+        ),
+        pymongo.IndexModel(
+            [("finca_id", pymongo.ASCENDING), ("id", pymongo.ASCENDING)],
+            name="idx_bovinos_finca_id"
+        ),
+        pymongo.IndexModel(
+            [("tipo_ganado", pymongo.ASCENDING), ("id", pymongo.ASCENDING)],
+            name="idx_bovinos_tipo_ganado_id"
+        ),
+        pymongo.IndexModel(
+            [("estado_venta", pymongo.ASCENDING), ("id", pymongo.ASCENDING)],
+            name="idx_bovinos_estado_venta_id"
+        ),
+        pymongo.IndexModel(
+            [("estado_ganado", pymongo.ASCENDING), ("sexo", pymongo.ASCENDING),
+             ("fecha_nacimiento", pymongo.ASCENDING), ("id", pymongo.ASCENDING)],
+            name="idx_bovinos_estado_sexo_nacimiento"
+        ),
+        # Geo first so $geoNear without a farm can use it too
+        pymongo.IndexModel(
+            [("ultima_posicion_geo", pymongo.GEOSPHERE), ("finca_id", pymongo.ASCENDING)],
+            name="idx_bovinos_posicion_geo"
+        ),
+    ],
+    "registros_medicos": [
+        pymongo.IndexModel([("id", pymongo.ASCENDING)], name="uq_registros_medicos_id", unique=True),
+        pymongo.IndexModel(
+            [("bovino_id", pymongo.ASCENDING), ("fecha_evento", pymongo.DESCENDING), ("id", pymongo.DESCENDING)],
+            name="idx_registros_medicos_bovino_fecha"
+        ),
+        pymongo.IndexModel(
+            [("fecha_evento", pymongo.DESCENDING), ("id", pymongo.DESCENDING)],
+            name="idx_registros_medicos_fecha"
+        ),
+        pymongo.IndexModel(
+            [("fecha_proxima", pymongo.ASCENDING), ("id", pymongo.ASCENDING)],
+            name="idx_registros_medicos_fecha_proxima"
+        ),
+    ],
+    COLECCION_LECHE: _serie_indexes(COLECCION_LECHE, unica_por_fecha=True),
+    COLECCION_ENGORDE: _serie_indexes(COLECCION_ENGORDE, unica_por_fecha=False),
+    "alertas": [
+        pymongo.IndexModel([("id", pymongo.ASCENDING)], name="uq_alertas_id", unique=True),
+        pymongo.IndexModel(
+            [("activa", pymongo.ASCENDING), ("severidad", pymongo.DESCENDING), ("id", pymongo.DESCENDING)],
+            name="idx_alertas_activa_severidad"
+        ),
+        pymongo.IndexModel(
+            [("bovino_id", pymongo.ASCENDING), ("activa", pymongo.ASCENDING)],
+            name="idx_alertas_bovino_activa"
+        ),
+        pymongo.IndexModel(
+            [("finca_id", pymongo.ASCENDING), ("activa", pymongo.ASCENDING)],
+            name="idx_alertas_finca_activa"
+        ),
+        pymongo.IndexModel(
+            [("severidad", pymongo.DESCENDING), ("id", pymongo.DESCENDING)],
+            name="idx_alertas_severidad"
+        ),
+        # One alert per dedupe key; keys carry their window, so a resolved alert is
+        # not raised again until the next one
+        pymongo.IndexModel(
+            [("clave", pymongo.ASCENDING)], name="uq_alertas_clave", unique=True,
+            partialFilterExpression={"clave": {"$exists": True}}
+        ),
+        pymongo.IndexModel(
+            [("activa", pymongo.ASCENDING), ("fecha_vencimiento", pymongo.ASCENDING)],
+            name="idx_alertas_activa_vencimiento"
+        ),
+    ],
+    "estadisticas_produccion": [
+        pymongo.IndexModel([("bovino_id", pymongo.ASCENDING)], name="uq_estadisticas_produccion_bovino", unique=True),
+        pymongo.IndexModel(
+            [("ultima_fecha", pymongo.ASCENDING), ("bovino_id", pymongo.ASCENDING)],
+            name="idx_estadisticas_produccion_ultima_fecha"
+        ),
+    ],
+    "estadisticas_finca": [
+        pymongo.IndexModel([("finca_id", pymongo.ASCENDING)], name="uq_estadisticas_finca_finca", unique=True),
+    ],
+    "produccion_diaria_finca": [
+        pymongo.IndexModel(
+            [("finca_id", pymongo.ASCENDING), ("fecha", pymongo.ASCENDING)],
+            name="uq_produccion_diaria_finca_fecha", unique=True
+        ),
+        pymongo.IndexModel([("fecha", pymongo.ASCENDING), ("finca_id", pymongo.ASCENDING)], name="idx_produccion_diaria_fecha"),
+    ],
+    "produccion_mensual_finca": [
+        pymongo.IndexModel(
+            [("finca_id", pymongo.ASCENDING), ("mes", pymongo.ASCENDING)],
+            name="uq_produccion_mensual_finca_mes", unique=True
+        ),
+        pymongo.IndexModel([("mes", pymongo.ASCENDING), ("finca_id", pymongo.ASCENDING)], name="idx_produccion_mensual_mes"),
+    ],
+    "posiciones_historial": [
+        pymongo.IndexModel(
+            [("bovino_id", pymongo.ASCENDING), ("fecha", pymongo.ASCENDING)],
+            name="uq_posiciones_historial_bovino_fecha", unique=True
+        ),
+        # "fecha" is the start of the day, so a bucket goes once its last fix is old enough
+        pymongo.IndexModel(
+            [("fecha", pymongo.ASCENDING)], name="ttl_posiciones_historial_fecha",
+            expireAfterSeconds=(GPS_RETENCION_DIAS + 1) * 86400
+        ),
+    ],
+    "bloqueos": [
+        pymongo.IndexModel([("id", pymongo.ASCENDING)], name="uq_bloqueos_id", unique=True),
+    ],
+    "trabajos": [
+        pymongo.IndexModel([("id", pymongo.ASCENDING)], name="uq_trabajos_id", unique=True),
+        pymongo.IndexModel(
+            [("estado", pymongo.ASCENDING), ("disponible_desde", pymongo.ASCENDING)],
+            name="idx_trabajos_estado_disponible"
+        ),
+        pymongo.IndexModel(
+            [("estado", pymongo.ASCENDING), ("lease_hasta", pymongo.ASCENDING)],
+            name="idx_trabajos_estado_lease"
+        ),
+    ],
+}
+
+# Query shapes issued by the routes, checked by verify_index_coverage().
+# Values are placeholders; only the shape matters to the planner.
+GEO_EJEMPLO = geo_poligono([{"lat": 0, "lng": 0}, {"lat": 0, "lng": 1}, {"lat": 1, "lng": 1}])
+QUERY_SHAPES = [
+    {"coleccion": "usuarios", "filtro": {"correo": "x"}},
+    {"coleccion": "usuarios", "filtro": {"id": "x"}},
+    {"coleccion": "usuarios", "filtro": {"rol": "veterinario"}},
+    {"coleccion": "usuarios", "filtro": {}, "orden": [("id", 1)]},
+    {"coleccion": "fincas", "filtro": {"id": "x"}},
+    {"coleccion": "fincas", "filtro": {}, "orden": [("id", 1)]},
+    {"coleccion": "potreros", "filtro": {"finca_id": "x"}, "orden": [("id", 1)]},
+    {"coleccion": "potreros", "filtro": {}, "orden": [("id", 1)]},
+    {"coleccion": "bovinos", "filtro": {"id": "x"}},
+    {"coleccion": "bovinos", "filtro": {"finca_id": "x", "caravana": "x"}},
+    {"coleccion": "bovinos", "filtro": {}, "orden": [("id", 1)]},
+    {"coleccion": "bovinos", "filtro": {"finca_id": "x"}, "orden": [("id", 1)]},
+    {"coleccion": "bovinos", "filtro": {"tipo_ganado": "leche"}, "orden": [("id", 1)]},
+    {"coleccion": "bovinos", "filtro": {"estado_venta": "disponible"}, "orden": [("id", 1)]},
+    {"coleccion": "bovinos", "filtro": {"finca_id": "x", "tipo_ganado": "leche", "estado_venta": "disponible"},
+     "orden": [("id", 1)]},
+    {"coleccion": "bovinos", "filtro": {"estado_ganado": "activo"}},
+    {"coleccion": "bovinos", "filtro": {"estado_ganado": "activo", "sexo": "H", "fecha_nacimiento": {"$lte": "2024-01-01"},
+                                        "tipo_ganado": {"$in": ["leche", "dual"]}},
+     "orden": [("fecha_nacimiento", 1), ("id", 1)]},
+    {"coleccion": "bovinos", "filtro": {"finca_id": "x", "estado_ganado": "activo", "ultima_posicion_geo": {"$ne": None}}},
+    {"coleccion": "bovinos", "filtro": {"finca_id": "x", "ultima_posicion_geo": {"$geoWithin": {"$geometry": GEO_EJEMPLO}}},
+     "orden": [("id", 1)]},
+    {"coleccion": "bovinos", "filtro": {"finca_id": "x", "ultima_posicion_geo": {"$ne": None},
+                                        "$nor": [{"ultima_posicion_geo": {"$geoWithin": {"$geometry": GEO_EJEMPLO}}}]},
+     "orden": [("id", 1)]},
+    {"coleccion": "bovinos", "pipeline": [
+        {"$geoNear": {"near": {"type": "Point", "coordinates": [0, 0]}, "distanceField": "distancia_m",
+                      "maxDistance": 500, "query": {"finca_id": "x"}}}
+    ]},
+    {"coleccion": "potreros", "filtro": {"finca_id": "x", "poligono_geo": {"$geoIntersects": {"$geometry": {"type": "Point", "coordinates": [0, 0]}}}}},
+    {"coleccion": "bovinos", "pipeline": [
+        {"$match": {"estado_ganado": "activo"}},
+        {"$group": {"_id": "$tipo_ganado", "count": {"$sum": 1}}}
+    ]},
+    {"coleccion": "registros_medicos", "filtro": {"bovino_id": "x"}, "orden": [("fecha_evento", -1), ("id", -1)]},
+    {"coleccion": "registros_medicos", "filtro": {}, "orden": [("fecha_evento", -1), ("id", -1)]},
+    {"coleccion": "registros_medicos", "filtro": {"fecha_proxima": {"$gte": "2024-01-01", "$lte": "2024-02-01"}},
+     "orden": [("fecha_proxima", 1), ("id", 1)]},
+    {"coleccion": "registros_medicos", "filtro": {"bovino_id": {"$in": ["x", "y"]}, "tipo_registro": "examen",
+                                                  "fecha_evento": {"$gte": "2024-01-01"}}},
+    {"coleccion": COLECCION_LECHE, "filtro": {"bovino_id": "x", CAMPO_FECHA: fecha_serie("2024-01-01")}},
+    {"coleccion": COLECCION_LECHE, "filtro": {"bovino_id": "x"}, "orden": [(CAMPO_FECHA, -1)]},
+    {"coleccion": COLECCION_LECHE, "filtro": {"bovino_id": {"$in": ["x", "y"]}, CAMPO_FECHA: {"$in": [fecha_serie("2024-01-01")]}}},
+    {"coleccion": COLECCION_LECHE, "filtro": {"bovino_id": "x", CAMPO_FECHA: {"$gte": fecha_serie("2024-01-01")}},
+     "orden": [(CAMPO_FECHA, 1)]},
+    {"coleccion": COLECCION_LECHE, "filtro": {}, "orden": [(CAMPO_FECHA, -1), ("id", -1)]},
+    {"coleccion": COLECCION_LECHE, "pipeline": [
+        {"$match": {CAMPO_FECHA: {"$gte": fecha_serie("2024-01-01")}}},
+        {"$group": {"_id": None, "total_litros": {"$sum": "$leche_litros"}}}
+    ]},
+    {"coleccion": COLECCION_ENGORDE, "filtro": {"bovino_id": "x"}, "orden": [(CAMPO_FECHA, -1)]},
+    {"coleccion": COLECCION_ENGORDE, "filtro": {"bovino_id": "x"}, "orden": [(CAMPO_FECHA, -1), ("id", -1)]},
+    {"coleccion": COLECCION_ENGORDE, "filtro": {}, "orden": [(CAMPO_FECHA, -1), ("id", -1)]},
+    {"coleccion": "alertas", "filtro": {"id": "x"}},
+    {"coleccion": "alertas", "filtro": {"activa": True}, "orden": [("severidad", -1), ("id", -1)]},
+    {"coleccion": "alertas", "filtro": {}, "orden": [("severidad", -1), ("id", -1)]},
+    {"coleccion": "alertas", "filtro": {"bovino_id": "x"}},
+    {"coleccion": "alertas", "filtro": {"finca_id": {"$in": ["x", "y"]}}},
+    {"coleccion": "alertas", "filtro": {"clave": "x"}},
+    {"coleccion": "alertas", "filtro": {"activa": True, "fecha_vencimiento": {"$lte": "2024-01-01"}, "severidad": {"$lt": 3}},
+     "orden": [("fecha_vencimiento", 1)]},
+    {"coleccion": "estadisticas_produccion", "filtro": {"bovino_id": "x"}},
+    {"coleccion": "estadisticas_produccion", "filtro": {"bovino_id": {"$in": ["x", "y"]}}},
+    {"coleccion": "estadisticas_produccion", "filtro": {"ultima_fecha": {"$gte": "2024-01-01", "$lte": "2024-02-01"}},
+     "orden": [("ultima_fecha", 1), ("bovino_id", 1)]},
+    {"coleccion": "bloqueos", "filtro": {"id": "x"}},
+    {"coleccion": "estadisticas_finca", "filtro": {"finca_id": "x"}},
+    {"coleccion": "produccion_mensual_finca", "filtro": {"finca_id": {"$in": ["x", "y"]}, "mes": {"$gte": "2020-01", "$lte": "2024-12"}},
+     "orden": [("finca_id", 1), ("mes", 1)]},
+    {"coleccion": "produccion_mensual_finca", "filtro": {"mes": {"$gte": "2020-01", "$lte": "2024-12"}}},
+    {"coleccion": "posiciones_historial", "filtro": {"bovino_id": "x", "fecha": {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 1, 2)}},
+     "orden": [("fecha", 1)]},
+    {"coleccion": "trabajos", "filtro": {"estado": "pendiente", "disponible_desde": {"$lte": "x"}}},
+    {"coleccion": "trabajos", "filtro": {"estado": "en_curso", "lease_hasta": {"$lt": "x"}}},
+]
+
+async def ensure_timeseries_collections():
+    existentes = set(await db.list_collection_names())
+    for coleccion in ("produccion_leche_ts", "produccion_engorde_ts"):
+        if coleccion not in existentes:
+            await db.create_collection(coleccion, timeseries=TIMESERIES_OPCIONES)
+
+async def ensure_indexes():
+    """Create every declared index; a failing index is logged and skipped"""
+    if PRODUCCION_TIMESERIES:
+        # Indexing a missing name would create a regular collection in its place
+        await ensure_timeseries_collections()
+    for coleccion, modelos in INDEXES.items():
+        for modelo in modelos:
+            try:
+                await db[coleccion].create_indexes([modelo])
+            except pymongo.errors.OperationFailure as e:
+                logger.error(f"No se pudo crear el índice {modelo.document['name']} en {coleccion}: {e}")
+    if EVENTOS:
+        await enable_change_preimages()
+
+def _plan_has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_plan_has_collscan(v) for v in plan.values())
+    if isinstance(plan, list):
+        return any(_plan_has_collscan(v) for v in plan)
+    return False
+
+def _winning_plans(explain):
+    """Yield every winningPlan in an explain document (find or aggregate)"""
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield value
+            else:
+                yield from _winning_plans(value)
+    elif isinstance(explain, list):
+        for value in explain:
+            yield from _winning_plans(value)
+
+async def verify_index_coverage():
+    """Run explain() on every query shape and fail if any falls back to COLLSCAN"""
+    failures = []
+    for shape in QUERY_SHAPES:
+        coleccion = db[shape["coleccion"]]
+        if "pipeline" in shape:
+            explain = await db.command("aggregate", shape["coleccion"], pipeline=shape["pipeline"], explain=True)
+        else:
+            cursor = coleccion.find(shape["filtro"])
+            if shape.get("orden"):
+                cursor = cursor.sort(shape["orden"])
+            explain = await cursor.explain()
+        if any(_plan_has_collscan(plan) for plan in _winning_plans(explain)):
+            failures.append(shape)
+            logger.error(f"COLLSCAN en {shape['coleccion']}: {shape.get('filtro', shape.get('pipeline'))}")
+    if failures:
+        raise RuntimeError(f"{len(failures)} consultas sin índice")
+    logger.info(f"{len(QUERY_SHAPES)} consultas verificadas, todas usan índices")
+
+# In-process caches
+class LRUCache:
+    """Small bounded in-process cache with hit/miss counters and optional TTL"""
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is not None and (self.ttl is None or entry[0] > time.monotonic()):
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self.data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self.data[key] = (expires, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def invalidate(self, key):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entradas": len(self.data), "aciertos": self.hits, "fallos": self.misses}
+
+class TokenBucketLimiter:
+    """Per-key token buckets refilled at `rate` per second up to `burst`; the least recently seen keys are dropped past maxsize"""
+    def __init__(self, rate: float, burst: int, maxsize: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.buckets = OrderedDict()
+        self.rejected = 0
+
+    def acquire(self, key: str) -> float:
+        """Take a token for `key`; returns 0 when admitted, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, last = self.buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+            self.rejected += 1
+        self.buckets[key] = (tokens, now)
+        while len(self.buckets) > self.maxsize:
+            self.buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, int]:
+        return {"clientes": len(self.buckets), "rechazadas": self.rejected}
+
+# Resolved users keyed by token subject. Invalidation is per process, so the
+# TTL bounds how long another worker can serve a stale or deactivated user.
+user_cache = LRUCache(USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+# Subjects deactivated while AUTH_TRUST_TOKEN_CLAIMS skips the database
+revoked_subjects = set()
+auth_stats = {"desde_token": 0}
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated pool; beyond workers + max_queue pending calls it sheds load with 503"""
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_pending = workers + max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servicio ocupado, intente de nuevo",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "trabajadores": self.workers,
+            "en_curso": min(self.pending, self.workers),
+            "en_cola": max(0, self.pending - self.workers),
+            "cola_maxima_observada": max(0, self.max_pending_seen - self.workers),
+            "completadas": self.completed,
+            "rechazadas": self.rejected,
+        }
+
+password_hasher = PasswordHasher(HASH_WORKERS, HASH_MAX_QUEUE)
+
 # Auth functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -296,6 +966,13 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str):
+    """(valid, new_hash); new_hash is set when the stored hash uses outdated parameters"""
+    return await password_hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -321,13 +998,80 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise credentials_exception
     
-    user = await db.usuarios.find_one({"correo": correo})
-    if user is None:
+    if AUTH_TRUST_TOKEN_CLAIMS and payload.get("uid") and payload.get("rol"):
+        if correo in revoked_subjects:
+            raise credentials_exception
+        auth_stats["desde_token"] += 1
+        return Usuario(
+            id=payload["uid"],
+            correo=correo,
+            rol=payload["rol"],
+            nombre_completo=payload.get("nombre") or correo
+        )
+    
+    user = await resolve_user(correo)
+    if user is None or not user.activo:
         raise credentials_exception
-    return Usuario(**user)
+    return user
+
+async def resolve_user(correo: str) -> Optional[Usuario]:
+    """Usuario for a token subject, served from user_cache when possible"""
+    user = user_cache.get(correo)
+    if user is None:
+        doc = await db.usuarios.find_one({"correo": correo}, {"_id": 0, "clave_hash": 0})
+        if doc is None:
+            return None
+        user = Usuario(**doc)
+        user_cache.set(correo, user)
+    return user
+
+def invalidate_user(correo: str, revocar: bool = False):
+    user_cache.invalidate(correo)
+    if revocar:
+        revoked_subjects.add(correo)
+    else:
+        revoked_subjects.discard(correo)
+
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+# Bump when render_qr_code output changes so cached images and ETags roll over
+QR_RENDER_VERSION = "1"
+qr_cache = LRUCache(QR_CACHE_SIZE)
+qr_executor = ThreadPoolExecutor(max_workers=QR_RENDER_WORKERS, thread_name_prefix="qr-render")
+_qr_inflight: Dict[str, asyncio.Future] = {}
+
+def qr_payload(bovino_id: str) -> str:
+    return f"{QR_BASE_URL}/{bovino_id}"
+
+def qr_digest(payload: str, formato: str) -> str:
+    """Content address of a QR image; it is a pure function of payload and format"""
+    return hashlib.sha256(f"{QR_RENDER_VERSION}:{formato}:{payload}".encode()).hexdigest()[:32]
+
+def qr_etag(payload: str, formato: str) -> str:
+    return f'"{qr_digest(payload, formato)}"'
+
+def _qr_svg(matrix: List[List[bool]]) -> bytes:
+    """One stroked path with a horizontal run per segment of dark modules"""
+    size = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        pen = None
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            path.append(f"M{start} {y}.5h{x - start}" if pen is None else f"m{start - pen} 0h{x - start}")
+            pen = x
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="#fff"/><path stroke="#000" d="{"".join(path)}"/></svg>'
+    ).encode()
 
-def generate_qr_code(data: str):
-    """Generate QR code and return base64 encoded image"""
+def render_qr_code(data: str, formato: str = "png") -> bytes:
+    """Render a QR code as PNG or SVG bytes"""
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -337,51 +1081,252 @@ def generate_qr_code(data: str):
     qr.add_data(data)
     qr.make(fit=True)
     
+    if formato == "svg":
+        return _qr_svg(qr.get_matrix())
+    
     img = qr.make_image(fill_color="black", back_color="white")
     buffer = BytesIO()
     img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
-    return base64.b64encode(buffer.getvalue()).decode()
+    return buffer.getvalue()
 
-# QR Code route (public, no auth required)
-@app.get("/qr/{bovino_id}")
-async def get_bovino_qr_info(bovino_id: str):
-    """Public endpoint for QR code scanning"""
-    bovino = await db.bovinos.find_one({"id": bovino_id})
-    if not bovino:
-        raise HTTPException(status_code=404, detail="Bovino no encontrado")
+async def render_cached(cache: LRUCache, inflight: Dict[str, asyncio.Future], key: str, executor, render, *args):
+    """Return cache[key], rendering on `executor` on a miss; concurrent misses share one render"""
+    value = cache.get(key)
+    if value is not None:
+        return value
     
-    # Get farm info
-    finca = await db.fincas.find_one({"id": bovino["finca_id"]})
+    pending = inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
     
-    # Get latest medical records
-    registros_medicos = await db.registros_medicos.find(
-        {"bovino_id": bovino_id}
-    ).sort("fecha_evento", -1).limit(5).to_list(5)
+    pending = asyncio.get_running_loop().run_in_executor(executor, render, *args)
+    inflight[key] = pending
+    try:
+        value = await asyncio.shield(pending)
+    finally:
+        inflight.pop(key, None)
+    cache.set(key, value)
+    return value
+
+async def get_qr_image(payload: str, formato: str) -> bytes:
+    """Cached QR image rendered on qr_executor"""
+    return await render_cached(
+        qr_cache, _qr_inflight, qr_digest(payload, formato), qr_executor, render_qr_code, payload, formato
+    )
+
+# Pagination
+# List endpoints page with a keyset cursor: the opaque token holds the sort key
+# values of the last row, so every page is an index seek instead of a skip.
+PAGE_SIZE_MAX = 1000
+STREAM_BATCH_SIZE = 500
+
+def _cursor_default(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(type(value).__name__)
+
+def _cursor_hook(obj):
+    return datetime.fromisoformat(obj["$date"]) if set(obj) == {"$date"} else obj
+
+def encode_cursor(values: List[Any]) -> str:
+    payload = json.dumps(values, separators=(",", ":"), default=_cursor_default)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(token: str, size: int) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()), object_hook=_cursor_hook)
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return values
+
+def keyset_filter(sort: List[tuple], values: List[Any]) -> Dict:
+    """Filter for rows strictly after `values` in `sort` order"""
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        branch = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        branch[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        branches.append(branch)
+    return {"$or": branches}
+
+async def _ndjson_lines(cursor, render):
+    lines = []
+    async for doc in cursor:
+        lines.append(render(doc))
+        if len(lines) >= STREAM_BATCH_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+_model_defaults: Dict[type, Dict[str, Any]] = {}
+
+def model_defaults(model) -> Dict[str, Any]:
+    """Plain defaults of `model`, filled into stored documents that predate a field"""
+    defaults = _model_defaults.get(model)
+    if defaults is None:
+        defaults = _model_defaults[model] = {
+            name: field.default for name, field in model.model_fields.items()
+            if not field.is_required() and field.default_factory is None
+        }
+    return defaults
+
+async def list_page(collection, query: Dict, sort: List[tuple], model, limit: int,
+                    cursor: Optional[str], response: Response, stream: bool = False):
+    """Return one keyset page of `model`s, or the whole result as NDJSON when streaming.
+    Only the model's fields are read; with FAST_LIST_RESPONSES they go out without building the models."""
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(cursor, len(sort)))]}
+    # Sort keys outside the model (CAMPO_FECHA in time-series mode) are read for the cursor only
+    extra = [field for field, _ in sort if field not in model.model_fields]
+    projection = {"_id": 0, **{name: 1 for name in model.model_fields}, **{field: 1 for field in extra}}
+    find = collection.find(query, projection).sort(sort)
+    defaults = model_defaults(model)
     
-    # Get production data
-    produccion_leche = []
-    produccion_engorde = []
+    def shape(doc: Dict) -> Dict:
+        for field in extra:
+            doc.pop(field, None)
+        return {**defaults, **doc}
     
-    if bovino["tipo_ganado"] in ["leche", "dual"]:
-        produccion_leche = await db.produccion_leche.find(
-            {"bovino_id": bovino_id}
-        ).sort("fecha_registro", -1).limit(10).to_list(10)
+    if stream:
+        render = (lambda doc: dumps_json(shape(doc))) if FAST_LIST_RESPONSES else \
+                 (lambda doc: model(**doc).model_dump_json().encode("utf-8"))
+        return StreamingResponse(
+            _ndjson_lines(find.batch_size(STREAM_BATCH_SIZE), render),
+            media_type="application/x-ndjson"
+        )
     
-    if bovino["tipo_ganado"] in ["carne", "dual"]:
-        produccion_engorde = await db.produccion_engorde.find(
-            {"bovino_id": bovino_id}
-        ).sort("fecha_registro", -1).limit(10).to_list(10)
+    docs = await find.limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor([docs[-1].get(field) for field, _ in sort])
+    if FAST_LIST_RESPONSES:
+        # Returning a Response skips FastAPI's response_model pass; the documents were written from these models
+        return FastJSONResponse([shape(doc) for doc in docs], headers=dict(response.headers))
+    return [model(**doc) for doc in docs]
+
+# Serialized scan pages keyed by bovino id. Writes to the animal or its records
+# invalidate the entry in this process; the TTL bounds staleness across workers.
+scan_cache = LRUCache(SCAN_CACHE_SIZE, ttl=SCAN_CACHE_TTL)
+# Client address as seen by uvicorn; run it with --proxy-headers behind a proxy
+scan_limiter = TokenBucketLimiter(SCAN_RATE_PER_IP, SCAN_BURST_PER_IP)
+
+def invalidate_scan(*bovino_ids: str):
+    for bovino_id in bovino_ids:
+        scan_cache.invalidate(bovino_id)
+
+def _latest_lookup(coleccion: str, orden: str, limite: int, tipos: Optional[List[str]] = None,
+                   como: Optional[str] = None) -> Dict:
+    pipeline = [{"$sort": {orden: -1}}, {"$limit": limite}, {"$project": {"_id": 0}}]
+    if tipos:
+        pipeline.insert(0, {"$match": {"$expr": {"$in": ["$$tipo", tipos]}}})
+    return {"$lookup": {
+        "from": coleccion, "localField": "id", "foreignField": "bovino_id",
+        "let": {"tipo": "$tipo_ganado"}, "pipeline": pipeline, "as": como or coleccion
+    }}
+
+def scan_pipeline(bovino_id: str) -> List[Dict]:
+    """The bovino with its farm and latest records in one aggregation"""
+    return [
+        {"$match": {"id": bovino_id}},
+        {"$project": {"_id": 0, "qr_clave": 0}},
+        {"$lookup": {
+            "from": "fincas", "localField": "finca_id", "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0}}, {"$limit": 1}], "as": "fincas"
+        }},
+        _latest_lookup("registros_medicos", "fecha_evento", 5),
+        _latest_lookup(COLECCION_LECHE, CAMPO_FECHA, 10, ["leche", "dual"], "produccion_leche"),
+        _latest_lookup(COLECCION_ENGORDE, CAMPO_FECHA, 10, ["carne", "dual"], "produccion_engorde"),
+    ]
+
+async def build_scan_page(bovino_id: str) -> Optional[bytes]:
+    docs = await db.bovinos.aggregate(scan_pipeline(bovino_id)).to_list(1)
+    if not docs:
+        return None
+    bovino = docs[0]
+    fincas = bovino.pop("fincas")
+    registros_medicos = bovino.pop("registros_medicos")
+    produccion_leche = bovino.pop("produccion_leche")
+    produccion_engorde = bovino.pop("produccion_engorde")
     
-    return {
+    page = {
         "bovino": Bovino(**bovino).dict(),
-        "finca": Finca(**finca).dict() if finca else None,
+        "finca": Finca(**fincas[0]).dict() if fincas else None,
         "registros_medicos": [RegistroMedico(**reg) for reg in registros_medicos],
         "produccion_leche": [ProduccionLeche(**prod) for prod in produccion_leche],
         "produccion_engorde": [ProduccionEngorde(**prod) for prod in produccion_engorde],
         "timestamp": datetime.now(timezone.utc)
     }
+    return json.dumps(jsonable_encoder(page), separators=(",", ":")).encode()
+
+async def warm_qr_cache(payloads: List[str], formato: str = "svg"):
+    resultados = await asyncio.gather(*[get_qr_image(payload, formato) for payload in payloads], return_exceptions=True)
+    fallidos = [r for r in resultados if isinstance(r, Exception)]
+    if fallidos:
+        logger.warning(f"Precalentado de QR: {len(fallidos)} de {len(payloads)} etiquetas fallaron ({fallidos[0]!r})")
+
+# Fire-and-forget tasks. The event loop only holds weak references to tasks, so
+# they are kept here until done, and their failures are logged.
+background_tasks: set = set()
+
+def _background_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Tarea en segundo plano {task.get_name()} falló", exc_info=task.exception())
+
+def run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+# QR Code route (public, no auth required)
+@app.get("/qr/{bovino_id}")
+async def get_bovino_qr_info(bovino_id: str, request: Request, if_none_match: Optional[str] = Header(None)):
+    """Public endpoint for QR code scanning"""
+    wait = scan_limiter.acquire(request.client.host if request.client else "")
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas consultas, intente de nuevo en unos segundos",
+            headers={"Retry-After": str(max(1, round(wait)))}
+        )
+    
+    cached = scan_cache.get(bovino_id)
+    if cached is None:
+        body = await build_scan_page(bovino_id)
+        if body is None:
+            raise HTTPException(status_code=404, detail="Bovino no encontrado")
+        cached = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        scan_cache.set(bovino_id, cached)
+    body, etag = cached
+    
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# QR image route (public, so it can be used directly as an <img> source)
+@api_router.get("/qr/{bovino_id}/imagen")
+async def get_bovino_qr_imagen(
+    bovino_id: str,
+    formato: str = Query("svg", pattern="^(png|svg)$"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """QR image rendered on demand and cached by payload"""
+    bovino = await db.bovinos.find_one({"id": bovino_id}, {"_id": 0, "qr_url": 1})
+    if not bovino:
+        raise HTTPException(status_code=404, detail="Bovino no encontrado")
+    
+    payload = bovino.get("qr_url") or qr_payload(bovino_id)
+    etag = qr_etag(payload, formato)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    image = await get_qr_image(payload, formato)
+    return Response(content=image, media_type=QR_MEDIA_TYPES[formato], headers=headers)
 
 # Auth routes
 @api_router.post("/auth/register", response_model=Usuario)
@@ -392,7 +1337,7 @@ async def register(user_data: UsuarioCreate):
         raise HTTPException(status_code=400, detail="El correo ya está registrado")
     
     # Create user
-    hashed_password = get_password_hash(user_data.clave)
+    hashed_password = await get_password_hash_async(user_data.clave)
     user = Usuario(
         nombre_completo=user_data.nombre_completo,
         correo=user_data.correo,
@@ -403,102 +1348,661 @@ async def register(user_data: UsuarioCreate):
     user_dict = user.dict()
     user_dict["clave_hash"] = hashed_password
     
-    await db.usuarios.insert_one(user_dict)
+    try:
+        await db.usuarios.insert_one(user_dict)
+    except pymongo.errors.DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="El correo ya está registrado")
     return user
 
 @api_router.post("/auth/login", response_model=Token)
 async def login(user_credentials: UsuarioLogin):
     user = await db.usuarios.find_one({"correo": user_credentials.correo})
-    if not user or not verify_password(user_credentials.clave, user["clave_hash"]):
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await verify_password_async(user_credentials.clave, user["clave_hash"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales incorrectas",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        await db.usuarios.update_one({"id": user["id"]}, {"$set": {"clave_hash": new_hash}})
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    if not user.get("activo", True):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuario desactivado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    # id, rol and nombre are signed claims so AUTH_TRUST_TOKEN_CLAIMS can skip the lookup
     access_token = create_access_token(
-        data={"sub": user["correo"]}, expires_delta=access_token_expires
+        data={"sub": user["correo"], "uid": user["id"], "rol": user["rol"], "nombre": user["nombre_completo"]},
+        expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @api_router.get("/auth/me", response_model=Usuario)
 async def read_users_me(current_user: Usuario = Depends(get_current_user)):
-    return current_user
+    # Token claims carry only part of the profile, so resolve the full user here
+    user = await resolve_user(current_user.correo)
+    if user is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    return user
 
 # Usuarios routes
 @api_router.get("/usuarios", response_model=List[Usuario])
-async def get_usuarios(current_user: Usuario = Depends(get_current_user)):
-    usuarios = await db.usuarios.find().to_list(1000)
-    return [Usuario(**usuario) for usuario in usuarios]
+async def get_usuarios(
+    response: Response,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
+    return await list_page(db.usuarios, {}, [("id", 1)], Usuario, limit, cursor, response, stream)
+
+@api_router.put("/usuarios/{usuario_id}", response_model=Usuario)
+async def update_usuario(usuario_id: str, usuario_data: UsuarioUpdate, current_user: Usuario = Depends(get_current_user)):
+    if current_user.id != usuario_id and current_user.rol != TipoUsuario.ADMINISTRADOR:
+        raise HTTPException(status_code=403, detail="No autorizado")
+    if usuario_data.rol is not None and current_user.rol != TipoUsuario.ADMINISTRADOR:
+        raise HTTPException(status_code=403, detail="Solo un administrador puede cambiar el rol")
+    
+    cambios = {k: v for k, v in usuario_data.dict().items() if v is not None}
+    usuario = await db.usuarios.find_one_and_update(
+        {"id": usuario_id},
+        {"$set": cambios},
+        projection={"_id": 0, "clave_hash": 0},
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    if not usuario:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    invalidate_user(usuario["correo"])
+    return Usuario(**usuario)
+
+@api_router.put("/usuarios/{usuario_id}/activo")
+async def update_usuario_activo(usuario_id: str, activo: bool, current_user: Usuario = Depends(get_current_user)):
+    if current_user.rol != TipoUsuario.ADMINISTRADOR:
+        raise HTTPException(status_code=403, detail="No autorizado")
+    
+    usuario = await db.usuarios.find_one_and_update(
+        {"id": usuario_id},
+        {"$set": {"activo": activo}},
+        projection={"_id": 0, "correo": 1}
+    )
+    if not usuario:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    invalidate_user(usuario["correo"], revocar=not activo)
+    return {"message": "Usuario activado" if activo else "Usuario desactivado"}
 
 @api_router.get("/veterinarios", response_model=List[Usuario])
 async def get_veterinarios(current_user: Usuario = Depends(get_current_user)):
     veterinarios = await db.usuarios.find({"rol": "veterinario"}).to_list(1000)
     return [Usuario(**vet) for vet in veterinarios]
 
+# Dashboard counters
+# estadisticas_finca holds one document per finca with the numbers the dashboard
+# shows, kept current with $inc by the write routes. Daily milk totals are a map
+# keyed by date, trimmed to DASHBOARD_RETENCION_DIAS by the reconcile job.
+# "version" moves on every change so readers can cache per finca.
+DASHBOARD_DIAS = 30
+DASHBOARD_RETENCION_DIAS = 60
+
+def _valor(value):
+    return value.value if isinstance(value, Enum) else value
+
+def bovino_stats_delta(bovino: Dict, signo: int) -> Dict[str, int]:
+    """Counter increments for adding (+1) or removing (-1) a bovino"""
+    if _valor(bovino.get("estado_ganado", EstadoGanado.ACTIVO)) != EstadoGanado.ACTIVO.value:
+        return {}
+    return {
+        "bovinos_activos": signo,
+        f"por_tipo.{_valor(bovino['tipo_ganado'])}": signo,
+        f"por_venta.{_valor(bovino.get('estado_venta', EstadoVenta.DISPONIBLE))}": signo,
+    }
+
+def merge_deltas(*deltas: Dict[str, float]) -> Dict[str, float]:
+    merged = {}
+    for delta in deltas:
+        for key, value in delta.items():
+            merged[key] = merged.get(key, 0) + value
+    return {k: v for k, v in merged.items() if v}
+
+async def bump_finca_stats(finca_id: Optional[str], delta: Dict[str, float]):
+    if not finca_id or not delta:
+        return
+    await db.estadisticas_finca.update_one(
+        {"finca_id": finca_id},
+        {"$inc": {**delta, "version": 1}, "$set": {"actualizado_en": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+async def touch_finca_stats(finca_id: Optional[str]):
+    """Move the version alone, for writes no counter tracks but cached readers depend on"""
+    if not finca_id:
+        return
+    await db.estadisticas_finca.update_one(
+        {"finca_id": finca_id},
+        {"$inc": {"version": 1}, "$set": {"actualizado_en": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+async def reconcile_dashboard_stats():
+    """Recompute estadisticas_finca from the source collections, correcting any drift"""
+    desde = (datetime.now() - timedelta(days=DASHBOARD_RETENCION_DIAS)).strftime("%Y-%m-%d")
+    stats = {f["id"]: {"bovinos_activos": 0, "por_tipo": {}, "por_venta": {}, "alertas_activas": 0, "leche_diaria": {}}
+             async for f in db.fincas.find({}, {"_id": 0, "id": 1})}
+    
+    async for grupo in db.bovinos.aggregate([
+        {"$match": {"estado_ganado": "activo"}},
+        {"$group": {"_id": {"finca": "$finca_id", "tipo": "$tipo_ganado", "venta": "$estado_venta"}, "n": {"$sum": 1}}}
+    ]):
+        finca = stats.get(grupo["_id"]["finca"])
+        if finca is None:
+            continue
+        finca["bovinos_activos"] += grupo["n"]
+        finca["por_tipo"][grupo["_id"]["tipo"]] = finca["por_tipo"].get(grupo["_id"]["tipo"], 0) + grupo["n"]
+        finca["por_venta"][grupo["_id"]["venta"]] = finca["por_venta"].get(grupo["_id"]["venta"], 0) + grupo["n"]
+    
+    # Alerts carry their finca_id (potrero alerts have no bovino); older ones are
+    # placed through their bovino
+    por_finca = db.alertas.aggregate([
+        {"$match": {"activa": True, "finca_id": {"$ne": None}}},
+        {"$group": {"_id": "$finca_id", "n": {"$sum": 1}}}
+    ])
+    sin_finca = db.alertas.aggregate([
+        {"$match": {"activa": True, "finca_id": None}},
+        {"$lookup": {"from": "bovinos", "localField": "bovino_id", "foreignField": "id", "as": "bovino"}},
+        {"$group": {"_id": {"$first": "$bovino.finca_id"}, "n": {"$sum": 1}}}
+    ])
+    for grupos in (por_finca, sin_finca):
+        async for grupo in grupos:
+            if grupo["_id"] in stats:
+                stats[grupo["_id"]]["alertas_activas"] += grupo["n"]
+    
+    async for grupo in db[COLECCION_LECHE].aggregate([
+        {"$match": {CAMPO_FECHA: {"$gte": fecha_serie(desde)}}},
+        {"$group": {"_id": {"bovino": "$bovino_id", "fecha": "$fecha_registro"}, "litros": {"$sum": "$leche_litros"}}},
+        {"$lookup": {"from": "bovinos", "localField": "_id.bovino", "foreignField": "id", "as": "bovino"}},
+        {"$group": {"_id": {"finca": {"$first": "$bovino.finca_id"}, "fecha": "$_id.fecha"}, "litros": {"$sum": "$litros"}}}
+    ], allowDiskUse=True):
+        finca = stats.get(grupo["_id"]["finca"])
+        if finca is not None:
+            finca["leche_diaria"][grupo["_id"]["fecha"]] = grupo["litros"]
+    
+    ahora = datetime.now(timezone.utc)
+    if stats:
+        await db.estadisticas_finca.bulk_write([
+            pymongo.UpdateOne(
+                {"finca_id": finca_id},
+                {"$set": {**valores, "actualizado_en": ahora}, "$inc": {"version": 1}},
+                upsert=True
+            )
+            for finca_id, valores in stats.items()
+        ])
+    await db.estadisticas_finca.delete_many({"finca_id": {"$nin": list(stats)}})
+    logger.info(f"Estadísticas del dashboard reconciliadas para {len(stats)} fincas")
+
+# Alert writer
+# Every alert is written through write_alerts. Its dedupe key ("clave") is the
+# alert type, its subject (bovino, or potrero for alerts without one) and a window
+# chosen by the caller: a due date, a day, an ISO week. An alert whose key already
+# exists is not inserted again; its "ocurrencias" counter goes up instead. All the
+# alerts of a call go out in one unordered bulk write.
+def alert_key(alerta: Alerta, ventana: str) -> str:
+    return f"{alerta.tipo_alerta.value}:{alerta.bovino_id or alerta.potrero_id}:{ventana}"
+
+def semana_iso(fecha: str) -> str:
+    """ISO week of a fecha_registro-style date, e.g. "2024-W07" """
+    anio, semana, _ = date.fromisoformat(fecha).isocalendar()
+    return f"{anio}-W{semana:02d}"
+
+async def write_alerts(alertas: List[tuple], ocurrencia: bool = True) -> Dict[Optional[str], int]:
+    """Upsert (Alerta, ventana) pairs by dedupe key; returns how many alerts were new per finca.
+    With ocurrencia=False a repeat only confirms the alert (rules that re-check the same
+    condition on every run) and leaves its counter alone."""
+    por_clave = {}
+    for alerta, ventana in alertas:
+        clave = alert_key(alerta, ventana)
+        primera, n = por_clave.get(clave, (alerta, 0))
+        por_clave[clave] = (primera, n + 1)
+    if not por_clave:
+        return {}
+    
+    ahora = datetime.now(timezone.utc)
+    operaciones = []
+    for clave, (alerta, n) in por_clave.items():
+        doc = alerta.dict(exclude={"ocurrencias", "ultima_ocurrencia"})
+        if ocurrencia:
+            cambios = {"$setOnInsert": doc, "$inc": {"ocurrencias": n}, "$set": {"ultima_ocurrencia": ahora}}
+        else:
+            cambios = {"$setOnInsert": {**doc, "ocurrencias": 1, "ultima_ocurrencia": ahora}}
+        operaciones.append(pymongo.UpdateOne({"clave": clave}, cambios, upsert=True))
+    try:
+        nuevas = (await db.alertas.bulk_write(operaciones, ordered=False)).upserted_ids
+    except pymongo.errors.BulkWriteError as e:
+        # Another worker raised the same alert between our match and insert
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+        nuevas = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+    
+    escritas = list(por_clave.values())
+    por_finca = {}
+    for indice in nuevas:
+        finca_id = escritas[indice][0].finca_id
+        por_finca[finca_id] = por_finca.get(finca_id, 0) + 1
+    return por_finca
+
+async def raise_alerts(alertas: List[tuple], ocurrencia: bool = True) -> int:
+    """write_alerts plus the dashboard's active alert counts; returns how many alerts were new"""
+    por_finca = await write_alerts(alertas, ocurrencia)
+    for finca_id, n in por_finca.items():
+        await bump_finca_stats(finca_id, {"alertas_activas": n})
+    return sum(por_finca.values())
+
+# Background jobs
+# Jobs live in the "trabajos" collection. A worker claims one by taking a lease;
+# handlers renew it with every progress update, so a job whose worker died is
+# picked up again once the lease runs out. Handlers must be safe to re-run from
+# the start: cascades delete by query in batches, so a resumed run only finds
+# what is left.
+class JobLeaseLost(Exception):
+    pass
+
+class JobQueue:
+    """Mongo backed job queue drained by asyncio worker tasks"""
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.handlers: Dict[str, Any] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.wakeup: Optional[asyncio.Event] = None
+        self.prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self.counters = {"completados": 0, "fallidos": 0, "reintentos": 0}
+
+    def handler(self, tipo: str):
+        def register(func):
+            self.handlers[tipo] = func
+            return func
+        return register
+
+    async def enqueue(self, tipo: str, parametros: Dict[str, Any], creado_por: Optional[str] = None) -> Dict:
+        ahora = datetime.now(timezone.utc)
+        trabajo = {
+            "id": str(uuid.uuid4()),
+            "tipo": tipo,
+            "parametros": parametros,
+            "estado": "pendiente",
+            "progreso": {},
+            "intentos": 0,
+            "disponible_desde": ahora,
+            "lease_hasta": None,
+            "trabajador": None,
+            "error": None,
+            "creado_por": creado_por,
+            "creado_en": ahora,
+            "actualizado_en": ahora,
+        }
+        await db.trabajos.insert_one(trabajo)
+        if self.wakeup is not None:
+            self.wakeup.set()
+        trabajo.pop("_id", None)
+        return trabajo
+
+    async def claim(self, trabajador: str) -> Optional[Dict]:
+        ahora = datetime.now(timezone.utc)
+        return await db.trabajos.find_one_and_update(
+            {"$or": [
+                {"estado": "pendiente", "disponible_desde": {"$lte": ahora}},
+                {"estado": "en_curso", "lease_hasta": {"$lt": ahora}},
+            ]},
+            {
+                "$set": {
+                    "estado": "en_curso",
+                    "trabajador": trabajador,
+                    "lease_hasta": ahora + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "actualizado_en": ahora,
+                },
+                "$inc": {"intentos": 1},
+            },
+            projection={"_id": 0},
+            sort=[("disponible_desde", 1)],
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+
+    async def progress(self, trabajo: Dict, set_: Optional[Dict] = None, inc: Optional[Dict] = None):
+        """Record progress and renew the lease; raises JobLeaseLost if another worker took the job"""
+        ahora = datetime.now(timezone.utc)
+        update = {"$set": {
+            **{f"progreso.{k}": v for k, v in (set_ or {}).items()},
+            "lease_hasta": ahora + timedelta(seconds=JOB_LEASE_SECONDS),
+            "actualizado_en": ahora,
+        }}
+        if inc:
+            update["$inc"] = {f"progreso.{k}": v for k, v in inc.items()}
+        result = await db.trabajos.update_one(
+            {"id": trabajo["id"], "estado": "en_curso", "trabajador": trabajo["trabajador"]}, update
+        )
+        if result.matched_count == 0:
+            raise JobLeaseLost(trabajo["id"])
+        trabajo["progreso"].update(set_ or {})
+
+    async def finish(self, trabajo: Dict, error: Optional[str] = None):
+        ahora = datetime.now(timezone.utc)
+        if error is None:
+            cambios = {"estado": "completado", "terminado_en": ahora}
+            self.counters["completados"] += 1
+        elif trabajo["intentos"] >= JOB_MAX_ATTEMPTS:
+            cambios = {"estado": "fallido", "error": error, "terminado_en": ahora}
+            self.counters["fallidos"] += 1
+        else:
+            # Retry with exponential backoff
+            cambios = {"estado": "pendiente", "error": error,
+                       "disponible_desde": ahora + timedelta(seconds=2 ** trabajo["intentos"])}
+            self.counters["reintentos"] += 1
+        await db.trabajos.update_one(
+            {"id": trabajo["id"], "trabajador": trabajo["trabajador"]},
+            {"$set": {**cambios, "lease_hasta": None, "actualizado_en": ahora}}
+        )
+
+    async def run_one(self, trabajador: str) -> bool:
+        """Claim and run one job; False when nothing was ready"""
+        trabajo = await self.claim(trabajador)
+        if trabajo is None:
+            return False
+        handler = self.handlers.get(trabajo["tipo"])
+        try:
+            if handler is None:
+                raise ValueError(f"Tipo de trabajo desconocido: {trabajo['tipo']}")
+            await handler(trabajo)
+        except JobLeaseLost:
+            logger.warning(f"Trabajo {trabajo['id']} tomado por otro trabajador")
+            return True
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back right away instead of waiting out the lease
+            await db.trabajos.update_one(
+                {"id": trabajo["id"], "trabajador": trabajador},
+                {"$set": {"estado": "pendiente", "lease_hasta": None}, "$inc": {"intentos": -1}}
+            )
+            raise
+        except Exception as e:
+            logger.exception(f"Trabajo {trabajo['id']} ({trabajo['tipo']}) falló")
+            await self.finish(trabajo, error=str(e))
+            return True
+        await self.finish(trabajo)
+        return True
+
+    async def worker(self, n: int):
+        trabajador = f"{self.prefix}:{n}"
+        while True:
+            try:
+                if await self.run_one(trabajador):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en el trabajador de trabajos")
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.tasks = [asyncio.create_task(self.worker(n)) for n in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def drain(self):
+        """Run jobs inline until none is ready (management commands)"""
+        while await self.run_one(f"{self.prefix}:cli"):
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"trabajadores": len(self.tasks), **self.counters}
+
+job_queue = JobQueue(JOB_WORKERS)
+
+async def delete_in_batches(trabajo: Dict, coleccion: str, query: Dict, al_borrar=None) -> int:
+    """Delete matching documents JOB_BATCH_SIZE at a time, counting them in the job's progress.
+    `al_borrar(docs)` runs before each batch is deleted, e.g. to adjust counters."""
+    total = 0
+    while True:
+        docs = await db[coleccion].find(query).limit(JOB_BATCH_SIZE).to_list(JOB_BATCH_SIZE)
+        if not docs:
+            return total
+        if al_borrar is not None:
+            await al_borrar(docs)
+        result = await db[coleccion].delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        total += result.deleted_count
+        await job_queue.progress(trabajo, inc={f"eliminados.{coleccion}": result.deleted_count})
+
+# Collections that hang off a bovino, in cascade order
+BOVINO_DEPENDIENTES = ["registros_medicos", COLECCION_LECHE, COLECCION_ENGORDE, "alertas", "estadisticas_produccion",
+                       "posiciones_historial"]
+
+async def cascade_bovinos(trabajo: Dict, bovino_ids: List[str], finca_id: Optional[str] = None):
+    """Delete the records of already removed bovinos; with finca_id, take their share out of its counters"""
+    desde = (datetime.now() - timedelta(days=DASHBOARD_RETENCION_DIAS)).strftime("%Y-%m-%d")
+    
+    async def descontar_leche(docs):
+        await bump_finca_stats(finca_id, merge_deltas(*[
+            {f"leche_diaria.{d['fecha_registro']}": -d["leche_litros"]} for d in docs if d["fecha_registro"] >= desde
+        ]))
+        await update_production_rollups([(finca_id, d) for d in docs], signo=-1)
+    
+    async def descontar_alertas(docs):
+        await bump_finca_stats(finca_id, {"alertas_activas": -sum(1 for d in docs if d.get("activa"))})
+    
+    hooks = {COLECCION_LECHE: descontar_leche, "alertas": descontar_alertas} if finca_id else {}
+    for coleccion in BOVINO_DEPENDIENTES:
+        await delete_in_batches(trabajo, coleccion, {"bovino_id": {"$in": bovino_ids}}, hooks.get(coleccion))
+
+@job_queue.handler("eliminar_bovino")
+async def job_eliminar_bovino(trabajo: Dict):
+    parametros = trabajo["parametros"]
+    await cascade_bovinos(trabajo, [parametros["bovino_id"]], parametros["finca_id"])
+
+@job_queue.handler("eliminar_finca")
+async def job_eliminar_finca(trabajo: Dict):
+    finca_id = trabajo["parametros"]["finca_id"]
+    await delete_in_batches(trabajo, "potreros", {"finca_id": finca_id})
+    # Animals go one batch at a time: their records first, then the batch itself
+    while True:
+        bovinos = await db.bovinos.find({"finca_id": finca_id}, {"_id": 1, "id": 1}).limit(JOB_BATCH_SIZE).to_list(JOB_BATCH_SIZE)
+        if not bovinos:
+            break
+        await cascade_bovinos(trabajo, [b["id"] for b in bovinos])
+        result = await db.bovinos.delete_many({"_id": {"$in": [b["_id"] for b in bovinos]}})
+        await job_queue.progress(trabajo, inc={"eliminados.bovinos": result.deleted_count})
+    await db.produccion_diaria_finca.delete_many({"finca_id": finca_id})
+    await db.produccion_mensual_finca.delete_many({"finca_id": finca_id})
+    # Counters bumped by writes that raced the teardown
+    await db.estadisticas_finca.delete_one({"finca_id": finca_id})
+
+# (collection, reference field, parent collection, extra filter); bovinos first
+# so the records of animals removed in that step are swept in the same run.
+# Documents without the reference are left alone: potrero alerts have no
+# bovino_id and go with their finca or potrero instead.
+HUERFANOS = [
+    ("bovinos", "finca_id", "fincas", {}),
+    ("potreros", "finca_id", "fincas", {}),
+    *[(coleccion, "bovino_id", "bovinos", {}) for coleccion in BOVINO_DEPENDIENTES],
+    ("alertas", "finca_id", "fincas", {}),
+    ("alertas", "potrero_id", "potreros", {"bovino_id": None}),
+]
+
+@job_queue.handler("barrer_huerfanos")
+async def job_barrer_huerfanos(trabajo: Dict):
+    """Remove documents whose parent no longer exists, resuming at the last finished step"""
+    for paso, (coleccion, campo, padre, filtro) in enumerate(HUERFANOS):
+        if paso < trabajo["progreso"].get("paso", 0):
+            continue
+        referencias = db[coleccion].aggregate([
+            {"$match": {campo: {"$ne": None}, **filtro}},
+            {"$group": {"_id": f"${campo}"}}
+        ], allowDiskUse=True)
+        lote = []
+        async for ref in referencias:
+            lote.append(ref["_id"])
+            if len(lote) >= JOB_BATCH_SIZE:
+                await _barrer_lote(trabajo, coleccion, campo, padre, filtro, lote)
+                lote = []
+        if lote:
+            await _barrer_lote(trabajo, coleccion, campo, padre, filtro, lote)
+        await job_queue.progress(trabajo, set_={"paso": paso + 1})
+
+async def _descontar_alertas_huerfanas(docs: List[Dict]):
+    """Take swept active alerts out of the counters of fincas that still exist"""
+    activas = {}
+    for d in docs:
+        if d.get("activa") and d.get("finca_id"):
+            activas[d["finca_id"]] = activas.get(d["finca_id"], 0) + 1
+    async for finca in db.fincas.find({"id": {"$in": list(activas)}}, {"_id": 0, "id": 1}):
+        await bump_finca_stats(finca["id"], {"alertas_activas": -activas[finca["id"]]})
+
+async def _barrer_lote(trabajo: Dict, coleccion: str, campo: str, padre: str, filtro: Dict, referencias: List[Any]):
+    existentes = {d["id"] async for d in db[padre].find({"id": {"$in": referencias}}, {"_id": 0, "id": 1})}
+    huerfanas = [r for r in referencias if r not in existentes]
+    if huerfanas:
+        al_borrar = _descontar_alertas_huerfanas if coleccion == "alertas" else None
+        await delete_in_batches(trabajo, coleccion, {campo: {"$in": huerfanas}, **filtro}, al_borrar)
+    else:
+        await job_queue.progress(trabajo)
+
+async def sweep_orphans():
+    """Queue an orphan sweep and run it (and anything else pending) inline"""
+    await job_queue.enqueue("barrer_huerfanos", {})
+    await job_queue.drain()
+
 # Fincas routes
 @api_router.post("/fincas", response_model=Finca)
 async def create_finca(finca_data: FincaCreate, current_user: Usuario = Depends(get_current_user)):
     finca = Finca(**finca_data.dict())
-    await db.fincas.insert_one(finca.dict())
+    with geometria_valida():
+        await db.fincas.insert_one(geo_doc("fincas", finca.dict()))
+    await db.estadisticas_finca.update_one(
+        {"finca_id": finca.id},
+        {"$setOnInsert": {"bovinos_activos": 0, "alertas_activas": 0, "version": 0}},
+        upsert=True
+    )
     return finca
 
 @api_router.get("/fincas", response_model=List[Finca])
-async def get_fincas(current_user: Usuario = Depends(get_current_user)):
-    fincas = await db.fincas.find().to_list(1000)
-    return [Finca(**finca) for finca in fincas]
+async def get_fincas(
+    response: Response,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
+    return await list_page(db.fincas, {}, [("id", 1)], Finca, limit, cursor, response, stream)
 
 @api_router.get("/fincas/{finca_id}", response_model=Finca)
 async def get_finca(finca_id: str, current_user: Usuario = Depends(get_current_user)):
-    finca = await db.fincas.find_one({"id": finca_id})
+    finca = await repo.get_finca(finca_id)
     if not finca:
         raise HTTPException(status_code=404, detail="Finca no encontrada")
     return Finca(**finca)
 
+@api_router.get("/fincas/{finca_id}/bovinos-fuera", response_model=List[Bovino])
+async def get_bovinos_fuera_finca(
+    finca_id: str,
+    response: Response,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Animals of the farm whose last position is outside its perimeter"""
+    finca = await db.fincas.find_one({"id": finca_id}, {"_id": 0, "perimetro": 1, "perimetro_geo": 1})
+    if not finca:
+        raise HTTPException(status_code=404, detail="Finca no encontrada")
+    perimetro = finca.get("perimetro_geo") or geo_poligono(finca.get("perimetro"))
+    if not perimetro:
+        raise HTTPException(status_code=409, detail="La finca no tiene perímetro registrado")
+    # idx_bovinos_finca_id narrows to the farm; the negated $geoWithin is checked per animal
+    query = {
+        "finca_id": finca_id,
+        "ultima_posicion_geo": {"$ne": None},
+        "$nor": [{"ultima_posicion_geo": {"$geoWithin": {"$geometry": perimetro}}}],
+    }
+    return await list_page(db.bovinos, query, [("id", 1)], Bovino, limit, cursor, response, stream)
+
 @api_router.put("/fincas/{finca_id}", response_model=Finca)
 async def update_finca(finca_id: str, finca_data: FincaCreate, current_user: Usuario = Depends(get_current_user)):
-    result = await db.fincas.update_one(
-        {"id": finca_id},
-        {"$set": finca_data.dict()}
-    )
+    with geometria_valida():
+        result = await db.fincas.update_one(
+            {"id": finca_id},
+            {"$set": geo_doc("fincas", finca_data.dict())}
+        )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Finca no encontrada")
     
+    # Every animal of the farm shows it on its scan page
+    scan_cache.clear()
+    geofence_cache.invalidate(finca_id)
     updated_finca = await db.fincas.find_one({"id": finca_id})
     return Finca(**updated_finca)
 
 @api_router.delete("/fincas/{finca_id}")
-async def delete_finca(finca_id: str, current_user: Usuario = Depends(get_current_user)):
+async def delete_finca(finca_id: str, response: Response, current_user: Usuario = Depends(get_current_user)):
     result = await db.fincas.delete_one({"id": finca_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Finca no encontrada")
-    return {"message": "Finca eliminada"}
+    await db.estadisticas_finca.delete_one({"finca_id": finca_id})
+    scan_cache.clear()
+    geofence_cache.invalidate(finca_id)
+    
+    # Animals, potreros and their records are removed by a background job
+    trabajo = await job_queue.enqueue("eliminar_finca", {"finca_id": finca_id}, current_user.id)
+    response.headers["Location"] = f"/api/trabajos/{trabajo['id']}"
+    return {"message": "Finca eliminada", "trabajo_id": trabajo["id"]}
 
 # Bovinos routes
+async def check_potrero(potrero_id: Optional[str], finca_id: str):
+    if potrero_id and not await db.potreros.find_one({"id": potrero_id, "finca_id": finca_id}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="El potrero no pertenece a la finca")
+
 @api_router.post("/bovinos", response_model=Bovino)
 async def create_bovino(bovino_data: BovinoCreate, current_user: Usuario = Depends(get_current_user)):
     # Check if caravana exists in the farm
     existing = await db.bovinos.find_one({"finca_id": bovino_data.finca_id, "caravana": bovino_data.caravana})
     if existing:
         raise HTTPException(status_code=400, detail="Ya existe un bovino con esa caravana en la finca")
+    await check_potrero(bovino_data.potrero_id, bovino_data.finca_id)
     
     bovino = Bovino(**bovino_data.dict())
     
-    # Generate QR code data
-    qr_data = f"https://maneadb.preview.emergentagent.com/qr/{bovino.id}"
-    bovino.qr_clave = generate_qr_code(qr_data)
-    bovino.qr_url = qr_data
+    # The QR image itself is rendered on demand by /api/qr/{id}/imagen
+    bovino.qr_url = qr_payload(bovino.id)
     
-    await db.bovinos.insert_one(bovino.dict())
+    try:
+        await db.bovinos.insert_one(bovino.dict())
+    except pymongo.errors.DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ya existe un bovino con esa caravana en la finca")
     
     # Create automatic alerts based on cattle type
-    await create_automatic_alerts(bovino.id, bovino.tipo_ganado, current_user.id)
+    alertas_creadas = await create_automatic_alerts(bovino.id, bovino.tipo_ganado, current_user.id, bovino.finca_id)
+    await bump_finca_stats(bovino.finca_id, merge_deltas(
+        bovino_stats_delta(bovino.dict(), 1), {"alertas_activas": sum(alertas_creadas.values())}
+    ))
     
     return bovino
 
-async def create_automatic_alerts(bovino_id: str, tipo_ganado: str, user_id: str):
-    """Create automatic alerts for new cattle"""
+async def create_automatic_alerts(bovino_id: str, tipo_ganado: str, user_id: str, finca_id: Optional[str] = None) -> Dict[Optional[str], int]:
+    """Create automatic alerts for new cattle; returns the new alerts per finca"""
+    alerts = automatic_alerts(bovino_id, tipo_ganado, user_id, finca_id)
+    return await write_alerts([(alert, f"alta:{alert.fecha_vencimiento}") for alert in alerts])
+
+def automatic_alerts(bovino_id: str, tipo_ganado: str, user_id: str, finca_id: Optional[str] = None) -> List[Alerta]:
+    """Alerts every new animal starts with, by cattle type"""
     alerts = []
     
     if tipo_ganado in ["leche", "dual"]:
@@ -534,15 +2038,153 @@ async def create_automatic_alerts(bovino_id: str, tipo_ganado: str, user_id: str
         "creado_por": user_id
     })
     
-    for alert_data in alerts:
-        alert = Alerta(**alert_data)
-        await db.alertas.insert_one(alert.dict())
+    return [Alerta(**alert_data, finca_id=finca_id) for alert_data in alerts]
+
+# Herd import
+BOVINO_IMPORT_MAX = 10000
+BOVINO_IMPORT_BATCH = 1000
+
+def _celda(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    value = str(value).strip()
+    return value or None
+
+def parse_herd_file(archivo, nombre: str) -> List[Dict[str, str]]:
+    """Rows of a CSV or XLSX herd file as dicts keyed by normalized header; blank cells are dropped"""
+    if nombre.lower().endswith(".xlsx"):
+        try:
+            import openpyxl
+        except ImportError:
+            raise HTTPException(status_code=501, detail="La importación de XLSX requiere openpyxl")
+        # read_only streams rows instead of loading the whole sheet
+        libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+        filas = libro.active.iter_rows(values_only=True)
+    else:
+        texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+        try:
+            dialecto = csv.Sniffer().sniff(texto.read(4096), delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        texto.seek(0)
+        filas = csv.reader(texto, dialecto)
+    
+    encabezado = [(_celda(h) or "").lower().replace(" ", "_") for h in next(filas, [])]
+    resultado = []
+    for fila in filas:
+        valores = {k: v for k, v in zip(encabezado, map(_celda, fila)) if k and v is not None}
+        if not valores:
+            continue
+        if len(resultado) >= BOVINO_IMPORT_MAX:
+            raise HTTPException(status_code=413, detail=f"Máximo {BOVINO_IMPORT_MAX} bovinos por archivo")
+        resultado.append(valores)
+    return resultado
+
+@api_router.post("/bovinos/importar")
+async def importar_bovinos(
+    finca_id: str,
+    archivo: UploadFile = File(...),
+    precalentar_qr: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Herd onboarding from a CSV or XLSX file (one animal per row) with a per-row result report"""
+    if not await db.fincas.find_one({"id": finca_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Finca no encontrada")
+    
+    # Parsing is CPU bound; keep it off the event loop
+    filas = await asyncio.to_thread(parse_herd_file, archivo.file, archivo.filename or "")
+    
+    resultados = [{"fila": i + 2} for i in range(len(filas))]  # spreadsheet row numbers, after the header
+    validos = {}  # caravana -> (indice, Bovino)
+    for i, fila in enumerate(filas):
+        try:
+            bovino = Bovino(**BovinoCreate(**{**fila, "finca_id": finca_id}).dict())
+        except ValidationError as e:
+            error = e.errors()[0]
+            resultados[i].update(estado="invalido", detalle=f'{".".join(map(str, error["loc"]))}: {error["msg"]}')
+            continue
+        resultados[i]["caravana"] = bovino.caravana
+        if bovino.caravana in validos:
+            resultados[i].update(estado="duplicado", detalle="Caravana repetida en el archivo")
+            continue
+        bovino.qr_url = qr_payload(bovino.id)
+        validos[bovino.caravana] = (i, bovino)
+        if i % BOVINO_IMPORT_BATCH == 0:
+            await asyncio.sleep(0)
+    
+    # One query for caravanas already in the farm
+    existentes = {
+        b["caravana"] async for b in db.bovinos.find(
+            {"finca_id": finca_id, "caravana": {"$in": list(validos)}}, {"_id": 0, "caravana": 1}
+        )
+    }
+    nuevos = []
+    for caravana, (i, bovino) in validos.items():
+        if caravana in existentes:
+            resultados[i].update(estado="duplicado", detalle="Ya existe un bovino con esa caravana en la finca")
+        else:
+            nuevos.append((i, bovino))
+    
+    insertados = []
+    for inicio in range(0, len(nuevos), BOVINO_IMPORT_BATCH):
+        lote = nuevos[inicio:inicio + BOVINO_IMPORT_BATCH]
+        try:
+            await db.bovinos.insert_many([b.dict() for _, b in lote], ordered=False)
+            insertados.extend(lote)
+        except pymongo.errors.BulkWriteError as e:
+            # Rows raced by a concurrent writer hit the unique (finca_id, caravana) index
+            fallidos = {err["index"]: err for err in e.details.get("writeErrors", [])}
+            for pos, (i, bovino) in enumerate(lote):
+                err = fallidos.get(pos)
+                if err is None:
+                    insertados.append((i, bovino))
+                elif err.get("code") == 11000:
+                    resultados[i].update(estado="duplicado", detalle="Ya existe un bovino con esa caravana en la finca")
+                else:
+                    resultados[i].update(estado="error", detalle=err.get("errmsg"))
+    
+    alertas = []
+    for i, bovino in insertados:
+        resultados[i].update(estado="creado", id=bovino.id)
+        alertas.extend(automatic_alerts(bovino.id, bovino.tipo_ganado, current_user.id, finca_id))
+    alertas_creadas = 0
+    for inicio in range(0, len(alertas), BOVINO_IMPORT_BATCH):
+        lote = alertas[inicio:inicio + BOVINO_IMPORT_BATCH]
+        alertas_creadas += sum((await write_alerts([(a, f"alta:{a.fecha_vencimiento}") for a in lote])).values())
+    
+    await bump_finca_stats(finca_id, merge_deltas(
+        *[bovino_stats_delta(bovino.dict(), 1) for _, bovino in insertados],
+        {"alertas_activas": alertas_creadas}
+    ))
+    
+    if precalentar_qr:
+        # Render the labels on qr_executor in the background; the response does not wait
+        run_in_background(warm_qr_cache([bovino.qr_url for _, bovino in insertados[:QR_CACHE_SIZE]]))
+    
+    conteo = {}
+    for resultado in resultados:
+        conteo[resultado["estado"]] = conteo.get(resultado["estado"], 0) + 1
+    return {
+        "total": len(filas),
+        "creados": conteo.get("creado", 0),
+        "duplicados": conteo.get("duplicado", 0),
+        "invalidos": conteo.get("invalido", 0),
+        "errores": conteo.get("error", 0),
+        "alertas_creadas": alertas_creadas,
+        "resultados": resultados
+    }
 
 @api_router.get("/bovinos", response_model=List[Bovino])
 async def get_bovinos(
+    response: Response,
     finca_id: Optional[str] = None, 
     tipo_ganado: Optional[str] = None,
     estado_venta: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
     current_user: Usuario = Depends(get_current_user)
 ):
     query = {}
@@ -553,54 +2195,90 @@ async def get_bovinos(
     if estado_venta:
         query["estado_venta"] = estado_venta
     
-    bovinos = await db.bovinos.find(query).to_list(1000)
-    return [Bovino(**bovino) for bovino in bovinos]
+    return await list_page(db.bovinos, query, [("id", 1)], Bovino, limit, cursor, response, stream)
+
+CERCANOS_METROS_MAX = 50000
+
+@api_router.get("/bovinos/cercanos", response_model=List[BovinoCercano])
+async def get_bovinos_cercanos(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    metros: float = Query(500, gt=0, le=CERCANOS_METROS_MAX),
+    finca_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=PAGE_SIZE_MAX),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Animals whose last position is within `metros` of a point, nearest first"""
+    geo_near = {
+        "near": geo_punto({"lat": lat, "lng": lng}),
+        "distanceField": "distancia_m",
+        "maxDistance": metros,
+        "spherical": True,
+    }
+    if finca_id:
+        geo_near["query"] = {"finca_id": finca_id}
+    docs = await db.bovinos.aggregate([
+        {"$geoNear": geo_near},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "qr_clave": 0, "ultima_posicion_geo": 0}},
+    ]).to_list(limit)
+    return [BovinoCercano(**doc) for doc in docs]
 
 @api_router.get("/bovinos/{bovino_id}", response_model=Bovino)
 async def get_bovino(bovino_id: str, current_user: Usuario = Depends(get_current_user)):
-    bovino = await db.bovinos.find_one({"id": bovino_id})
+    bovino = await repo.get_bovino(bovino_id)
     if not bovino:
         raise HTTPException(status_code=404, detail="Bovino no encontrado")
     return Bovino(**bovino)
 
 @api_router.put("/bovinos/{bovino_id}", response_model=Bovino)
 async def update_bovino(bovino_id: str, bovino_data: BovinoCreate, current_user: Usuario = Depends(get_current_user)):
-    # Regenerate QR if needed
-    existing_bovino = await db.bovinos.find_one({"id": bovino_id})
-    if not existing_bovino:
-        raise HTTPException(status_code=404, detail="Bovino no encontrado")
-    
+    await check_potrero(bovino_data.potrero_id, bovino_data.finca_id)
     update_data = bovino_data.dict()
+    update_data["qr_url"] = qr_payload(bovino_id)
     
-    # Keep existing QR data if not changing
-    if not update_data.get("qr_clave"):
-        qr_data = f"https://maneadb.preview.emergentagent.com/qr/{bovino_id}"
-        update_data["qr_clave"] = generate_qr_code(qr_data)
-        update_data["qr_url"] = qr_data
-    
-    result = await db.bovinos.update_one(
+    previous = await db.bovinos.find_one_and_update(
         {"id": bovino_id},
-        {"$set": update_data}
+        {"$set": update_data, "$unset": {"qr_clave": ""}},
+        projection={"_id": 0, "qr_clave": 0},
+        return_document=pymongo.ReturnDocument.BEFORE
     )
-    if result.matched_count == 0:
+    if not previous:
         raise HTTPException(status_code=404, detail="Bovino no encontrado")
+    updated_bovino = {**previous, **update_data}
+    
+    invalidate_scan(bovino_id)
     
-    updated_bovino = await db.bovinos.find_one({"id": bovino_id})
+    if previous["finca_id"] == updated_bovino["finca_id"]:
+        await bump_finca_stats(previous["finca_id"], merge_deltas(
+            bovino_stats_delta(previous, -1), bovino_stats_delta(updated_bovino, 1)
+        ))
+    else:
+        # Moved to another farm; its active alerts move with it
+        alertas_activas = await db.alertas.count_documents({"bovino_id": bovino_id, "activa": True})
+        await db.alertas.update_many({"bovino_id": bovino_id}, {"$set": {"finca_id": updated_bovino["finca_id"]}})
+        await bump_finca_stats(previous["finca_id"], merge_deltas(
+            bovino_stats_delta(previous, -1), {"alertas_activas": -alertas_activas}
+        ))
+        await bump_finca_stats(updated_bovino["finca_id"], merge_deltas(
+            bovino_stats_delta(updated_bovino, 1), {"alertas_activas": alertas_activas}
+        ))
     return Bovino(**updated_bovino)
 
 @api_router.delete("/bovinos/{bovino_id}")
-async def delete_bovino(bovino_id: str, current_user: Usuario = Depends(get_current_user)):
-    result = await db.bovinos.delete_one({"id": bovino_id})
-    if result.deleted_count == 0:
+async def delete_bovino(bovino_id: str, response: Response, current_user: Usuario = Depends(get_current_user)):
+    bovino = await db.bovinos.find_one_and_delete({"id": bovino_id}, projection={"_id": 0, "qr_clave": 0})
+    if not bovino:
         raise HTTPException(status_code=404, detail="Bovino no encontrado")
+    invalidate_scan(bovino_id)
+    await bump_finca_stats(bovino["finca_id"], bovino_stats_delta(bovino, -1))
     
-    # Delete related records
-    await db.registros_medicos.delete_many({"bovino_id": bovino_id})
-    await db.produccion_leche.delete_many({"bovino_id": bovino_id})
-    await db.produccion_engorde.delete_many({"bovino_id": bovino_id})
-    await db.alertas.delete_many({"bovino_id": bovino_id})
-    
-    return {"message": "Bovino eliminado"}
+    # Related records (and their share of the counters) go in a background job
+    trabajo = await job_queue.enqueue(
+        "eliminar_bovino", {"bovino_id": bovino_id, "finca_id": bovino["finca_id"]}, current_user.id
+    )
+    response.headers["Location"] = f"/api/trabajos/{trabajo['id']}"
+    return {"message": "Bovino eliminado", "trabajo_id": trabajo["id"]}
 
 @api_router.put("/bovinos/{bovino_id}/estado-venta")
 async def update_estado_venta(
@@ -608,12 +2286,17 @@ async def update_estado_venta(
     estado: EstadoVenta, 
     current_user: Usuario = Depends(get_current_user)
 ):
-    result = await db.bovinos.update_one(
+    previous = await db.bovinos.find_one_and_update(
         {"id": bovino_id},
-        {"$set": {"estado_venta": estado}}
+        {"$set": {"estado_venta": estado}},
+        projection={"_id": 0, "finca_id": 1, "tipo_ganado": 1, "estado_ganado": 1, "estado_venta": 1}
     )
-    if result.matched_count == 0:
+    if not previous:
         raise HTTPException(status_code=404, detail="Bovino no encontrado")
+    invalidate_scan(bovino_id)
+    await bump_finca_stats(previous["finca_id"], merge_deltas(
+        bovino_stats_delta(previous, -1), bovino_stats_delta({**previous, "estado_venta": estado}, 1)
+    ))
     return {"message": f"Estado de venta actualizado a {estado}"}
 
 # Registros médicos routes
@@ -627,248 +2310,1702 @@ async def create_registro_medico(registro_data: RegistroMedicoCreate, current_us
     
     registro = RegistroMedico(**registro_data.dict())
     await db.registros_medicos.insert_one(registro.dict())
+    invalidate_scan(registro.bovino_id)
     
     # Create follow-up alert if fecha_proxima is provided
     if registro.fecha_proxima:
-        await create_followup_alert(registro.bovino_id, registro.tipo_registro, registro.fecha_proxima, current_user.id)
+        await create_followup_alert(registro.dict(), current_user.id)
     
     return registro
 
-async def create_followup_alert(bovino_id: str, tipo_registro: str, fecha_proxima: str, user_id: str):
+def followup_alert(registro: Dict, bovino: Dict, user_id: Optional[str] = None) -> tuple:
+    """(Alerta, ventana) for the next due date of a medical record; the scheduler raises the same key"""
+    tipo_registro = TipoRegistroMedico(registro["tipo_registro"]).value
+    alerta = Alerta(
+        bovino_id=registro["bovino_id"],
+        finca_id=bovino["finca_id"],
+        tipo_alerta=TipoAlerta.VENCIMIENTO_MEDICO,
+        severidad=2,
+        titulo=f"Próximo {tipo_registro}",
+        mensaje=f"Próximo {tipo_registro} programado para {bovino.get('nombre') or bovino['caravana']}",
+        fecha_vencimiento=registro["fecha_proxima"],
+        creado_por=user_id,
+    )
+    return alerta, f"{registro['id']}:{registro['fecha_proxima']}"
+
+async def create_followup_alert(registro: Dict, user_id: str):
     """Create follow-up alert for medical records"""
-    bovino = await db.bovinos.find_one({"id": bovino_id})
+    bovino = await db.bovinos.find_one({"id": registro["bovino_id"]}, {"_id": 0, "finca_id": 1, "nombre": 1, "caravana": 1})
     if not bovino:
         return
-    
-    alert_data = {
-        "bovino_id": bovino_id,
-        "tipo_alerta": "vencimiento_medico",
-        "severidad": 2,
-        "titulo": f"Próximo {tipo_registro}",
-        "mensaje": f"Próximo {tipo_registro} programado para {bovino['nombre'] or bovino['caravana']}",
-        "fecha_vencimiento": fecha_proxima,
-        "creado_por": user_id
-    }
-    
-    alert = Alerta(**alert_data)
-    await db.alertas.insert_one(alert.dict())
+    await raise_alerts([followup_alert(registro, bovino, user_id)], ocurrencia=False)
 
 @api_router.get("/registros-medicos", response_model=List[RegistroMedico])
-async def get_registros_medicos(bovino_id: Optional[str] = None, current_user: Usuario = Depends(get_current_user)):
+async def get_registros_medicos(
+    response: Response,
+    bovino_id: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
     query = {}
     if bovino_id:
         query["bovino_id"] = bovino_id
     
-    registros = await db.registros_medicos.find(query).sort("fecha_evento", -1).to_list(1000)
-    return [RegistroMedico(**registro) for registro in registros]
+    sort = [("fecha_evento", -1), ("id", -1)]
+    return await list_page(db.registros_medicos, query, sort, RegistroMedico, limit, cursor, response, stream)
 
 # Producción routes
 @api_router.post("/produccion-leche", response_model=ProduccionLeche)
 async def create_produccion_leche(produccion_data: ProduccionLecheCreate, current_user: Usuario = Depends(get_current_user)):
+    bovino = await db.bovinos.find_one({"id": produccion_data.bovino_id}, {"_id": 0, "finca_id": 1})
+    if not bovino:
+        raise HTTPException(status_code=404, detail="Bovino no encontrado")
+    
     # Check if record exists for this date
-    existing = await db.produccion_leche.find_one({
+    existing = await db[COLECCION_LECHE].find_one({
         "bovino_id": produccion_data.bovino_id,
-        "fecha_registro": produccion_data.fecha_registro
+        CAMPO_FECHA: fecha_serie(produccion_data.fecha_registro)
     })
     if existing:
         raise HTTPException(status_code=400, detail="Ya existe un registro de producción para esta fecha")
     
     produccion = ProduccionLeche(**produccion_data.dict())
-    await db.produccion_leche.insert_one(produccion.dict())
+    try:
+        await db[COLECCION_LECHE].insert_one(serie_doc(produccion))
+    except pymongo.errors.DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ya existe un registro de producción para esta fecha")
+    invalidate_scan(produccion.bovino_id)
     
-    # Check for low production alert
-    await check_low_production_alert(produccion.bovino_id, produccion.leche_litros, current_user.id)
+    await bump_finca_stats(bovino["finca_id"], {f"leche_diaria.{produccion.fecha_registro}": produccion.leche_litros})
+    await update_production_rollups([(bovino["finca_id"], produccion.dict())])
+    
+    # Update rolling stats and check for low production alert
+    await check_low_production_alert(
+        produccion.bovino_id, produccion.fecha_registro, produccion.leche_litros, current_user.id
+    )
     
     return produccion
 
-async def check_low_production_alert(bovino_id: str, litros_actuales: float, user_id: str):
-    """Check if milk production is significantly lower than average"""
-    # Get last 10 records
-    records = await db.produccion_leche.find(
-        {"bovino_id": bovino_id}
-    ).sort("fecha_registro", -1).limit(10).to_list(10)
+# Low production: latest record 20% below the average of the previous ones,
+# looking at the last LOW_PRODUCTION_WINDOW records
+LOW_PRODUCTION_WINDOW = 10
+LOW_PRODUCTION_MIN_RECORDS = 5
+LOW_PRODUCTION_RATIO = 0.8
+
+PRODUCTION_EWMA_ALPHA = 0.3
+
+def is_low_production(litros_actuales: float, anteriores: List[float]) -> bool:
+    if len(anteriores) + 1 < LOW_PRODUCTION_MIN_RECORDS:
+        return False
+    average = sum(anteriores) / len(anteriores)
+    return litros_actuales < average * LOW_PRODUCTION_RATIO
+
+def low_production_from_window(ventana: List[Dict], fecha: str, litros: float) -> bool:
+    """Evaluate a new record against the stats window as it was before the record"""
+    if ventana and fecha <= ventana[-1]["fecha"]:
+        return False  # backfilled date, the latest record did not change
+    return is_low_production(litros, [v["litros"] for v in ventana[-(LOW_PRODUCTION_WINDOW - 1):]])
+
+# Rolling production stats, one document per bovino in estadisticas_produccion:
+# the last LOW_PRODUCTION_WINDOW records sorted by date, plus their sum, count
+# and EWMA. The EWMA is taken over the window so backfilled dates keep it exact.
+def _window_summary_stage() -> Dict:
+    alpha = PRODUCTION_EWMA_ALPHA
+    return {"$set": {
+        "suma": {"$sum": "$ventana.litros"},
+        "conteo": {"$size": "$ventana"},
+        "ewma": {"$reduce": {
+            "input": "$ventana.litros",
+            "initialValue": None,
+            "in": {"$cond": [
+                {"$eq": ["$$value", None]},
+                "$$this",
+                {"$add": [{"$multiply": [alpha, "$$this"]}, {"$multiply": [1 - alpha, "$$value"]}]}
+            ]}
+        }},
+        "ultima_fecha": {"$arrayElemAt": ["$ventana.fecha", -1]},
+        "actualizado_en": "$$NOW",
+    }}
+
+def production_stats_update(fecha: str, litros: float) -> List[Dict]:
+    """Update pipeline inserting one record into the date-sorted window"""
+    ventana = {"$ifNull": ["$ventana", []]}
+    return [
+        {"$set": {
+            "ventana": {"$slice": [{"$concatArrays": [
+                {"$filter": {"input": ventana, "cond": {"$lt": ["$$this.fecha", fecha]}}},
+                [{"fecha": fecha, "litros": litros}],
+                {"$filter": {"input": ventana, "cond": {"$gt": ["$$this.fecha", fecha]}}},
+            ]}, -LOW_PRODUCTION_WINDOW]},
+            "total_registros": {"$add": [{"$ifNull": ["$total_registros", 0]}, 1]},
+        }},
+        _window_summary_stage(),
+    ]
+
+async def update_production_stats(bovino_id: str, fecha: str, litros: float) -> Optional[Dict]:
+    """Apply one record to the bovino's stats; returns the stats as they were before"""
+    for _ in range(2):
+        try:
+            return await db.estadisticas_produccion.find_one_and_update(
+                {"bovino_id": bovino_id},
+                production_stats_update(fecha, litros),
+                upsert=True,
+                projection={"_id": 0, "ventana": 1},
+                return_document=pymongo.ReturnDocument.BEFORE
+            )
+        except pymongo.errors.DuplicateKeyError:
+            continue  # lost an upsert race for a new bovino, the document exists now
+    return None
+
+async def rebuild_production_stats():
+    """Recompute estadisticas_produccion from produccion_leche in one aggregation"""
+    await db[COLECCION_LECHE].aggregate([
+        # Reverse walk of the (bovino_id, fecha desc) index, no in-memory sort
+        {"$sort": {"bovino_id": -1, CAMPO_FECHA: 1}},
+        {"$group": {
+            "_id": "$bovino_id",
+            "ventana": {"$push": {"fecha": "$fecha_registro", "litros": "$leche_litros"}},
+            "total_registros": {"$sum": 1},
+        }},
+        {"$set": {"bovino_id": "$_id", "ventana": {"$slice": ["$ventana", -LOW_PRODUCTION_WINDOW]}}},
+        _window_summary_stage(),
+        {"$out": "estadisticas_produccion"},
+    ], allowDiskUse=True).to_list(None)
+    total = await db.estadisticas_produccion.count_documents({})
+    logger.info(f"Estadísticas de producción recalculadas para {total} bovinos")
+
+# Production rollups
+# Milk totals per finca per day and per month, the Mongo counterpart of
+# v_produccion_lactea_mensual. Sums and record counts are kept so averages can
+# be derived; "bovinos" holds the producing animals for the distinct count.
+ROLLUPS_PRODUCCION = [
+    ("produccion_diaria_finca", "fecha", lambda fecha: fecha, "$fecha_registro"),
+    ("produccion_mensual_finca", "mes", lambda fecha: fecha[:7], {"$substrCP": ["$fecha_registro", 0, 7]}),
+]
+
+def _rollup_inc(produccion: Dict, signo: int) -> Dict[str, float]:
+    inc = {"litros": signo * produccion["leche_litros"], "registros": signo}
+    for campo, pct in (("grasa", "grasa_pct"), ("proteina", "proteina_pct")):
+        if produccion.get(pct) is not None:
+            inc[f"{campo}_suma"] = signo * produccion[pct]
+            inc[f"{campo}_registros"] = signo
+    return inc
+
+async def update_production_rollups(filas: List[tuple], signo: int = 1):
+    """Apply (finca_id, produccion) rows to the rollups. signo=-1 is only for removing
+    animals entirely: it also drops them from the producing set."""
+    ahora = datetime.now(timezone.utc)
+    for coleccion, campo, periodo_de, _ in ROLLUPS_PRODUCCION:
+        grupos = {}
+        for finca_id, produccion in filas:
+            if finca_id is None:
+                continue
+            clave = (finca_id, periodo_de(produccion["fecha_registro"]))
+            inc, bovinos = grupos.get(clave, ({}, set()))
+            grupos[clave] = (merge_deltas(inc, _rollup_inc(produccion, signo)), bovinos | {produccion["bovino_id"]})
+        if not grupos:
+            continue
+        operaciones = []
+        for (finca_id, periodo), (inc, bovinos) in grupos.items():
+            update = {"$inc": inc, "$set": {"actualizado_en": ahora}}
+            if signo > 0:
+                update["$addToSet"] = {"bovinos": {"$each": sorted(bovinos)}}
+            else:
+                update["$pull"] = {"bovinos": {"$in": sorted(bovinos)}}
+            operaciones.append(pymongo.UpdateOne({"finca_id": finca_id, campo: periodo}, update, upsert=signo > 0))
+        try:
+            await db[coleccion].bulk_write(operaciones, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # Upserts that raced a concurrent writer for the same period; the document exists now
+            repetir = [operaciones[err["index"]] for err in e.details["writeErrors"] if err.get("code") == 11000]
+            if len(repetir) < len(e.details["writeErrors"]):
+                raise
+            await db[coleccion].bulk_write(repetir, ordered=False)
+
+async def backfill_production_rollups():
+    """Rebuild the daily and monthly rollups from the milk records"""
+    for coleccion, campo, _, periodo in ROLLUPS_PRODUCCION:
+        await db[COLECCION_LECHE].aggregate([
+            {"$lookup": {
+                "from": "bovinos", "localField": "bovino_id", "foreignField": "id",
+                "pipeline": [{"$project": {"_id": 0, "finca_id": 1}}], "as": "bovino"
+            }},
+            {"$unwind": "$bovino"},
+            {"$group": {
+                "_id": {"finca_id": "$bovino.finca_id", "periodo": periodo},
+                "litros": {"$sum": "$leche_litros"},
+                "registros": {"$sum": 1},
+                "grasa_suma": {"$sum": "$grasa_pct"},
+                "grasa_registros": {"$sum": {"$cond": [{"$isNumber": "$grasa_pct"}, 1, 0]}},
+                "proteina_suma": {"$sum": "$proteina_pct"},
+                "proteina_registros": {"$sum": {"$cond": [{"$isNumber": "$proteina_pct"}, 1, 0]}},
+                "bovinos": {"$addToSet": "$bovino_id"},
+            }},
+            {"$project": {
+                "_id": 0, "finca_id": "$_id.finca_id", campo: "$_id.periodo",
+                "litros": 1, "registros": 1, "grasa_suma": 1, "grasa_registros": 1,
+                "proteina_suma": 1, "proteina_registros": 1, "bovinos": 1,
+                "actualizado_en": "$$NOW",
+            }},
+            # $out swaps the collection in atomically and keeps its indexes
+            {"$out": coleccion},
+        ], allowDiskUse=True).to_list(None)
+        total = await db[coleccion].count_documents({})
+        logger.info(f"{coleccion}: {total} periodos recalculados")
+
+def low_production_alert(bovino: Dict, user_id: str) -> Alerta:
+    return Alerta(
+        bovino_id=bovino["id"],
+        finca_id=bovino.get("finca_id"),
+        tipo_alerta=TipoAlerta.PRODUCCION_BAJA,
+        severidad=2,
+        titulo="Producción láctea baja",
+        mensaje=f"Producción de {bovino.get('nombre') or bovino['caravana']} está 20% por debajo del promedio",
+        creado_por=user_id
+    )
+
+async def check_low_production_alert(bovino_id: str, fecha: str, litros_actuales: float, user_id: str):
+    """Record the production in the rolling stats and alert if it is well below average.
+    One alert per animal and ISO week; each further low day adds an occurrence."""
+    previas = await update_production_stats(bovino_id, fecha, litros_actuales)
     
-    if len(records) < 5:  # Need at least 5 records for comparison
-        return
+    if low_production_from_window((previas or {}).get("ventana", []), fecha, litros_actuales):
+        bovino = await db.bovinos.find_one({"id": bovino_id}, {"_id": 0, "id": 1, "finca_id": 1, "nombre": 1, "caravana": 1})
+        if bovino is None:
+            return  # deleted meanwhile, nothing to alert on
+        await raise_alerts([(low_production_alert(bovino, user_id), semana_iso(fecha))])
+
+PRODUCCION_LOTE_MAX = 5000
+
+@api_router.post("/produccion-leche/lote")
+async def create_produccion_leche_lote(filas: List[Dict[str, Any]], current_user: Usuario = Depends(get_current_user)):
+    """Bulk milk ingestion (parlor uploads) with a per-row result report"""
+    if len(filas) > PRODUCCION_LOTE_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {PRODUCCION_LOTE_MAX} registros por lote")
     
-    # Calculate average excluding current record
-    total = sum(r["leche_litros"] for r in records[1:])
-    average = total / (len(records) - 1)
+    resultados = [{"indice": i} for i in range(len(filas))]
+    validos = {}  # (bovino_id, fecha_registro) -> (indice, ProduccionLeche)
+    for i, fila in enumerate(filas):
+        try:
+            produccion = ProduccionLeche(**ProduccionLecheCreate(**fila).dict())
+        except ValidationError as e:
+            resultados[i].update(estado="invalido", detalle=str(e.errors()[0]["msg"]))
+            continue
+        clave = (produccion.bovino_id, produccion.fecha_registro)
+        if clave in validos:
+            resultados[i].update(estado="duplicado", detalle="Registro repetido en el lote")
+            continue
+        validos[clave] = (i, produccion)
     
-    # If current production is 20% below average, create alert
-    if litros_actuales < (average * 0.8):
-        bovino = await db.bovinos.find_one({"id": bovino_id})
-        alert_data = {
-            "bovino_id": bovino_id,
-            "tipo_alerta": "produccion_baja",
-            "severidad": 2,
-            "titulo": "Producción láctea baja",
-            "mensaje": f"Producción de {bovino['nombre'] or bovino['caravana']} está 20% por debajo del promedio",
-            "creado_por": user_id
+    # One query for the animals, one for records already stored
+    bovino_ids = list({bovino_id for bovino_id, _ in validos})
+    bovinos = {
+        b["id"]: b async for b in db.bovinos.find(
+            {"id": {"$in": bovino_ids}}, {"_id": 0, "id": 1, "finca_id": 1, "nombre": 1, "caravana": 1}
+        )
+    }
+    existentes = {
+        (r["bovino_id"], r["fecha_registro"]) async for r in db[COLECCION_LECHE].find(
+            {"bovino_id": {"$in": bovino_ids}, CAMPO_FECHA: {"$in": [fecha_serie(f) for f in {f for _, f in validos}]}},
+            {"_id": 0, "bovino_id": 1, "fecha_registro": 1}
+        )
+    }
+    
+    nuevos = []
+    for clave, (i, produccion) in validos.items():
+        if clave[0] not in bovinos:
+            resultados[i].update(estado="error", detalle="Bovino no encontrado")
+        elif clave in existentes:
+            resultados[i].update(estado="duplicado", detalle="Ya existe un registro de producción para esta fecha")
+        else:
+            nuevos.append((i, produccion))
+    
+    insertados = nuevos
+    if nuevos:
+        try:
+            await db[COLECCION_LECHE].insert_many([serie_doc(p) for _, p in nuevos], ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # Rows raced by a concurrent writer hit the unique (bovino_id, fecha_registro) index
+            fallidos = {err["index"]: err for err in e.details.get("writeErrors", [])}
+            insertados = []
+            for pos, (i, produccion) in enumerate(nuevos):
+                err = fallidos.get(pos)
+                if err is None:
+                    insertados.append((i, produccion))
+                elif err.get("code") == 11000:
+                    resultados[i].update(estado="duplicado", detalle="Ya existe un registro de producción para esta fecha")
+                else:
+                    resultados[i].update(estado="error", detalle=err.get("errmsg"))
+    for i, produccion in insertados:
+        resultados[i].update(estado="creado", id=produccion.id)
+    
+    # Low production alerts for the whole batch, evaluated against one read of the rolling stats
+    nuevos_por_bovino = {}
+    for _, produccion in insertados:
+        nuevos_por_bovino.setdefault(produccion.bovino_id, []).append(produccion)
+    alertas = []
+    if nuevos_por_bovino:
+        ventanas = {
+            e["bovino_id"]: e["ventana"] async for e in db.estadisticas_produccion.find(
+                {"bovino_id": {"$in": list(nuevos_por_bovino)}}, {"_id": 0, "bovino_id": 1, "ventana": 1}
+            )
         }
-        
-        alert = Alerta(**alert_data)
-        await db.alertas.insert_one(alert.dict())
+        actualizaciones = []
+        for bovino_id, producciones in nuevos_por_bovino.items():
+            ventana = list(ventanas.get(bovino_id, []))
+            for produccion in sorted(producciones, key=lambda p: p.fecha_registro):
+                if low_production_from_window(ventana, produccion.fecha_registro, produccion.leche_litros):
+                    # write_alerts folds the low days of one week into one alert
+                    semana = semana_iso(produccion.fecha_registro)
+                    alertas.append((low_production_alert(bovinos[bovino_id], current_user.id), semana))
+                ventana.append({"fecha": produccion.fecha_registro, "litros": produccion.leche_litros})
+                ventana = sorted(ventana, key=lambda v: v["fecha"])[-LOW_PRODUCTION_WINDOW:]
+                actualizaciones.append(pymongo.UpdateOne(
+                    {"bovino_id": bovino_id},
+                    production_stats_update(produccion.fecha_registro, produccion.leche_litros),
+                    upsert=True
+                ))
+        try:
+            await db.estadisticas_produccion.bulk_write(actualizaciones, ordered=True)
+        except pymongo.errors.BulkWriteError as e:
+            # A concurrent upsert created a stats document first; replay from the failed update
+            await db.estadisticas_produccion.bulk_write(actualizaciones[e.details["writeErrors"][0]["index"]:], ordered=True)
+    alertas_creadas = await write_alerts(alertas)
+    
+    invalidate_scan(*{produccion.bovino_id for _, produccion in insertados})
+    
+    # Dashboard counters, one $inc per finca
+    deltas = {}
+    for _, produccion in insertados:
+        finca_id = bovinos[produccion.bovino_id]["finca_id"]
+        deltas[finca_id] = merge_deltas(
+            deltas.get(finca_id, {}), {f"leche_diaria.{produccion.fecha_registro}": produccion.leche_litros}
+        )
+    for finca_id, n in alertas_creadas.items():
+        deltas[finca_id] = merge_deltas(deltas.get(finca_id, {}), {"alertas_activas": n})
+    for finca_id, delta in deltas.items():
+        await bump_finca_stats(finca_id, delta)
+    await update_production_rollups([(bovinos[p.bovino_id]["finca_id"], p.dict()) for _, p in insertados])
+    
+    conteo = {}
+    for resultado in resultados:
+        conteo[resultado["estado"]] = conteo.get(resultado["estado"], 0) + 1
+    return {
+        "total": len(filas),
+        "creados": conteo.get("creado", 0),
+        "duplicados": conteo.get("duplicado", 0),
+        "invalidos": conteo.get("invalido", 0),
+        "errores": conteo.get("error", 0),
+        "alertas_creadas": sum(alertas_creadas.values()),
+        "resultados": resultados
+    }
 
 @api_router.get("/produccion-leche", response_model=List[ProduccionLeche])
-async def get_produccion_leche(bovino_id: Optional[str] = None, current_user: Usuario = Depends(get_current_user)):
+async def get_produccion_leche(
+    response: Response,
+    bovino_id: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
     query = {}
+    sort = [(CAMPO_FECHA, -1), ("id", -1)]
     if bovino_id:
         query["bovino_id"] = bovino_id
+        if not PRODUCCION_TIMESERIES:
+            # (bovino_id, fecha_registro) is unique, the date alone is a total order
+            sort = [(CAMPO_FECHA, -1)]
     
-    produccion = await db.produccion_leche.find(query).sort("fecha_registro", -1).to_list(1000)
-    return [ProduccionLeche(**prod) for prod in produccion]
+    return await list_page(db[COLECCION_LECHE], query, sort, ProduccionLeche, limit, cursor, response, stream)
 
 @api_router.post("/produccion-engorde", response_model=ProduccionEngorde)
 async def create_produccion_engorde(produccion_data: ProduccionEngordeCreate, current_user: Usuario = Depends(get_current_user)):
     # Calculate weight gain if there's a previous record
-    last_record = await db.produccion_engorde.find_one(
+    last_record = await db[COLECCION_ENGORDE].find_one(
         {"bovino_id": produccion_data.bovino_id},
-        sort=[("fecha_registro", -1)]
+        sort=[(CAMPO_FECHA, -1)]
     )
     
     if last_record and not produccion_data.ganancia_kg:
         produccion_data.ganancia_kg = produccion_data.peso_kg - last_record["peso_kg"]
     
     produccion = ProduccionEngorde(**produccion_data.dict())
-    await db.produccion_engorde.insert_one(produccion.dict())
+    await db[COLECCION_ENGORDE].insert_one(serie_doc(produccion))
     
     # Update bovino weight
     await db.bovinos.update_one(
         {"id": produccion.bovino_id},
         {"$set": {"peso_kg": produccion.peso_kg}}
     )
+    invalidate_scan(produccion.bovino_id)
+    bovino = await db.bovinos.find_one({"id": produccion.bovino_id}, {"_id": 0, "finca_id": 1})
+    # Weighings feed the herd analytics cached per stats version
+    await touch_finca_stats(bovino and bovino["finca_id"])
     
     return produccion
 
 @api_router.get("/produccion-engorde", response_model=List[ProduccionEngorde])
-async def get_produccion_engorde(bovino_id: Optional[str] = None, current_user: Usuario = Depends(get_current_user)):
+async def get_produccion_engorde(
+    response: Response,
+    bovino_id: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
     query = {}
     if bovino_id:
         query["bovino_id"] = bovino_id
     
-    produccion = await db.produccion_engorde.find(query).sort("fecha_registro", -1).to_list(1000)
-    return [ProduccionEngorde(**prod) for prod in produccion]
+    sort = [(CAMPO_FECHA, -1), ("id", -1)]
+    return await list_page(db[COLECCION_ENGORDE], query, sort, ProduccionEngorde, limit, cursor, response, stream)
 
 # Alertas routes
 @api_router.post("/alertas", response_model=Alerta)
 async def create_alerta(alerta_data: AlertaCreate, current_user: Usuario = Depends(get_current_user)):
-    alerta = Alerta(**alerta_data.dict(), creado_por=current_user.id)
-    await db.alertas.insert_one(alerta.dict())
+    bovino = await db.bovinos.find_one({"id": alerta_data.bovino_id}, {"_id": 0, "finca_id": 1})
+    alerta = Alerta(**alerta_data.dict(), creado_por=current_user.id, finca_id=(bovino or {}).get("finca_id"))
+    # Manual alerts are never folded into another: the window is the alert itself
+    await raise_alerts([(alerta, alerta.id)])
     return alerta
 
 @api_router.get("/alertas", response_model=List[Alerta])
-async def get_alertas(activa: Optional[bool] = True, current_user: Usuario = Depends(get_current_user)):
+async def get_alertas(
+    response: Response,
+    activa: Optional[bool] = True,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
     query = {}
     if activa is not None:
         query["activa"] = activa
     
-    alertas = await db.alertas.find(query).sort("severidad", -1).to_list(1000)
-    return [Alerta(**alerta) for alerta in alertas]
+    sort = [("severidad", -1), ("id", -1)]
+    return await list_page(db.alertas, query, sort, Alerta, limit, cursor, response, stream)
 
 @api_router.put("/alertas/{alerta_id}/resolver")
 async def resolver_alerta(alerta_id: str, current_user: Usuario = Depends(get_current_user)):
-    result = await db.alertas.update_one(
-        {"id": alerta_id},
-        {"$set": {"activa": False, "resuelto_en": datetime.now(timezone.utc), "resuelto_por": current_user.id}}
+    alerta = await db.alertas.find_one_and_update(
+        {"id": alerta_id, "activa": True},
+        {"$set": {"activa": False, "resuelto_en": datetime.now(timezone.utc), "resuelto_por": current_user.id}},
+        projection={"_id": 0, "bovino_id": 1, "finca_id": 1}
     )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Alerta no encontrada")
+    if alerta is None:
+        if not await db.alertas.find_one({"id": alerta_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Alerta no encontrada")
+        return {"message": "Alerta resuelta"}
+    
+    finca_id = alerta.get("finca_id")
+    if finca_id is None:
+        bovino = await db.bovinos.find_one({"id": alerta["bovino_id"]}, {"_id": 0, "finca_id": 1})
+        finca_id = (bovino or {}).get("finca_id")
+    await bump_finca_stats(finca_id, {"alertas_activas": -1})
     return {"message": "Alerta resuelta"}
 
 # Potreros routes
 @api_router.post("/potreros", response_model=Potrero)
 async def create_potrero(potrero_data: PotreroCreate, current_user: Usuario = Depends(get_current_user)):
     potrero = Potrero(**potrero_data.dict())
-    await db.potreros.insert_one(potrero.dict())
+    with geometria_valida():
+        await db.potreros.insert_one(geo_doc("potreros", potrero.dict()))
+    geofence_cache.invalidate(potrero.finca_id)
     return potrero
 
 @api_router.get("/potreros", response_model=List[Potrero])
-async def get_potreros(finca_id: Optional[str] = None, current_user: Usuario = Depends(get_current_user)):
+async def get_potreros(
+    response: Response,
+    finca_id: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
     query = {}
     if finca_id:
         query["finca_id"] = finca_id
     
-    potreros = await db.potreros.find(query).to_list(1000)
-    return [Potrero(**potrero) for potrero in potreros]
+    return await list_page(db.potreros, query, [("id", 1)], Potrero, limit, cursor, response, stream)
 
-# Dashboard and reports
-@api_router.get("/dashboard/stats")
-async def get_dashboard_stats(current_user: Usuario = Depends(get_current_user)):
-    total_bovinos = await db.bovinos.count_documents({"estado_ganado": "activo"})
-    total_fincas = await db.fincas.count_documents({})
-    alertas_activas = await db.alertas.count_documents({"activa": True})
-    
-    # Bovinos por tipo
-    pipeline = [
-        {"$match": {"estado_ganado": "activo"}},
-        {"$group": {"_id": "$tipo_ganado", "count": {"$sum": 1}}}
-    ]
-    bovinos_por_tipo = await db.bovinos.aggregate(pipeline).to_list(10)
+@api_router.get("/potreros/ubicar", response_model=List[Potrero])
+async def ubicar_potrero(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    finca_id: Optional[str] = None,
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Potreros whose polygon contains a point"""
+    query = {"poligono_geo": {"$geoIntersects": {"$geometry": geo_punto({"lat": lat, "lng": lng})}}}
+    if finca_id:
+        query["finca_id"] = finca_id
+    potreros = await db.potreros.find(query, {"_id": 0, "poligono_geo": 0}).to_list(PAGE_SIZE_MAX)
+    return [Potrero(**p) for p in potreros]
+
+@api_router.get("/potreros/{potrero_id}/bovinos", response_model=List[Bovino])
+async def get_bovinos_en_potrero(
+    potrero_id: str,
+    response: Response,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Animals of the potrero's farm whose last position is inside its polygon"""
+    potrero = await db.potreros.find_one({"id": potrero_id}, {"_id": 0, "finca_id": 1, "poligono": 1, "poligono_geo": 1})
+    if not potrero:
+        raise HTTPException(status_code=404, detail="Potrero no encontrado")
+    poligono = potrero.get("poligono_geo") or geo_poligono(potrero["poligono"])
+    query = {"finca_id": potrero["finca_id"], "ultima_posicion_geo": {"$geoWithin": {"$geometry": poligono}}}
+    return await list_page(db.bovinos, query, [("id", 1)], Bovino, limit, cursor, response, stream)
+
+# GPS positions
+# Fixes are coalesced per worker and written every GPS_FLUSH_INTERVAL seconds in
+# two bulk writes: one conditional UpdateOne per animal that only moves
+# ultima_posicion forward in time (so late or replayed fixes, and other workers,
+# cannot roll it back), and one $push per animal and day into
+# posiciones_historial, whose documents hold that day's fixes as compact
+# [segundo_del_dia, lng, lat] triples.
+GPS_TOLERANCIA_FUTURO = timedelta(minutes=5)
+GPS_RECORRIDO_DIAS_MAX = 31
+GPS_RECORRIDO_PUNTOS_MAX = 2000
+
+def _inicio_dia(instante: datetime) -> datetime:
+    return instante.replace(hour=0, minute=0, second=0, microsecond=0)
+
+class PositionBuffer:
+    """Latest fix per bovino plus the fixes still to append to the history, flushed in bulk"""
+    def __init__(self):
+        self.ultimas: Dict[str, PosicionGPS] = {}
+        self.puntos: Dict[tuple, List[List[float]]] = {}  # (bovino_id, day) -> [[segundo, lng, lat]]
+        self.pendientes = 0
+        self.lock = asyncio.Lock()
+        self.task = None
+        self.counters = {"recibidas": 0, "actualizadas": 0, "obsoletas": 0, "historial": 0, "vaciados": 0, "errores": 0}
+        self.ultimo_vaciado_ms = 0.0
+
+    def _keep_latest(self, p: PosicionGPS):
+        actual = self.ultimas.get(p.bovino_id)
+        if actual is None or p.capturada_en > actual.capturada_en:
+            self.ultimas[p.bovino_id] = p
+
+    def add(self, posiciones: List[PosicionGPS]):
+        for p in posiciones:
+            self._keep_latest(p)
+            dia = _inicio_dia(p.capturada_en)
+            self.puntos.setdefault((p.bovino_id, dia), []).append(
+                [int((p.capturada_en - dia).total_seconds()), p.lng, p.lat]
+            )
+        self.pendientes += len(posiciones)
+        self.counters["recibidas"] += len(posiciones)
+
+    async def flush(self):
+        async with self.lock:
+            ultimas, puntos, pendientes = self.ultimas, self.puntos, self.pendientes
+            if not pendientes:
+                return
+            self.ultimas, self.puntos, self.pendientes = {}, {}, 0
+            inicio = time.perf_counter()
+            try:
+                await self._write(ultimas, puntos)
+            except pymongo.errors.PyMongoError:
+                # Keep the fixes for the next flush; history pushes are not idempotent,
+                # so a partial failure may repeat some points, which the track query drops
+                logger.exception(f"No se pudieron guardar {pendientes} posiciones, se reintentará")
+                self.counters["errores"] += 1
+                for p in ultimas.values():
+                    self._keep_latest(p)
+                for clave, lista in puntos.items():
+                    self.puntos.setdefault(clave, []).extend(lista)
+                self.pendientes += pendientes
+                return
+            self.counters["vaciados"] += 1
+            self.ultimo_vaciado_ms = (time.perf_counter() - inicio) * 1000
+            try:
+                await check_geofences(ultimas)
+            except Exception:
+                logger.exception("Error al evaluar geocercas")
+
+    async def _write(self, ultimas: Dict[str, PosicionGPS], puntos: Dict[tuple, List[List[float]]]):
+        resultado = await db.bovinos.bulk_write([
+            pymongo.UpdateOne(
+                {"id": bovino_id, "$or": [
+                    {"ultima_posicion_capturada_en": None},
+                    {"ultima_posicion_capturada_en": {"$lt": p.capturada_en}},
+                ]},
+                {"$set": {
+                    "ultima_posicion": {"lat": p.lat, "lng": p.lng},
+                    "ultima_posicion_geo": geo_punto({"lat": p.lat, "lng": p.lng}),
+                    "ultima_posicion_capturada_en": p.capturada_en,
+                }}
+            )
+            for bovino_id, p in ultimas.items()
+        ], ordered=False)
+        self.counters["actualizadas"] += resultado.modified_count
+        self.counters["obsoletas"] += len(ultimas) - resultado.matched_count
+        invalidate_scan(*ultimas)
+        
+        await db.posiciones_historial.bulk_write([
+            pymongo.UpdateOne(
+                {"bovino_id": bovino_id, "fecha": dia},
+                {"$push": {"puntos": {"$each": lista}}, "$inc": {"n": len(lista)}},
+                upsert=True
+            )
+            for (bovino_id, dia), lista in puntos.items()
+        ], ordered=False)
+        self.counters["historial"] += sum(len(lista) for lista in puntos.values())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(GPS_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Error al guardar posiciones")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {"pendientes": self.pendientes, "bovinos_pendientes": len(self.ultimas),
+                "ultimo_vaciado_ms": round(self.ultimo_vaciado_ms, 2), **self.counters}
+
+position_buffer = PositionBuffer()
+
+@api_router.post("/posiciones", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_posiciones(lote: LotePosiciones, current_user: Usuario = Depends(get_current_user)):
+    """Batched GPS fixes from collars and phones; they are stored within GPS_FLUSH_INTERVAL seconds"""
+    ids = list({p.bovino_id for p in lote.posiciones})
+    conocidos = {b["id"] async for b in db.bovinos.find({"id": {"$in": ids}}, {"_id": 0, "id": 1})}
+    # A fix from a clock far ahead would pin ultima_posicion until that time
+    limite = datetime.now(timezone.utc) + GPS_TOLERANCIA_FUTURO
+    aceptadas = [p for p in lote.posiciones if p.bovino_id in conocidos and p.capturada_en <= limite]
+    position_buffer.add(aceptadas)
+    if position_buffer.pendientes >= GPS_BUFFER_MAX:
+        await position_buffer.flush()
+    return {
+        "aceptadas": len(aceptadas),
+        "rechazadas": len(lote.posiciones) - len(aceptadas),
+        "bovinos_desconocidos": sorted(set(ids) - conocidos),
+    }
+
+def downsample_track(t: np.ndarray, lng: np.ndarray, lat: np.ndarray, intervalo_s: int):
+    """Sort fixes by time, drop repeated instants and keep the last fix of every `intervalo_s` window"""
+    t, unicos = np.unique(t, return_index=True)
+    lng, lat = lng[unicos], lat[unicos]
+    ventana = t // intervalo_s
+    ultimos = np.flatnonzero(np.append(ventana[1:] != ventana[:-1], True)) if t.size else unicos[:0]
+    return t[ultimos], lng[ultimos], lat[ultimos]
+
+@api_router.get("/bovinos/{bovino_id}/recorrido")
+async def get_recorrido(
+    bovino_id: str,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    intervalo_s: Optional[int] = Query(None, ge=1, le=86400),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Position history between two instants (default: the last 24 hours), one fix per
+    `intervalo_s` window; without it the window keeps the track under GPS_RECORRIDO_PUNTOS_MAX points"""
+    if not await db.bovinos.find_one({"id": bovino_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Bovino no encontrado")
+    hasta = en_utc(hasta) if hasta else datetime.now(timezone.utc)
+    desde = en_utc(desde) if desde else hasta - timedelta(days=1)
+    if desde >= hasta:
+        raise HTTPException(status_code=400, detail="desde debe ser anterior a hasta")
+    if hasta - desde > timedelta(days=GPS_RECORRIDO_DIAS_MAX):
+        raise HTTPException(status_code=400, detail=f"Máximo {GPS_RECORRIDO_DIAS_MAX} días por consulta")
+    if intervalo_s is None:
+        intervalo_s = max(1, -(-int((hasta - desde).total_seconds()) // GPS_RECORRIDO_PUNTOS_MAX))
     
-    # Bovinos por estado de venta
-    pipeline_venta = [
-        {"$match": {"estado_ganado": "activo"}},
-        {"$group": {"_id": "$estado_venta", "count": {"$sum": 1}}}
+    buckets = await db.posiciones_historial.find(
+        {"bovino_id": bovino_id, "fecha": {"$gte": _inicio_dia(desde), "$lte": hasta}},
+        {"_id": 0, "fecha": 1, "puntos": 1}
+    ).sort("fecha", 1).to_list(None)
+    columnas = [
+        np.asarray(b["puntos"], dtype=np.float64).reshape(-1, 3) + [en_utc(b["fecha"]).timestamp(), 0, 0]
+        for b in buckets
     ]
-    bovinos_por_venta = await db.bovinos.aggregate(pipeline_venta).to_list(10)
-    
-    # Production stats (last 30 days)
-    fecha_inicio = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
-    
-    produccion_leche_mes = await db.produccion_leche.aggregate([
-        {"$match": {"fecha_registro": {"$gte": fecha_inicio}}},
-        {"$group": {"_id": None, "total_litros": {"$sum": "$leche_litros"}}}
-    ]).to_list(1)
-    
-    total_litros_mes = produccion_leche_mes[0]["total_litros"] if produccion_leche_mes else 0
+    puntos = np.concatenate(columnas) if columnas else np.empty((0, 3))
+    en_rango = (puntos[:, 0] >= desde.timestamp()) & (puntos[:, 0] <= hasta.timestamp())
+    t, lng, lat = downsample_track(puntos[en_rango, 0].astype(np.int64), puntos[en_rango, 1], puntos[en_rango, 2], intervalo_s)
+    return {
+        "bovino_id": bovino_id,
+        "desde": desde,
+        "hasta": hasta,
+        "intervalo_s": intervalo_s,
+        "registradas": int(en_rango.sum()),
+        "puntos": [
+            {"capturada_en": datetime.fromtimestamp(s, timezone.utc), "lat": y, "lng": x}
+            for s, x, y in zip(t.tolist(), lng.tolist(), lat.tolist())
+        ],
+    }
+
+# Geofences
+# Perimeter and potrero polygons are prepared once per finca and cached here,
+# invalidated when the finca or its potreros change (the TTL bounds staleness
+# across workers). Every flush of the position buffer tests the animals it moved
+# against their farm and assigned potrero in one NumPy pass per finca.
+geofence_cache = LRUCache(GEOCERCA_CACHE_SIZE, ttl=GEOCERCA_CACHE_TTL)
+geofence_stats = {"evaluadas": 0, "fuera_finca": 0, "fuera_potrero": 0, "alertas": 0, "ultima_evaluacion_ms": 0.0}
+# Dedupe keys (one per animal, fence and day) this worker already raised, per
+# bovino; cleared once it is back inside. Keys carry the day, so they expire
+# after one.
+geofence_alertadas = LRUCache(GEOCERCA_ALERTADAS_SIZE, ttl=86400)
+# Fincas whose occupancy was recounted within the interval
+capacidad_revisada = LRUCache(GEOCERCA_CACHE_SIZE, ttl=GEOCERCA_CAPACIDAD_INTERVALO)
+
+async def geocercas_finca(finca_id: str) -> Dict:
+    geocercas = geofence_cache.get(finca_id)
+    if geocercas is None:
+        finca = await db.fincas.find_one({"id": finca_id}, {"_id": 0, "perimetro_geo": 1}) or {}
+        potreros = [p async for p in db.potreros.find(
+            {"finca_id": finca_id}, {"_id": 0, "id": 1, "nombre": 1, "capacidad_bovinos": 1, "poligono_geo": 1}
+        ).sort("id", 1) if p.get("poligono_geo")]
+        geocercas = {
+            "perimetro": preparar(finca_id, finca.get("perimetro_geo")),
+            "potreros": [preparar(p["id"], p["poligono_geo"]) for p in potreros],
+            "indice": {p["id"]: i for i, p in enumerate(potreros)},
+            "nombres": [p["nombre"] for p in potreros],
+            "capacidad": np.array([p.get("capacidad_bovinos") or 0 for p in potreros], dtype=np.int64),
+        }
+        geofence_cache.set(finca_id, geocercas)
+    return geocercas
+
+def _alerta_geocerca(bovino: Dict, motivo: str, detalle: str) -> tuple:
+    alerta = Alerta(
+        bovino_id=bovino["id"], finca_id=bovino["finca_id"], potrero_id=bovino.get("potrero_id"),
+        tipo_alerta=TipoAlerta.GEOCERCA, severidad=3,
+        titulo=f"Bovino {bovino['caravana']} fuera {detalle}",
+        mensaje=f"Última posición registrada fuera {detalle}",
+    )
+    return alerta, f"{motivo}:{fecha_hoy()}"
+
+async def check_geofences(ultimas: Dict[str, PosicionGPS]):
+    """Raise alerts for animals outside their farm or potrero, then recount occupancy where due"""
+    inicio = time.perf_counter()
+    bovinos = await db.bovinos.find(
+        {"id": {"$in": list(ultimas)}}, {"_id": 0, "id": 1, "finca_id": 1, "potrero_id": 1, "caravana": 1}
+    ).to_list(None)
+    por_finca = {}
+    for bovino in bovinos:
+        por_finca.setdefault(bovino["finca_id"], []).append(bovino)
     
+    alertas = []
+    for finca_id, grupo in por_finca.items():
+        geocercas = await geocercas_finca(finca_id)
+        if geocercas["perimetro"] is None and not geocercas["potreros"]:
+            continue
+        lng = np.array([ultimas[b["id"]].lng for b in grupo])
+        lat = np.array([ultimas[b["id"]].lat for b in grupo])
+        asignado = np.array([geocercas["indice"].get(b.get("potrero_id"), -1) for b in grupo], dtype=np.int64)
+        fuera_finca, fuera_potrero = evaluar(geocercas["perimetro"], geocercas["potreros"], asignado, lng, lat)
+        geofence_stats["evaluadas"] += len(grupo)
+        geofence_stats["fuera_finca"] += int(fuera_finca.sum())
+        geofence_stats["fuera_potrero"] += int(fuera_potrero.sum())
+        for bovino, finca_fuera, potrero_fuera in zip(grupo, fuera_finca, fuera_potrero):
+            if finca_fuera:
+                alerta, ventana = _alerta_geocerca(bovino, "finca", "de la finca")
+            elif potrero_fuera:
+                nombre = geocercas["nombres"][geocercas["indice"][bovino["potrero_id"]]]
+                alerta, ventana = _alerta_geocerca(bovino, f"potrero:{bovino['potrero_id']}", f"del potrero {nombre}")
+            else:
+                geofence_alertadas.invalidate(bovino["id"])
+                continue
+            alertadas = geofence_alertadas.get(bovino["id"])
+            if alertadas is None:
+                alertadas = set()
+                geofence_alertadas.set(bovino["id"], alertadas)
+            if ventana not in alertadas:
+                alertadas.add(ventana)
+                alertas.append((alerta, ventana))
+        alertas.extend(await check_capacity(finca_id, geocercas))
+    geofence_stats["alertas"] += await raise_alerts(alertas)
+    geofence_stats["ultima_evaluacion_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+
+async def check_capacity(finca_id: str, geocercas: Dict) -> List[tuple]:
+    """Over-capacity alerts for the finca's potreros, counting active animals by last position"""
+    if not (geocercas["capacidad"] > 0).any() or capacidad_revisada.get(finca_id) is not None:
+        return []
+    capacidad_revisada.set(finca_id, True)
+    posiciones = await db.bovinos.find(
+        {"finca_id": finca_id, "estado_ganado": EstadoGanado.ACTIVO, "ultima_posicion_geo": {"$ne": None}},
+        {"_id": 0, "ultima_posicion_geo.coordinates": 1}
+    ).to_list(None)
+    coordenadas = np.array([p["ultima_posicion_geo"]["coordinates"] for p in posiciones], dtype=np.float64).reshape(-1, 2)
+    conteo = ocupacion(geocercas["potreros"], coordenadas[:, 0], coordenadas[:, 1])
+    alertas = []
+    for i in np.flatnonzero((geocercas["capacidad"] > 0) & (conteo > geocercas["capacidad"])):
+        potrero = geocercas["potreros"][i]
+        alertas.append((Alerta(
+            finca_id=finca_id, potrero_id=potrero.id, tipo_alerta=TipoAlerta.CAPACIDAD_POTRERO, severidad=2,
+            titulo=f"Potrero {geocercas['nombres'][i]} sobre su capacidad",
+            mensaje=f"{conteo[i]} bovinos para una capacidad de {geocercas['capacidad'][i]}",
+        ), fecha_hoy()))
+    return alertas
+
+# Scheduled alert rules
+# Alerts that depend on time passing rather than on a write. One worker at a
+# time holds the "programador_alertas" lock in "bloqueos" and runs each rule of
+# ALERT_RULES when its interval is up. Rules sweep their due items through an
+# index in batches of ALERT_RULES_LOTE and raise alerts through raise_alerts
+# without counting occurrences, so a rerun (or another worker taking over) is
+# harmless.
+ALERT_RULES_LOTE = 500
+# Severity an active alert is raised to once its fecha_vencimiento is this many days away
+ESCALADO_VENCIMIENTO = [(7, 2), (0, 3)]
+SEGUIMIENTO_MEDICO_DIAS = 30
+FALTA_LECHE_DIAS = 2
+FALTA_LECHE_VENTANA_DIAS = 30
+CHEQUEO_GESTACION_EDAD_MESES = 15
+CHEQUEO_GESTACION_DIAS = 90
+
+class LeaderLock:
+    """A lease in "bloqueos" held by one worker at a time; acquire() also renews it"""
+    def __init__(self, nombre: str, ttl: float):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.duenio = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def acquire(self) -> bool:
+        ahora = datetime.now(timezone.utc)
+        try:
+            await db.bloqueos.update_one(
+                {"id": self.nombre, "$or": [{"duenio": self.duenio}, {"hasta": {"$lt": ahora}}]},
+                {"$set": {"duenio": self.duenio, "hasta": ahora + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+            return True
+        except pymongo.errors.DuplicateKeyError:
+            return False  # held by another worker
+
+    async def release(self):
+        await db.bloqueos.delete_one({"id": self.nombre, "duenio": self.duenio})
+
+async def _en_lotes(coleccion: str, query: Dict, sort: List[tuple], projection: Dict):
+    """Yield the matching documents ALERT_RULES_LOTE at a time, by keyset on `sort`"""
+    despues = None
+    while True:
+        filtro = {"$and": [query, keyset_filter(sort, despues)]} if despues else query
+        lote = await db[coleccion].find(filtro, projection).sort(sort).limit(ALERT_RULES_LOTE).to_list(ALERT_RULES_LOTE)
+        if not lote:
+            return
+        yield lote
+        if len(lote) < ALERT_RULES_LOTE:
+            return
+        despues = [lote[-1][campo] for campo, _ in sort]
+
+async def _bovinos_por_id(ids: List[str], query: Optional[Dict] = None) -> Dict[str, Dict]:
     return {
-        "total_bovinos": total_bovinos,
-        "total_fincas": total_fincas,
-        "alertas_activas": alertas_activas,
-        "bovinos_por_tipo": bovinos_por_tipo,
-        "bovinos_por_venta": bovinos_por_venta,
-        "total_litros_mes": total_litros_mes
+        b["id"]: b async for b in db.bovinos.find(
+            {"id": {"$in": ids}, **(query or {})}, {"_id": 0, "id": 1, "finca_id": 1, "nombre": 1, "caravana": 1}
+        )
     }
 
-@api_router.get("/reportes/produccion-leche/{bovino_id}")
-async def get_reporte_produccion_leche(bovino_id: str, current_user: Usuario = Depends(get_current_user)):
-    # Get bovino info
-    bovino = await db.bovinos.find_one({"id": bovino_id})
+async def escalar_vencimientos() -> int:
+    """Raise the severity of active alerts as their fecha_vencimiento nears"""
+    escaladas = 0
+    for dias, severidad in ESCALADO_VENCIMIENTO:
+        query = {"activa": True, "fecha_vencimiento": {"$lte": fecha_hoy(dias)}, "severidad": {"$lt": severidad}}
+        while True:
+            # Updated alerts leave the filter, so each batch starts from the top
+            lote = await db.alertas.find(query, {"_id": 1}).sort("fecha_vencimiento", 1).limit(ALERT_RULES_LOTE).to_list(ALERT_RULES_LOTE)
+            if not lote:
+                break
+            resultado = await db.alertas.update_many(
+                {"_id": {"$in": [a["_id"] for a in lote]}}, {"$max": {"severidad": severidad}}
+            )
+            escaladas += resultado.modified_count
+    return escaladas
+
+async def alertar_seguimientos_medicos() -> int:
+    """vencimiento_medico alerts for records whose next date falls within SEGUIMIENTO_MEDICO_DIAS"""
+    creadas = 0
+    query = {"fecha_proxima": {"$gte": fecha_hoy(), "$lte": fecha_hoy(SEGUIMIENTO_MEDICO_DIAS)}}
+    projection = {"_id": 0, "id": 1, "bovino_id": 1, "tipo_registro": 1, "fecha_proxima": 1}
+    async for lote in _en_lotes("registros_medicos", query, [("fecha_proxima", 1), ("id", 1)], projection):
+        bovinos = await _bovinos_por_id(list({r["bovino_id"] for r in lote}), {"estado_ganado": EstadoGanado.ACTIVO})
+        creadas += await raise_alerts([
+            followup_alert(registro, bovinos[registro["bovino_id"]]) for registro in lote if registro["bovino_id"] in bovinos
+        ], ocurrencia=False)
+    return creadas
+
+async def alertar_falta_leche() -> int:
+    """falta_leche alerts for milking animals whose last record is FALTA_LECHE_DIAS or more days old"""
+    creadas = 0
+    query = {"ultima_fecha": {"$gte": fecha_hoy(-FALTA_LECHE_VENTANA_DIAS), "$lte": fecha_hoy(-FALTA_LECHE_DIAS)}}
+    projection = {"_id": 0, "bovino_id": 1, "ultima_fecha": 1}
+    async for lote in _en_lotes("estadisticas_produccion", query, [("ultima_fecha", 1), ("bovino_id", 1)], projection):
+        bovinos = await _bovinos_por_id([e["bovino_id"] for e in lote], {
+            "estado_ganado": EstadoGanado.ACTIVO, "tipo_ganado": {"$in": [TipoGanado.LECHE, TipoGanado.DUAL]}
+        })
+        creadas += await raise_alerts([
+            (Alerta(
+                bovino_id=e["bovino_id"], finca_id=bovinos[e["bovino_id"]]["finca_id"],
+                tipo_alerta=TipoAlerta.FALTA_LECHE, severidad=2,
+                titulo="Sin registro de leche",
+                mensaje=f"{bovinos[e['bovino_id']].get('nombre') or bovinos[e['bovino_id']]['caravana']} "
+                        f"no tiene registros de leche desde {e['ultima_fecha']}",
+            ), e["ultima_fecha"])
+            for e in lote if e["bovino_id"] in bovinos
+        ], ocurrencia=False)
+    return creadas
+
+async def alertar_chequeo_gestacion() -> int:
+    """chequeo_gestacion alerts, once per CHEQUEO_GESTACION_DIAS period, for breeding-age females
+    without an exam in that many days"""
+    creadas = 0
+    desde_examen = fecha_hoy(-CHEQUEO_GESTACION_DIAS)
+    periodo = date.today().toordinal() // CHEQUEO_GESTACION_DIAS
+    query = {
+        "estado_ganado": EstadoGanado.ACTIVO, "sexo": Sexo.HEMBRA,
+        "fecha_nacimiento": {"$lte": fecha_hoy(-CHEQUEO_GESTACION_EDAD_MESES * 30)},
+        "tipo_ganado": {"$in": [TipoGanado.LECHE, TipoGanado.DUAL]},
+    }
+    projection = {"_id": 0, "id": 1, "finca_id": 1, "nombre": 1, "caravana": 1, "fecha_nacimiento": 1}
+    async for lote in _en_lotes("bovinos", query, [("fecha_nacimiento", 1), ("id", 1)], projection):
+        examinadas = {
+            r["bovino_id"] async for r in db.registros_medicos.find(
+                {"bovino_id": {"$in": [b["id"] for b in lote]}, "tipo_registro": TipoRegistroMedico.EXAMEN,
+                 "fecha_evento": {"$gte": desde_examen}},
+                {"_id": 0, "bovino_id": 1}
+            )
+        }
+        creadas += await raise_alerts([
+            (Alerta(
+                bovino_id=b["id"], finca_id=b["finca_id"],
+                tipo_alerta=TipoAlerta.CHEQUEO_GESTACION, severidad=2,
+                titulo="Chequeo de gestación",
+                mensaje=f"{b.get('nombre') or b['caravana']} no tiene exámenes en {CHEQUEO_GESTACION_DIAS} días",
+                fecha_vencimiento=fecha_hoy(7),
+            ), str(periodo))
+            for b in lote if b["id"] not in examinadas
+        ], ocurrencia=False)
+    return creadas
+
+# Every scheduled rule, with how often it runs (seconds)
+ALERT_RULES = [
+    {"nombre": "escalar_vencimientos", "intervalo": 3600, "ejecutar": escalar_vencimientos},
+    {"nombre": "seguimientos_medicos", "intervalo": 3600, "ejecutar": alertar_seguimientos_medicos},
+    {"nombre": "falta_leche", "intervalo": 3600, "ejecutar": alertar_falta_leche},
+    {"nombre": "chequeo_gestacion", "intervalo": 6 * 3600, "ejecutar": alertar_chequeo_gestacion},
+]
+
+class AlertScheduler:
+    """Runs ALERT_RULES on the worker holding the leader lock, with per-rule timings"""
+    def __init__(self, reglas: List[Dict]):
+        self.reglas = reglas
+        self.lock = LeaderLock("programador_alertas", ALERT_SCHEDULER_TICK * 3)
+        self.lider = False
+        self.proxima: Dict[str, float] = {}
+        self.task = None
+        self.metricas = {
+            regla["nombre"]: {"ejecuciones": 0, "errores": 0, "alertas": 0, "ultima_ms": 0.0, "total_ms": 0.0,
+                              "ultima_ejecucion": None}
+            for regla in reglas
+        }
+
+    async def run_rule(self, regla: Dict):
+        metricas = self.metricas[regla["nombre"]]
+        inicio = time.perf_counter()
+        try:
+            metricas["alertas"] += await regla["ejecutar"]()
+        except Exception:
+            metricas["errores"] += 1
+            logger.exception(f"Regla de alertas {regla['nombre']} falló")
+        duracion = (time.perf_counter() - inicio) * 1000
+        metricas["ejecuciones"] += 1
+        metricas["ultima_ms"] = round(duracion, 2)
+        metricas["total_ms"] = round(metricas["total_ms"] + duracion, 2)
+        metricas["ultima_ejecucion"] = datetime.now(timezone.utc)
+
+    async def tick(self):
+        for regla in self.reglas:
+            # Renew the lease before every rule; stop if another worker took over
+            self.lider = await self.lock.acquire()
+            if not self.lider:
+                self.proxima.clear()
+                return
+            if time.monotonic() >= self.proxima.get(regla["nombre"], 0):
+                await self.run_rule(regla)
+                self.proxima[regla["nombre"]] = time.monotonic() + regla["intervalo"]
+
+    async def run(self):
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en el programador de alertas")
+            await asyncio.sleep(ALERT_SCHEDULER_TICK)
+
+    async def run_all(self):
+        """Run every rule once, without the lock (management command)"""
+        for regla in self.reglas:
+            await self.run_rule(regla)
+            logger.info(f"{regla['nombre']}: {self.metricas[regla['nombre']]}")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.lider:
+            await self.lock.release()
+
+    def stats(self) -> Dict:
+        return {"lider": self.lider, "reglas": self.metricas}
+
+alert_scheduler = AlertScheduler(ALERT_RULES)
+
+# Live updates
+# GET /api/eventos streams changes to alertas, bovinos, the production collections
+# and the dashboard counters as Server-Sent Events. Each worker tails a single
+# change stream and keeps its last EVENTOS_BUFFER events, already encoded, in a
+# ring; every subscriber reads the ring at its own pace, so adding one costs no
+# database work. Event ids are resume tokens: a client reconnecting with
+# Last-Event-ID is replayed from the ring, or from a stream of its own when the
+# token is older than the ring, until it catches up (delivery is at least once).
+# Inserts carry the document and updates only the changed fields. Updates and
+# deletes find their finca through pre-images, which ensure_indexes turns on
+# (MongoDB 6.0+); production rows are mapped to a finca through their bovino.
+# Time-series collections cannot be watched, so in that mode production reaches
+# clients as the daily totals in estadisticas_finca.
+EVENTOS_COLECCIONES = ["alertas", "bovinos", "estadisticas_finca"] + (
+    [] if PRODUCCION_TIMESERIES else [COLECCION_LECHE, COLECCION_ENGORDE]
+)
+# Fields never sent to clients: Mongo ids, dedupe keys, stored QR images and GeoJSON copies
+EVENTOS_OCULTOS = {"_id", "clave", "qr_clave", *(destino for campos in GEO_CAMPOS.values() for destino in campos.values())}
+CHANGE_STREAM_HISTORY_LOST = 286
+finca_de_bovino_cache = LRUCache(EVENTOS_BUFFER, ttl=300)
+
+async def enable_change_preimages():
+    """Record pre-images on the watched collections so update and delete events keep their finca"""
+    for coleccion in EVENTOS_COLECCIONES:
+        try:
+            await db.command("collMod", coleccion, changeStreamPreAndPostImages={"enabled": True})
+        except pymongo.errors.OperationFailure as e:
+            logger.warning(f"{coleccion}: eventos de cambios y borrados sin finca, no hay pre-imágenes ({e})")
+
+def _eventos_pipeline(colecciones: List[str]) -> List[Dict]:
+    return [
+        {"$match": {"ns.coll": {"$in": colecciones}, "operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+        {"$project": {
+            "operationType": 1, "ns.coll": 1, "fullDocument": 1,
+            "updateDescription.updatedFields": 1, "updateDescription.removedFields": 1,
+            "fullDocumentBeforeChange.id": 1, "fullDocumentBeforeChange.finca_id": 1, "fullDocumentBeforeChange.bovino_id": 1,
+        }},
+    ]
+
+def _visible(campo: str) -> bool:
+    return campo.split(".", 1)[0] not in EVENTOS_OCULTOS
+
+async def finca_de_bovino(bovino_id: str) -> Optional[str]:
+    finca_id = finca_de_bovino_cache.get(bovino_id)
+    if finca_id is None:
+        bovino = await db.bovinos.find_one({"id": bovino_id}, {"_id": 0, "finca_id": 1})
+        finca_id = (bovino or {}).get("finca_id")
+        if finca_id is not None:
+            finca_de_bovino_cache.set(bovino_id, finca_id)
+    return finca_id
+
+def sse_message(evento: str, datos: Any, id: Optional[str] = None) -> bytes:
+    mensaje = b"id: " + id.encode() + b"\n" if id else b""
+    return mensaje + b"event: " + evento.encode() + b"\ndata: " + dumps_json(datos) + b"\n\n"
+
+async def change_event(cambio: Dict) -> Optional[tuple]:
+    """(token, finca_id, SSE message) for a change stream event; None when it has nothing to show"""
+    op = cambio["operationType"]
+    doc = cambio.get("fullDocument") or cambio.get("fullDocumentBeforeChange") or {}
+    evento = {"op": op, "id": doc.get("id") or doc.get("finca_id")}
+    if op in ("insert", "replace"):
+        evento["doc"] = {campo: valor for campo, valor in doc.items() if _visible(campo)}
+    elif op == "update":
+        cambios = cambio.get("updateDescription") or {}
+        evento["cambios"] = {campo: valor for campo, valor in cambios.get("updatedFields", {}).items() if _visible(campo)}
+        quitados = [campo for campo in cambios.get("removedFields", []) if _visible(campo)]
+        if quitados:
+            evento["quitados"] = quitados
+        elif not evento["cambios"]:
+            return None
+    finca_id = doc.get("finca_id")
+    if finca_id is None and doc.get("bovino_id"):
+        finca_id = await finca_de_bovino(doc["bovino_id"])
+    token = cambio["_id"]["_data"]
+    return token, finca_id, sse_message(cambio["ns"]["coll"], evento, token)
+
+class ChangeFeed:
+    """One change stream per worker, fanned out to SSE subscribers through a ring of recent events"""
+    def __init__(self, colecciones: List[str], capacidad: int):
+        self.colecciones = colecciones
+        self.capacidad = capacidad
+        self.anillo: List[Optional[tuple]] = [None] * capacidad  # (token, finca_id, message)
+        self.posiciones: Dict[str, int] = {}  # resume token -> sequence number, for the events in the ring
+        self.secuencia = 0  # events published so far; event n sits at anillo[n % capacidad]
+        self.nuevo = asyncio.Event()
+        self.token: Optional[str] = None
+        self.disponible = False
+        self.suscriptores = 0
+        self.task = None
+        self.metricas = {"publicados": 0, "reanudados_anillo": 0, "reanudados_stream": 0, "rezagados": 0, "errores": 0}
+
+    def watch(self, token: Optional[str]):
+        return db.watch(
+            _eventos_pipeline(self.colecciones), resume_after={"_data": token} if token else None,
+            full_document_before_change="whenAvailable"
+        )
+
+    def publish(self, token: Optional[str], finca_id: Optional[str], mensaje: bytes):
+        self.secuencia += 1
+        indice = self.secuencia % self.capacidad
+        if self.anillo[indice] is not None:
+            self.posiciones.pop(self.anillo[indice][0], None)
+        self.anillo[indice] = (token, finca_id, mensaje)
+        if token:
+            self.posiciones[token] = self.secuencia
+        self.metricas["publicados"] += 1
+        self.nuevo.set()
+        self.nuevo = asyncio.Event()
+
+    def read(self, visto: int) -> tuple:
+        """Events after sequence number `visto` still in the ring, and whether older ones fell out of it"""
+        primero = max(visto + 1, self.secuencia - self.capacidad + 1)
+        return [self.anillo[n % self.capacidad] for n in range(primero, self.secuencia + 1)], primero > visto + 1
+
+    async def run(self):
+        espera = 1
+        while True:
+            try:
+                async with self.watch(self.token) as stream:
+                    self.disponible = True
+                    espera = 1
+                    async for cambio in stream:
+                        self.token = cambio["_id"]["_data"]
+                        evento = await change_event(cambio)
+                        if evento:
+                            self.publish(*evento)
+            except asyncio.CancelledError:
+                raise
+            except pymongo.errors.OperationFailure as e:
+                self.metricas["errores"] += 1
+                if e.code != CHANGE_STREAM_HISTORY_LOST:
+                    logger.error(f"Eventos en vivo no disponibles: {e}")
+                    self.disponible = False
+                    return
+                # Down longer than the oplog window: start over and have clients reload
+                logger.warning("Eventos en vivo: se perdió el punto de reanudación, se reinicia el stream")
+                self.token = None
+                self.publish(None, None, sse_message("reinicio", {}))
+                continue
+            except pymongo.errors.PyMongoError as e:
+                self.metricas["errores"] += 1
+                logger.warning(f"Eventos en vivo: stream interrumpido ({e}), reintentando en {espera}s")
+            self.disponible = False
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 30)
+
+    async def replay(self, desde: str, fincas: Optional[set]):
+        """Events after resume token `desde` from a stream of our own, until they reach the ring.
+        Yields SSE messages, then the sequence number to continue from in the ring."""
+        self.metricas["reanudados_stream"] += 1
+        try:
+            async with self.watch(desde) as stream:
+                while True:
+                    visto = self.secuencia
+                    cambio = await stream.try_next()
+                    if cambio is None:
+                        # Nothing newer in the oplog than what the ring held a moment ago
+                        yield visto
+                        return
+                    evento = await change_event(cambio)
+                    if evento and (fincas is None or evento[1] in fincas):
+                        yield evento[2]
+                    if cambio["_id"]["_data"] in self.posiciones:
+                        yield self.posiciones[cambio["_id"]["_data"]]
+                        return
+        except pymongo.errors.OperationFailure as e:
+            if e.code != CHANGE_STREAM_HISTORY_LOST:
+                raise
+            yield sse_message("reinicio", {})
+            yield self.secuencia
+
+    async def subscribe(self, fincas: Optional[set], desde: Optional[str] = None):
+        """SSE messages for the fincas in `fincas` (all when None), resuming after token `desde`"""
+        self.suscriptores += 1
+        try:
+            visto = self.secuencia
+            if desde in self.posiciones:
+                self.metricas["reanudados_anillo"] += 1
+                visto = self.posiciones[desde]
+            elif desde:
+                async for mensaje in self.replay(desde, fincas):
+                    if isinstance(mensaje, int):
+                        visto = mensaje
+                    else:
+                        yield mensaje
+            while True:
+                nuevo = self.nuevo
+                eventos, perdidos = self.read(visto)
+                visto = self.secuencia
+                if perdidos:
+                    # Too slow for the ring: the client reloads instead of seeing a gap
+                    self.metricas["rezagados"] += 1
+                    yield sse_message("reinicio", {})
+                for token, finca_id, mensaje in eventos:
+                    if token is None or fincas is None or finca_id in fincas:
+                        yield mensaje
+                if not eventos:
+                    try:
+                        await asyncio.wait_for(nuevo.wait(), EVENTOS_KEEPALIVE)
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+        finally:
+            self.suscriptores -= 1
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        self.disponible = False
+
+    def stats(self) -> Dict:
+        return {
+            "disponible": self.disponible, "suscriptores": self.suscriptores,
+            "en_anillo": min(self.secuencia, self.capacidad), **self.metricas,
+        }
+
+change_feed = ChangeFeed(EVENTOS_COLECCIONES, EVENTOS_BUFFER)
+
+@api_router.get("/eventos")
+async def stream_eventos(
+    finca_id: Optional[List[str]] = Query(None),
+    desde: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Server-Sent Events with live changes, limited to the given fincas (repeat finca_id) if any.
+    Reconnecting with Last-Event-ID (or ?desde=) resumes after that event; a "reinicio"
+    event means some were lost and the client should reload its data."""
+    if not change_feed.disponible:
+        raise HTTPException(status_code=503, detail="Eventos en vivo no disponibles")
+    return StreamingResponse(
+        change_feed.subscribe(set(finca_id) if finca_id else None, last_event_id or desde),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Dashboard and reports
+@api_router.get("/dashboard/stats")
+async def get_dashboard_stats(finca_id: Optional[str] = None, current_user: Usuario = Depends(get_current_user)):
+    return await repo.dashboard_stats(finca_id, DASHBOARD_DIAS)
+
+# Production report series: chart labels
+SERIES_PRODUCCION = {
+    "leche": {"titulo": "Producción Láctea", "unidad": "Litros"},
+    "engorde": {"titulo": "Control de Peso", "unidad": "Kg"},
+}
+REPORTE_DIAS = 90
+REPORTE_PUNTOS_MAX = 100
+# Bump when render_series_chart output changes so cached charts and ETags roll over
+CHART_RENDER_VERSION = "1"
+chart_cache = LRUCache(CHART_CACHE_SIZE)
+# spawn keeps the event loop and Mongo client threads out of the workers
+chart_executor = ProcessPoolExecutor(max_workers=CHART_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+_chart_inflight: Dict[str, asyncio.Future] = {}
+
+def wants_json(formato: Optional[str], accept: Optional[str]) -> bool:
+    if formato:
+        return formato == "json"
+    return bool(accept) and "application/json" in accept and "image/png" not in accept
+
+async def reporte_produccion(bovino_id: str, serie: str, formato: Optional[str],
+                             accept: Optional[str], if_none_match: Optional[str]):
+    """Last REPORTE_DIAS days of a series, as JSON points or a cached PNG chart"""
+    config = SERIES_PRODUCCION[serie]
+    bovino = await repo.get_bovino(bovino_id)
     if not bovino:
         raise HTTPException(status_code=404, detail="Bovino no encontrado")
     
-    # Get production data (last 90 days)
-    fecha_inicio = (datetime.now() - timedelta(days=90)).strftime("%Y-%m-%d")
-    produccion = await db.produccion_leche.find({
-        "bovino_id": bovino_id,
-        "fecha_registro": {"$gte": fecha_inicio}
-    }).sort("fecha_registro", 1).to_list(100)
+    hoy = datetime.now()
+    produccion = (await repo.reporte_produccion(
+        bovino_id, (hoy - timedelta(days=REPORTE_DIAS)).strftime("%Y-%m-%d"), hoy.strftime("%Y-%m-%d"), [serie]
+    ))[serie][:REPORTE_PUNTOS_MAX]
     
     if not produccion:
         return {"message": "No hay datos de producción"}
     
-    # Generate chart
-    dates = [p["fecha_registro"] for p in produccion]
-    litros = [p["leche_litros"] for p in produccion]
+    fechas = [p["fecha_registro"] for p in produccion]
+    valores = [p["valor"] for p in produccion]
     
-    plt.figure(figsize=(12, 6))
-    plt.plot(dates, litros, marker='o', linewidth=2, markersize=4)
-    plt.title(f'Producción Láctea - {bovino["nombre"] or bovino["caravana"]}', fontsize=16)
-    plt.xlabel('Fecha', fontsize=12)
-    plt.ylabel('Litros', fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    if wants_json(formato, accept):
+        return {
+            "bovino_id": bovino_id,
+            "serie": serie,
+            "unidad": config["unidad"],
+            "puntos": [{"fecha": f, "valor": v} for f, v in zip(fechas, valores)],
+        }
     
-    # Save to buffer
-    buffer = BytesIO()
-    plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-    buffer.seek(0)
-    plt.close()
+    # Records are only ever appended or dropped with the animal, so the window
+    # bounds and size identify the data; the title covers renames
+    titulo = f'{config["titulo"]} - {bovino.get("nombre") or bovino["caravana"]}'
+    key = hashlib.sha256(
+        f"{CHART_RENDER_VERSION}:{bovino_id}:{serie}:{fechas[0]}:{fechas[-1]}:{len(fechas)}:{titulo}".encode()
+    ).hexdigest()[:32]
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    image = await render_cached(
+        chart_cache, _chart_inflight, key, chart_executor,
+        render_series_chart, titulo, config["unidad"], fechas, valores
+    )
+    return Response(content=image, media_type="image/png", headers=headers)
+
+@api_router.get("/reportes/produccion-leche/{bovino_id}")
+async def get_reporte_produccion_leche(
+    bovino_id: str,
+    formato: Optional[str] = Query(None, pattern="^(png|json)$"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    current_user: Usuario = Depends(get_current_user)
+):
+    return await reporte_produccion(bovino_id, "leche", formato, accept, if_none_match)
+
+@api_router.get("/reportes/produccion-engorde/{bovino_id}")
+async def get_reporte_produccion_engorde(
+    bovino_id: str,
+    formato: Optional[str] = Query(None, pattern="^(png|json)$"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    current_user: Usuario = Depends(get_current_user)
+):
+    return await reporte_produccion(bovino_id, "engorde", formato, accept, if_none_match)
+
+@api_router.get("/reportes/produccion-mensual")
+async def get_reporte_produccion_mensual(
+    finca_id: Optional[List[str]] = Query(None),
+    desde: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    hasta: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Monthly milk production per finca (v_produccion_lactea_mensual); Mongo reads the rollups"""
+    return await repo.produccion_mensual(finca_id, desde, hasta)
+
+# Herd analytics
+ANALITICA_DIAS = 365
+ANALITICA_DIAS_MAX = 3 * 365
+analytics_cache = LRUCache(ANALYTICS_CACHE_SIZE)
+
+async def serie_columnas(coleccion: str, codigos: Dict[str, int], desde: str, campos: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """Records of the given animals since `desde` as NumPy columns: bovino code, day number and `campos` (None -> NaN)"""
+    bovino, fechas = [], []
+    columnas = {nombre: [] for nombre in campos}
+    async for doc in db[coleccion].find(
+        {"bovino_id": {"$in": list(codigos)}, CAMPO_FECHA: {"$gte": fecha_serie(desde)}},
+        {"_id": 0, "bovino_id": 1, "fecha_registro": 1, **{campo: 1 for campo in campos.values()}},
+        batch_size=JOB_BATCH_SIZE
+    ):
+        bovino.append(codigos[doc["bovino_id"]])
+        fechas.append(doc["fecha_registro"])
+        for nombre, campo in campos.items():
+            columnas[nombre].append(doc.get(campo))
+    return {
+        "bovino": np.array(bovino, dtype=np.int64),
+        "dia": dias(fechas),
+        **{nombre: np.array(valores, dtype=np.float64) for nombre, valores in columnas.items()},
+    }
+
+@api_router.get("/reportes/analitica/{finca_id}")
+async def get_analitica_finca(
+    finca_id: str,
+    dias_historial: int = Query(ANALITICA_DIAS, alias="dias", ge=1, le=ANALITICA_DIAS_MAX),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Milk, lactation, quality and weight-gain summary of a finca's herd"""
+    if not await db.fincas.find_one({"id": finca_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Finca no encontrada")
     
-    return StreamingResponse(buffer, media_type="image/png")
+    stats = await db.estadisticas_finca.find_one({"finca_id": finca_id}, {"_id": 0, "version": 1})
+    version = (stats or {}).get("version", 0)
+    key = (finca_id, dias_historial, version)
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    ids = [b["id"] async for b in db.bovinos.find({"finca_id": finca_id}, {"_id": 0, "id": 1})]
+    codigos = {bovino_id: i for i, bovino_id in enumerate(ids)}
+    desde = (datetime.now() - timedelta(days=dias_historial)).strftime("%Y-%m-%d")
+    leche, engorde = await asyncio.gather(
+        serie_columnas(COLECCION_LECHE, codigos, desde,
+                       {"litros": "leche_litros", "grasa": "grasa_pct", "proteina": "proteina_pct"}),
+        serie_columnas(COLECCION_ENGORDE, codigos, desde, {"peso": "peso_kg"}),
+    )
+    resumen = await asyncio.to_thread(herd_summary, ids, leche, engorde)
+    
+    resultado = {
+        "finca_id": finca_id,
+        "desde": desde,
+        "dias": dias_historial,
+        "bovinos": len(ids),
+        "version": version,
+        "generado_en": datetime.now(timezone.utc).isoformat(),
+        **resumen,
+    }
+    analytics_cache.set(key, resultado)
+    return resultado
+
+# PDF reports
+# Each report streams its rows from a cursor into an NDJSON spool file, which
+# pdf_executor turns into a PDF one page at a time. Small reports are returned
+# inline; large ones run as a "reporte_pdf" job and are downloaded afterwards.
+pdf_executor = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+async def bovino_nombres(finca_id: str, **filtro) -> Dict[str, Dict]:
+    """caravana and nombre of a finca's bovinos by id"""
+    return {
+        b["id"]: b async for b in db.bovinos.find(
+            {"finca_id": finca_id, **filtro}, {"_id": 0, "id": 1, "caravana": 1, "nombre": 1}
+        )
+    }
+
+async def contar_bovinos(finca_id: str, parametros: Dict) -> int:
+    return await db.bovinos.count_documents({"finca_id": finca_id})
+
+async def filas_inventario(finca_id: str, parametros: Dict):
+    async for b in db.bovinos.find({"finca_id": finca_id}, {"_id": 0}, batch_size=JOB_BATCH_SIZE).sort("caravana", 1):
+        yield [b["caravana"], b.get("arete_oficial"), b.get("nombre"), b.get("sexo"), b.get("raza"),
+               b.get("tipo_ganado"), b.get("estado_ganado"), b.get("estado_venta"),
+               b.get("fecha_nacimiento"), b.get("peso_kg")]
+
+async def contar_historial_medico(finca_id: str, parametros: Dict) -> int:
+    activos = await bovino_nombres(finca_id, estado_ganado=EstadoGanado.ACTIVO.value)
+    return await db.registros_medicos.count_documents({"bovino_id": {"$in": list(activos)}})
+
+async def filas_historial_medico(finca_id: str, parametros: Dict):
+    """Rows shaped like v_historial_medico_completo: records of the finca's active animals, newest first"""
+    activos = await bovino_nombres(finca_id, estado_ganado=EstadoGanado.ACTIVO.value)
+    async for r in db.registros_medicos.find(
+        {"bovino_id": {"$in": list(activos)}}, {"_id": 0}, batch_size=JOB_BATCH_SIZE
+    ).sort([("fecha_evento", -1), ("id", -1)]):
+        bovino = activos[r["bovino_id"]]
+        yield [r["fecha_evento"], bovino["caravana"], bovino.get("nombre"), r["tipo_registro"],
+               r.get("descripcion"), r.get("medicamento"), r.get("dosis"), r.get("fecha_proxima"),
+               r.get("costo"), r.get("veterinario_nombre")]
+
+async def filas_produccion(finca_id: str, parametros: Dict):
+    """Milk and weight summary per animal over the last `dias` days, JOB_BATCH_SIZE animals per query"""
+    desde = fecha_serie((datetime.now() - timedelta(days=parametros.get("dias", REPORTE_DIAS))).strftime("%Y-%m-%d"))
+    cursor = db.bovinos.find(
+        {"finca_id": finca_id}, {"_id": 0, "id": 1, "caravana": 1, "nombre": 1, "tipo_ganado": 1, "peso_kg": 1},
+        batch_size=JOB_BATCH_SIZE
+    ).sort("caravana", 1)
+    while lote := await cursor.to_list(JOB_BATCH_SIZE):
+        ids = [b["id"] for b in lote]
+        leche = {g["_id"]: g async for g in db[COLECCION_LECHE].aggregate([
+            {"$match": {"bovino_id": {"$in": ids}, CAMPO_FECHA: {"$gte": desde}}},
+            {"$group": {"_id": "$bovino_id", "registros": {"$sum": 1}, "litros": {"$sum": "$leche_litros"},
+                        "grasa": {"$avg": "$grasa_pct"}, "proteina": {"$avg": "$proteina_pct"}}},
+        ])}
+        pesajes = {g["_id"]: g["n"] async for g in db[COLECCION_ENGORDE].aggregate([
+            {"$match": {"bovino_id": {"$in": ids}, CAMPO_FECHA: {"$gte": desde}}},
+            {"$group": {"_id": "$bovino_id", "n": {"$sum": 1}}},
+        ])}
+        for b in lote:
+            l = leche.get(b["id"], {})
+            yield [b["caravana"], b.get("nombre"), b["tipo_ganado"], l.get("registros", 0),
+                   round(l["litros"], 2) if l else None,
+                   round(l["litros"] / l["registros"], 2) if l else None,
+                   round(l["grasa"], 2) if l.get("grasa") is not None else None,
+                   round(l["proteina"], 2) if l.get("proteina") is not None else None,
+                   pesajes.get(b["id"], 0), b.get("peso_kg")]
+
+REPORTES_PDF = {
+    "inventario": {
+        "titulo": "Inventario del hato",
+        "contar": contar_bovinos,
+        "filas": filas_inventario,
+        "columnas": [("Caravana", 1.0), ("Arete", 1.1), ("Nombre", 1.5), ("Sexo", 0.8), ("Raza", 1.2),
+                     ("Tipo", 0.8), ("Estado", 0.9), ("Venta", 1.0), ("Nacimiento", 1.0), ("Peso (kg)", 0.8)],
+    },
+    "historial-medico": {
+        "titulo": "Historial médico",
+        "contar": contar_historial_medico,
+        "filas": filas_historial_medico,
+        "columnas": [("Fecha", 0.9), ("Caravana", 0.9), ("Bovino", 1.2), ("Tipo", 1.1), ("Descripción", 1.9),
+                     ("Medicamento", 1.2), ("Dosis", 0.7), ("Próxima", 0.9), ("Costo", 0.7), ("Veterinario", 1.1)],
+    },
+    "produccion": {
+        "titulo": "Resumen de producción",
+        "contar": contar_bovinos,
+        "filas": filas_produccion,
+        "columnas": [("Caravana", 1.0), ("Nombre", 1.6), ("Tipo", 0.8), ("Registros leche", 1.0),
+                     ("Litros totales", 1.1), ("Litros/día", 0.9), ("Grasa %", 0.8), ("Proteína %", 0.9),
+                     ("Pesajes", 0.8), ("Peso actual (kg)", 1.1)],
+    },
+}
+
+async def build_pdf_report(tipo: str, finca: Dict, parametros: Dict, destino: Path, al_avanzar=None) -> Dict[str, int]:
+    """Spool the report rows to disk and render them to `destino`; `al_avanzar(filas)` runs every JOB_BATCH_SIZE rows"""
+    config = REPORTES_PDF[tipo]
+    PDF_REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    spool = destino.with_suffix(".ndjson")
+    filas = 0
+    try:
+        with open(spool, "w", encoding="utf-8") as f:
+            async for fila in config["filas"](finca["id"], parametros):
+                f.write(json.dumps(fila, default=str, ensure_ascii=False) + "\n")
+                filas += 1
+                if al_avanzar is not None and filas % JOB_BATCH_SIZE == 0:
+                    await al_avanzar(filas)
+        subtitulo = f'{finca["nombre"]} · {filas} registros'
+        paginas = await asyncio.get_running_loop().run_in_executor(
+            pdf_executor, render_table_pdf, str(spool), str(destino), config["titulo"], subtitulo, config["columnas"]
+        )
+    finally:
+        spool.unlink(missing_ok=True)
+    return {"filas": filas, "paginas": paginas}
+
+def purge_pdf_reports():
+    """Drop generated reports older than PDF_RETENCION_HORAS"""
+    if not PDF_REPORT_DIR.exists():
+        return
+    limite = time.time() - PDF_RETENCION_HORAS * 3600
+    for archivo in PDF_REPORT_DIR.glob("*.pdf"):
+        if archivo.stat().st_mtime < limite:
+            archivo.unlink(missing_ok=True)
+
+def pdf_filename(tipo: str, finca: Dict) -> str:
+    return f'{tipo}-{finca["id"][:8]}-{datetime.now():%Y%m%d}.pdf'
+
+async def get_reporte_finca(tipo: str, finca_id: str) -> Dict:
+    if tipo not in REPORTES_PDF:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    finca = await db.fincas.find_one({"id": finca_id}, {"_id": 0, "id": 1, "nombre": 1})
+    if not finca:
+        raise HTTPException(status_code=404, detail="Finca no encontrada")
+    return finca
+
+@job_queue.handler("reporte_pdf")
+async def job_reporte_pdf(trabajo: Dict):
+    parametros = trabajo["parametros"]
+    await asyncio.to_thread(purge_pdf_reports)
+    finca = await db.fincas.find_one({"id": parametros["finca_id"]}, {"_id": 0, "id": 1, "nombre": 1})
+    if not finca:
+        raise ValueError("Finca no encontrada")
+    await job_queue.progress(trabajo, set_={"fase": "consultando", "filas": 0})
+    resultado = await build_pdf_report(
+        parametros["tipo"], finca, parametros, PDF_REPORT_DIR / f'{trabajo["id"]}.pdf',
+        al_avanzar=lambda filas: job_queue.progress(trabajo, set_={"filas": filas})
+    )
+    await job_queue.progress(trabajo, set_={
+        "fase": "listo", **resultado,
+        "archivo": pdf_filename(parametros["tipo"], finca),
+        "descarga": f'/api/reportes/pdf/descargas/{trabajo["id"]}',
+    })
+
+@api_router.get("/reportes/pdf/descargas/{trabajo_id}")
+async def descargar_reporte_pdf(trabajo_id: str, current_user: Usuario = Depends(get_current_user)):
+    """Download the PDF produced by a reporte_pdf job"""
+    trabajo = await db.trabajos.find_one({"id": trabajo_id, "tipo": "reporte_pdf"}, {"_id": 0})
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    if trabajo["estado"] != "completado":
+        raise HTTPException(status_code=409, detail="El reporte aún no está listo")
+    destino = PDF_REPORT_DIR / f"{trabajo_id}.pdf"
+    if not destino.exists():
+        raise HTTPException(status_code=410, detail="El reporte expiró, solicítelo de nuevo")
+    return FileResponse(destino, media_type="application/pdf", filename=trabajo["progreso"]["archivo"])
+
+@api_router.get("/reportes/pdf/{tipo}/{finca_id}")
+async def get_reporte_pdf(
+    tipo: str,
+    finca_id: str,
+    dias_historial: int = Query(REPORTE_DIAS, alias="dias", ge=1, le=ANALITICA_DIAS_MAX),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Render a report inline; farms over PDF_SYNC_MAX_FILAS rows must use the job variant"""
+    finca = await get_reporte_finca(tipo, finca_id)
+    parametros = {"dias": dias_historial}
+    if await REPORTES_PDF[tipo]["contar"](finca_id, parametros) > PDF_SYNC_MAX_FILAS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El reporte supera {PDF_SYNC_MAX_FILAS} filas; solicítelo con POST para generarlo en segundo plano"
+        )
+    destino = PDF_REPORT_DIR / f"{uuid.uuid4()}.pdf"
+    await build_pdf_report(tipo, finca, parametros, destino)
+    return FileResponse(destino, media_type="application/pdf", filename=pdf_filename(tipo, finca),
+                        background=BackgroundTask(destino.unlink, missing_ok=True))
+
+@api_router.post("/reportes/pdf/{tipo}/{finca_id}", status_code=status.HTTP_202_ACCEPTED)
+async def solicitar_reporte_pdf(
+    response: Response,
+    tipo: str,
+    finca_id: str,
+    dias_historial: int = Query(REPORTE_DIAS, alias="dias", ge=1, le=ANALITICA_DIAS_MAX),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Queue a report of any size; poll the job and download it from progreso.descarga"""
+    await get_reporte_finca(tipo, finca_id)
+    trabajo = await job_queue.enqueue(
+        "reporte_pdf", {"tipo": tipo, "finca_id": finca_id, "dias": dias_historial}, current_user.id
+    )
+    response.headers["Location"] = f"/api/trabajos/{trabajo['id']}"
+    return {"message": "Reporte en cola", "trabajo_id": trabajo["id"]}
+
+@api_router.get("/trabajos/{trabajo_id}")
+async def get_trabajo(trabajo_id: str, current_user: Usuario = Depends(get_current_user)):
+    """Status and progress of a background job"""
+    trabajo = await db.trabajos.find_one({"id": trabajo_id}, {"_id": 0})
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+@api_router.post("/sistema/huerfanos", status_code=status.HTTP_202_ACCEPTED)
+async def barrer_huerfanos(response: Response, current_user: Usuario = Depends(get_current_user)):
+    """Queue a sweep of documents left behind by deleted fincas and bovinos"""
+    if current_user.rol != TipoUsuario.ADMINISTRADOR:
+        raise HTTPException(status_code=403, detail="Solo un administrador puede ejecutar esta tarea")
+    trabajo = await job_queue.enqueue("barrer_huerfanos", {}, current_user.id)
+    response.headers["Location"] = f"/api/trabajos/{trabajo['id']}"
+    return {"message": "Barrido de huérfanos en cola", "trabajo_id": trabajo["id"]}
+
+@api_router.get("/sistema/metricas")
+async def get_metricas(current_user: Usuario = Depends(get_current_user)):
+    """In-process counters of this worker"""
+    return {
+        "cache_usuarios": {**user_cache.stats(), **auth_stats},
+        "cache_qr": qr_cache.stats(),
+        "hash_claves": password_hasher.stats(),
+        "cache_graficos": chart_cache.stats(),
+        "cache_escaneo": scan_cache.stats(),
+        "cache_analitica": analytics_cache.stats(),
+        "limite_escaneo": scan_limiter.stats(),
+        "trabajos": job_queue.stats(),
+        "posiciones": position_buffer.stats(),
+        "cache_geocercas": geofence_cache.stats(),
+        "geocercas": geofence_stats,
+        "programador_alertas": alert_scheduler.stats(),
+        "eventos": change_feed.stats(),
+    }
 
 # Initialize sample data
 @api_router.post("/init-data")
@@ -883,34 +4020,39 @@ async def init_sample_data():
         nombre="Finca La Esperanza",
         codigo_pais="CR",
         ubicacion={"lat": 9.7489, "lng": -83.7534},
+        perimetro=[
+            {"lat": 9.7440, "lng": -83.7590},
+            {"lat": 9.7540, "lng": -83.7590},
+            {"lat": 9.7540, "lng": -83.7480},
+            {"lat": 9.7440, "lng": -83.7480}
+        ],
         area_ha=150.0,
         direccion="San José, Costa Rica",
         telefono="+506 2222-3333"
     )
-    await db.fincas.insert_one(finca_sample.dict())
+    await db.fincas.insert_one(geo_doc("fincas", finca_sample.dict()))
     
-    # Sample cattle with QR codes
+    # Sample cattle
     bovinos_sample = []
     for i, data in enumerate([
         {"caravana": "001", "nombre": "Esperanza", "sexo": Sexo.HEMBRA, "raza": "Holstein", 
          "tipo_ganado": TipoGanado.LECHE, "peso_kg": 450.5, "fecha_nacimiento": "2020-03-15", 
-         "precio": 800000.0, "contacto_nombre": "María González", "contacto_telefono": "+506 8888-1111"},
+         "precio": 800000.0, "contacto_nombre": "María González", "contacto_telefono": "+506 8888-1111",
+         "ultima_posicion": {"lat": 9.7490, "lng": -83.7530}},
         {"caravana": "002", "nombre": "Fuerte", "sexo": Sexo.MACHO, "raza": "Brahman", 
          "tipo_ganado": TipoGanado.CARNE, "peso_kg": 520.0, "fecha_nacimiento": "2019-08-22", 
-         "precio": 1200000.0, "contacto_nombre": "José Rodríguez", "contacto_telefono": "+506 8888-2222"},
+         "precio": 1200000.0, "contacto_nombre": "José Rodríguez", "contacto_telefono": "+506 8888-2222",
+         "ultima_posicion": {"lat": 9.7470, "lng": -83.7550}},
         {"caravana": "003", "nombre": "Luna", "sexo": Sexo.HEMBRA, "raza": "Jersey", 
          "tipo_ganado": TipoGanado.DUAL, "peso_kg": 380.0, "fecha_nacimiento": "2021-01-10", 
-         "precio": 950000.0, "contacto_nombre": "Ana Jiménez", "contacto_telefono": "+506 8888-3333"}
+         "precio": 950000.0, "contacto_nombre": "Ana Jiménez", "contacto_telefono": "+506 8888-3333",
+         "ultima_posicion": {"lat": 9.7560, "lng": -83.7500}}
     ]):
-        bovino = Bovino(finca_id=finca_sample.id, **data)
-        
-        # Generate QR code
-        qr_data = f"https://maneadb.preview.emergentagent.com/qr/{bovino.id}"
-        bovino.qr_clave = generate_qr_code(qr_data)
-        bovino.qr_url = qr_data
+        bovino = Bovino(finca_id=finca_sample.id, ultima_posicion_capturada_en=datetime.now(timezone.utc), **data)
+        bovino.qr_url = qr_payload(bovino.id)
         
         bovinos_sample.append(bovino)
-        await db.bovinos.insert_one(bovino.dict())
+        await db.bovinos.insert_one(geo_doc("bovinos", bovino.dict()))
     
     # Sample medical records
     registros_sample = [
@@ -952,7 +4094,9 @@ async def init_sample_data():
             grasa_pct=3.8,
             proteina_pct=3.2
         )
-        await db.produccion_leche.insert_one(produccion_leche.dict())
+        await db[COLECCION_LECHE].insert_one(serie_doc(produccion_leche))
+        await update_production_stats(produccion_leche.bovino_id, fecha, produccion_leche.leche_litros)
+        await update_production_rollups([(finca_sample.id, produccion_leche.dict())])
         
         # Weight records for Brahman (every 5 days)
         if i % 5 == 0:
@@ -963,12 +4107,13 @@ async def init_sample_data():
                 ganancia_kg=2.5 if i > 0 else 0,
                 alimentacion="Pasto mejorado + concentrado"
             )
-            await db.produccion_engorde.insert_one(produccion_engorde.dict())
+            await db[COLECCION_ENGORDE].insert_one(serie_doc(produccion_engorde))
     
     # Sample alerts
     alertas_sample = [
         Alerta(
             bovino_id=bovinos_sample[0].id,
+            finca_id=finca_sample.id,
             tipo_alerta=TipoAlerta.VENCIMIENTO_MEDICO,
             severidad=3,
             titulo="Vacuna antiaftosa próxima",
@@ -977,6 +4122,7 @@ async def init_sample_data():
         ),
         Alerta(
             bovino_id=bovinos_sample[1].id,
+            finca_id=finca_sample.id,
             tipo_alerta=TipoAlerta.CONTROL_PESO,
             severidad=2,
             titulo="Control de peso mensual",
@@ -985,6 +4131,7 @@ async def init_sample_data():
         ),
         Alerta(
             bovino_id=bovinos_sample[2].id,
+            finca_id=finca_sample.id,
             tipo_alerta=TipoAlerta.CHEQUEO_GESTACION,
             severidad=2,
             titulo="Chequeo de gestación",
@@ -993,8 +4140,7 @@ async def init_sample_data():
         )
     ]
     
-    for alerta in alertas_sample:
-        await db.alertas.insert_one(alerta.dict())
+    await write_alerts([(alerta, alerta.fecha_vencimiento) for alerta in alertas_sample])
     
     # Sample potrero
     potrero_sample = Potrero(
@@ -1011,7 +4157,8 @@ async def init_sample_data():
         tipo_pasto="Pasto estrella",
         observaciones="Potrero con sombra natural y acceso al río"
     )
-    await db.potreros.insert_one(potrero_sample.dict())
+    await db.potreros.insert_one(geo_doc("potreros", potrero_sample.dict()))
+    await reconcile_dashboard_stats()
     
     return {"message": "Datos de prueba creados exitosamente con funcionalidades completas"}
 
@@ -1024,6 +4171,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 logging.basicConfig(
@@ -1032,6 +4180,236 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_indexes():
+    global repo
+    # The server stores everything in MongoDB; SQLRepository is only run by the
+    # repository benchmark and the unit tests
+    repo = MongoRepository(
+        db=db, coleccion_leche=COLECCION_LECHE, coleccion_engorde=COLECCION_ENGORDE,
+        campo_fecha=CAMPO_FECHA, fecha_serie=fecha_serie
+    )
+    await ensure_indexes()
+    # Set MANEA_VERIFY_INDEXES=1 to refuse to start when a route would scan a collection
+    if os.environ.get("MANEA_VERIFY_INDEXES") == "1":
+        await verify_index_coverage()
+    job_queue.start()
+    position_buffer.start()
+    if ALERT_SCHEDULER:
+        alert_scheduler.start()
+    if EVENTOS:
+        change_feed.start()
+    # First start with counters: build them without holding up startup
+    if not await db.estadisticas_finca.find_one({}) and await db.fincas.find_one({}):
+        run_in_background(reconcile_dashboard_stats())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await job_queue.stop()
+    await position_buffer.stop()
+    await alert_scheduler.stop()
+    await change_feed.stop()
+    await repo.close()
+    client.close()
+    qr_executor.shutdown(wait=False)
+    chart_executor.shutdown(wait=False)
+    pdf_executor.shutdown(wait=False)
+    password_hasher.executor.shutdown(wait=False)
+
+async def strip_qr_clave():
+    """Migration: drop the base64 QR images stored before /api/qr/{id}/imagen existed"""
+    result = await db.bovinos.update_many(
+        {"qr_clave": {"$exists": True}},
+        {"$unset": {"qr_clave": ""}}
+    )
+    logger.info(f"qr_clave eliminado de {result.modified_count} bovinos")
+
+MIGRACION_LOTE = 5000
+
+async def _latencia_ms(consulta, repeticiones: int = 20) -> float:
+    muestras = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        await consulta()
+        muestras.append(time.perf_counter() - inicio)
+    return sorted(muestras)[len(muestras) // 2] * 1000
+
+async def _perfil_serie(coleccion: str, campo_fecha: str, convertir) -> Dict[str, Any]:
+    """collStats and median latency of the series queries the API runs"""
+    stats = await db.command("collStats", coleccion)
+    perfil = {
+        "storageSize": stats.get("storageSize", 0),
+        "totalIndexSize": stats.get("totalIndexSize", 0),
+        "documentos": await db[coleccion].estimated_document_count(),
+    }
+    muestra = await db[coleccion].find_one({}, {"_id": 0, "bovino_id": 1}, sort=[(campo_fecha, -1)])
+    if muestra:
+        bovino_id = muestra["bovino_id"]
+        desde_90 = convertir((datetime.now() - timedelta(days=90)).strftime("%Y-%m-%d"))
+        desde_30 = convertir((datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d"))
+        perfil["reporte_90_dias_ms"] = await _latencia_ms(lambda: db[coleccion].find(
+            {"bovino_id": bovino_id, campo_fecha: {"$gte": desde_90}}, {"_id": 0}
+        ).sort(campo_fecha, 1).to_list(None))
+        perfil["ultimos_10_ms"] = await _latencia_ms(lambda: db[coleccion].find(
+            {"bovino_id": bovino_id}, {"_id": 0}
+        ).sort(campo_fecha, -1).limit(10).to_list(10))
+        perfil["total_30_dias_ms"] = await _latencia_ms(lambda: db[coleccion].aggregate([
+            {"$match": {campo_fecha: {"$gte": desde_30}}},
+            {"$group": {"_id": None, "total": {"$sum": 1}}}
+        ]).to_list(1))
+    return perfil
+
+async def migrate_timeseries():
+    """Copy produccion_leche/engorde into their time-series collections in batches.
+    
+    Online and resumable: the app keeps writing to the old collections while this
+    runs, and progress is checkpointed by _id in "migraciones". Run it again after
+    switching PRODUCCION_TIMESERIES=1 to copy rows written in between."""
+    await ensure_timeseries_collections()
+    for origen, unica in (("produccion_leche", True), ("produccion_engorde", False)):
+        destino = f"{origen}_ts"
+        for modelo in _serie_indexes(destino, unica, timeseries=True):
+            await db[destino].create_indexes([modelo])
+        antes = await _perfil_serie(origen, "fecha_registro", lambda f: f)
+        
+        checkpoint = await db.migraciones.find_one({"id": f"timeseries:{origen}"}) or {}
+        ultimo_id = checkpoint.get("ultimo_id")
+        copiados = checkpoint.get("copiados", 0)
+        while True:
+            filtro = {"_id": {"$gt": ultimo_id}} if ultimo_id is not None else {}
+            lote = await db[origen].find(filtro).sort("_id", 1).limit(MIGRACION_LOTE).to_list(MIGRACION_LOTE)
+            if not lote:
+                break
+            ids = [doc["_id"] for doc in lote]
+            # Time-series collections have no unique _id; clear a batch a crash left half copied
+            await db[destino].delete_many({"_id": {"$in": ids}})
+            validos = []
+            for doc in lote:
+                try:
+                    doc["fecha"] = datetime.strptime(doc["fecha_registro"], "%Y-%m-%d")
+                    validos.append(doc)
+                except (KeyError, TypeError, ValueError):
+                    logger.warning(f"{origen}: documento {doc['_id']} omitido, fecha_registro inválida")
+            if validos:
+                await db[destino].insert_many(validos, ordered=False)
+            ultimo_id = ids[-1]
+            copiados += len(validos)
+            await db.migraciones.update_one(
+                {"id": f"timeseries:{origen}"},
+                {"$set": {"ultimo_id": ultimo_id, "copiados": copiados, "actualizado_en": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+            logger.info(f"{origen}: {copiados} documentos copiados")
+        
+        despues = await _perfil_serie(destino, "fecha", lambda f: datetime.strptime(f, "%Y-%m-%d"))
+        logger.info(f"{origen} -> {destino}")
+        for clave in antes:
+            logger.info(f"  {clave:<20} {antes[clave]:>14.2f} -> {despues.get(clave, 0):>14.2f}")
+
+async def migrate_geojson():
+    """Fill the *_geo GeoJSON fields of fincas, potreros and bovinos written before they existed.
+    
+    Resumable: only documents missing one of the fields are read. Locations that
+    cannot be converted, or that the 2dsphere index rejects, are logged and skipped."""
+    for coleccion, campos in GEO_CAMPOS.items():
+        faltantes = {"$or": [
+            {campo: {"$exists": True}, destino: {"$exists": False}} for campo, destino in campos.items()
+        ]}
+        proyeccion = {"_id": 1, "id": 1, **{campo: 1 for campo in campos}}
+        ultimo_id = None
+        actualizados = omitidos = 0
+        while True:
+            filtro = {"$and": [faltantes, {"_id": {"$gt": ultimo_id}}]} if ultimo_id is not None else faltantes
+            lote = await db[coleccion].find(filtro, proyeccion).sort("_id", 1).limit(MIGRACION_LOTE).to_list(MIGRACION_LOTE)
+            if not lote:
+                break
+            ultimo_id = lote[-1]["_id"]
+            operaciones = []
+            for doc in lote:
+                try:
+                    geo = geo_doc(coleccion, {campo: doc[campo] for campo in campos if campo in doc})
+                except ValueError as e:
+                    logger.warning(f"{coleccion}: {doc.get('id')} omitido, {e}")
+                    omitidos += 1
+                    continue
+                operaciones.append(pymongo.UpdateOne(
+                    {"_id": doc["_id"]}, {"$set": {destino: geo[destino] for destino in campos.values() if destino in geo}}
+                ))
+            if not operaciones:
+                continue
+            try:
+                resultado = await db[coleccion].bulk_write(operaciones, ordered=False)
+                actualizados += resultado.modified_count
+            except pymongo.errors.BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    logger.warning(f"{coleccion}: {error['op']['q']['_id']} omitido, {error.get('errmsg')}")
+                omitidos += len(e.details.get("writeErrors", []))
+                actualizados += e.details.get("nModified", 0)
+        logger.info(f"{coleccion}: {actualizados} documentos con GeoJSON, {omitidos} omitidos")
+
+async def collapse_duplicate_alerts():
+    """Fold the duplicates among alerts written before dedupe keys existed into their oldest
+    copy, which keeps the count as "ocurrencias". Duplicates share bovino, potrero, type,
+    title, due date and state; the daily "Producción láctea baja" alerts of an animal are one
+    such group. Resumable: a rerun finds only the groups still duplicated."""
+    grupos = db.alertas.aggregate([
+        {"$match": {"clave": {"$exists": False}}},
+        {"$sort": {"creado_en": 1}},
+        {"$group": {
+            "_id": {"bovino_id": "$bovino_id", "potrero_id": "$potrero_id", "tipo_alerta": "$tipo_alerta",
+                    "titulo": "$titulo", "fecha_vencimiento": "$fecha_vencimiento", "activa": "$activa"},
+            "ids": {"$push": "$_id"},
+            "finca_id": {"$first": "$finca_id"},
+            "ocurrencias": {"$sum": {"$ifNull": ["$ocurrencias", 1]}},
+            "ultima": {"$last": "$creado_en"},
+        }},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ], allowDiskUse=True)
+    colapsados = eliminados = 0
+    async for grupo in grupos:
+        conservar, *sobrantes = grupo["ids"]
+        borrados = 0
+        for inicio in range(0, len(sobrantes), MIGRACION_LOTE):
+            resultado = await db.alertas.delete_many({"_id": {"$in": sobrantes[inicio:inicio + MIGRACION_LOTE]}})
+            borrados += resultado.deleted_count
+        await db.alertas.update_one({"_id": conservar}, {
+            "$set": {"ocurrencias": grupo["ocurrencias"]}, "$max": {"ultima_ocurrencia": grupo["ultima"]}
+        })
+        if grupo["_id"]["activa"]:
+            await bump_finca_stats(grupo["finca_id"], {"alertas_activas": -borrados})
+        colapsados += 1
+        eliminados += borrados
+    logger.info(f"alertas: {colapsados} grupos de duplicados colapsados, {eliminados} alertas eliminadas")
+
+# Management commands: python server.py <comando>
+MANAGEMENT_COMMANDS = {
+    "ensure-indexes": ensure_indexes,
+    "verify-indexes": verify_index_coverage,
+    "strip-qr-clave": strip_qr_clave,
+    "rebuild-production-stats": rebuild_production_stats,
+    "reconcile-dashboard": reconcile_dashboard_stats,
+    "sweep-orphans": sweep_orphans,
+    "run-jobs": job_queue.drain,
+    "migrate-timeseries": migrate_timeseries,
+    "backfill-rollups": backfill_production_rollups,
+    "migrate-geojson": migrate_geojson,
+    "collapse-alerts": collapse_duplicate_alerts,
+    "run-alert-rules": alert_scheduler.run_all,
+}
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de Manea")
+    parser.add_argument("comando", choices=sorted(MANAGEMENT_COMMANDS))
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(MANAGEMENT_COMMANDS[args.comando]())
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 1
+    finally:
+        client.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,547 @@
+import requests
+import sys
+import os
+import time
+import json
+import asyncio
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Local micro-benchmarks import the backend module directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "p50": pick(0.50) * 1000,
+        "p95": pick(0.95) * 1000,
+        "p99": pick(0.99) * 1000,
+        "mean": statistics.mean(ordered) * 1000,
+    }
+
+def report(name, samples):
+    p = percentiles(samples)
+    print(f"   {name:<40} n={len(samples):<6} p50={p['p50']:8.2f}ms  p95={p['p95']:8.2f}ms  "
+          f"p99={p['p99']:8.2f}ms  mean={p['mean']:8.2f}ms")
+    return p
+
+class ManeaAPIBenchmark:
+    def __init__(self, base_url="https://maneadb.preview.emergentagent.com/api"):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        self.resources = {'finca_id': None, 'bovino': None}
+
+    def setup(self):
+        """Register a throwaway user, log in and make sure sample data exists"""
+        suffix = datetime.now().strftime('%H%M%S%f')
+        credentials = {"correo": f"bench_{suffix}@test.com", "clave": "BenchPass123!"}
+        self.session.post(f"{self.base_url}/auth/register", json={
+            "nombre_completo": f"Bench {suffix}", **credentials
+        })
+        self.credentials = credentials
+        token = self.session.post(f"{self.base_url}/auth/login", json=credentials).json()["access_token"]
+        self.session.headers['Authorization'] = f'Bearer {token}'
+        self.session.post(f"{self.base_url}/init-data")
+        bovinos = self.session.get(f"{self.base_url}/bovinos", params={"limit": 1}).json()
+        self.resources['bovino'] = bovinos[0]
+        self.resources['finca_id'] = bovinos[0]['finca_id']
+
+    def measure(self, method, endpoint, n, data=None):
+        samples = []
+        for _ in range(n):
+            start = time.perf_counter()
+            response = self.session.request(method, f"{self.base_url}/{endpoint}", json=data)
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+        return samples
+
+    def bench_update_bovino(self, n=50):
+        """PUT /bovinos/{id} latency; before user-004 every update re-rendered the QR PNG"""
+        bovino = self.resources['bovino']
+        fields = ("finca_id", "caravana", "nombre", "sexo", "raza", "tipo_ganado", "estado_ganado", "peso_kg")
+        data = {k: bovino.get(k) for k in fields}
+        report("PUT /bovinos/{id}", self.measure("PUT", f"bovinos/{bovino['id']}", n, data))
+
+    def bench_list_rps(self, seconds=5.0, concurrency=8, limit=1000):
+        """Requests per second of full list pages; run once against a server started with
+        FAST_LIST_RESPONSES=0 and once with the default to compare before and after"""
+        headers = dict(self.session.headers)
+        for endpoint in ("bovinos", "produccion-leche"):
+            def worker(_):
+                samples = []
+                deadline = time.perf_counter() + seconds
+                with requests.Session() as session:
+                    session.headers.update(headers)
+                    while time.perf_counter() < deadline:
+                        start = time.perf_counter()
+                        session.get(f"{self.base_url}/{endpoint}", params={"limit": limit}).raise_for_status()
+                        samples.append(time.perf_counter() - start)
+                return samples
+
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = [s for batch in pool.map(worker, range(concurrency)) for s in batch]
+            report(f"GET /{endpoint}?limit={limit}", samples)
+            print(f"   {len(samples) / seconds:.1f} req/s with {concurrency} clients")
+
+    def bench_gps_ingest(self, seconds=5.0, concurrency=4, batch=1000):
+        """Fixes per second accepted by POST /posiciones, then GET /recorrido latency on the written history"""
+        headers = dict(self.session.headers)
+        bovinos = [b["id"] for b in self.session.get(f"{self.base_url}/bovinos", params={"limit": 1000}).json()]
+
+        def worker(n):
+            samples = []
+            deadline = time.perf_counter() + seconds
+            instante = datetime.utcnow() - timedelta(days=1, minutes=n)
+            with requests.Session() as session:
+                session.headers.update(headers)
+                while time.perf_counter() < deadline:
+                    instante += timedelta(seconds=1)
+                    fixes = [{"bovino_id": bovinos[i % len(bovinos)], "lat": 9.7489 + i * 1e-6, "lng": -83.7534,
+                              "capturada_en": (instante + timedelta(milliseconds=i)).isoformat()} for i in range(batch)]
+                    start = time.perf_counter()
+                    session.post(f"{self.base_url}/posiciones", json={"posiciones": fixes}).raise_for_status()
+                    samples.append(time.perf_counter() - start)
+            return samples
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = [s for part in pool.map(worker, range(concurrency)) for s in part]
+        report(f"POST /posiciones ({batch} fixes)", samples)
+        print(f"   {len(samples) * batch / seconds:.0f} fixes/s with {concurrency} clients")
+        time.sleep(6)  # let the buffer flush
+        report("GET /bovinos/{id}/recorrido, 1 day", self.measure("GET", f"bovinos/{bovinos[0]}/recorrido", 20))
+
+    def bench_event_fanout(self, subscribers=50, alerts=20, interval=0.1):
+        """Delivery latency of live events to many /eventos subscribers at once; needs MongoDB
+        running as a replica set (a single node is enough)"""
+        headers = dict(self.session.headers)
+        bovino_id = self.resources['bovino']['id']
+        ready = threading.Barrier(subscribers + 1, timeout=30)
+        marca = f"fanout {datetime.now():%H%M%S%f}"
+
+        def subscriber(_):
+            samples = []
+            with requests.get(f"{self.base_url}/eventos", headers=headers, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                ready.wait()
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: ") and event == "alertas":
+                        doc = json.loads(line[6:]).get("doc") or {}
+                        if doc.get("titulo") == marca:
+                            samples.append(time.perf_counter() - float(doc["mensaje"]))
+                            if len(samples) == alerts:
+                                break
+            return samples
+
+        with ThreadPoolExecutor(max_workers=subscribers) as pool:
+            results = pool.map(subscriber, range(subscribers))
+            ready.wait()
+            time.sleep(0.5)
+            for _ in range(alerts):
+                self.session.post(f"{self.base_url}/alertas", json={
+                    "bovino_id": bovino_id, "tipo_alerta": "control_peso", "titulo": marca,
+                    "mensaje": repr(time.perf_counter())
+                }).raise_for_status()
+                time.sleep(interval)
+            samples = [s for part in results for s in part]
+        report(f"alert to {subscribers} subscribers", samples)
+        print(f"   delivered {len(samples)}/{subscribers * alerts}")
+
+    def bench_login_storm(self, logins=200, concurrency=32, probe_interval=0.02):
+        """p99 of a cheap authenticated read, alone and while a burst of logins runs"""
+        headers = dict(self.session.headers)
+
+        def probe_until(stop):
+            samples = []
+            with requests.Session() as session:
+                session.headers.update(headers)
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    session.get(f"{self.base_url}/fincas", params={"limit": 1}).raise_for_status()
+                    samples.append(time.perf_counter() - start)
+                    time.sleep(probe_interval)
+            return samples
+
+        def login(_):
+            start = time.perf_counter()
+            status_code = requests.post(f"{self.base_url}/auth/login", json=self.credentials).status_code
+            return time.perf_counter() - start, status_code
+
+        stop = threading.Event()
+        timer = threading.Timer(3.0, stop.set)
+        timer.start()
+        report("GET /fincas, idle", probe_until(stop))
+
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=concurrency + 1) as pool:
+            probes = pool.submit(probe_until, stop)
+            results = list(pool.map(login, range(logins)))
+            stop.set()
+            report("GET /fincas, during login storm", probes.result())
+        report("POST /auth/login, storm", [elapsed for elapsed, _ in results])
+        shed = sum(1 for _, code in results if code == 503)
+        print(f"   logins shed with 503: {shed}/{logins}")
+
+# Local micro-benchmarks (no server needed)
+async def loop_gaps(run):
+    """Gaps seen by a 1 ms ticker on the event loop while `run()` is awaited"""
+    gaps = []
+    done = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    await run()
+    done.set()
+    await task
+    return gaps
+
+def local_qr_update_cost(n=200):
+    """Per-update QR cost: old inline base64 PNG render versus the content-addressed path"""
+    import base64
+    import server
+
+    payloads = [server.qr_payload(f"bench-{i}") for i in range(n)]
+    before = []
+    for payload in payloads:
+        start = time.perf_counter()
+        base64.b64encode(server.render_qr_code(payload, "png")).decode()
+        before.append(time.perf_counter() - start)
+    report("update QR work, before (inline render)", before)
+
+    after = []
+    for i, payload in enumerate(payloads):
+        start = time.perf_counter()
+        server.qr_payload(f"bench-{i}")
+        after.append(time.perf_counter() - start)
+    report("update QR work, after (payload only)", after)
+
+    async def inline():
+        for i in range(32):
+            server.render_qr_code(server.qr_payload(f"stall-inline-{i}"), "png")
+            await asyncio.sleep(0)
+
+    async def pooled():
+        await asyncio.gather(*[
+            server.get_qr_image(server.qr_payload(f"stall-pool-{i}"), "png") for i in range(32)
+        ])
+
+    report("event loop gaps, inline render", asyncio.run(loop_gaps(inline)))
+    report("event loop gaps, qr_executor render", asyncio.run(loop_gaps(pooled)))
+
+def local_login_storm(logins=16):
+    """Event loop gaps while a burst of bcrypt verifications runs inline versus on password_hasher"""
+    import server
+
+    hashed = server.get_password_hash("BenchPass123!")
+
+    async def inline():
+        for _ in range(logins):
+            server.verify_password("BenchPass123!", hashed)
+            await asyncio.sleep(0)
+
+    async def pooled():
+        await asyncio.gather(*[server.verify_password_async("BenchPass123!", hashed) for _ in range(logins)])
+
+    report("event loop gaps, inline bcrypt", asyncio.run(loop_gaps(inline)))
+    report("event loop gaps, password_hasher", asyncio.run(loop_gaps(pooled)))
+    print(f"   password_hasher: {server.password_hasher.stats()}")
+
+def local_report_chart(reports=8):
+    """Event loop gaps while report charts render inline versus on chart_executor, then a cache hit"""
+    import server
+
+    fechas = [f"2024-01-{d:02d}" for d in range(1, 31)]
+    valores = [18.5 + (d % 5) - 2 for d in range(30)]
+
+    async def inline():
+        for i in range(reports):
+            server.render_series_chart(f"inline {i}", "Litros", fechas, valores)
+            await asyncio.sleep(0)
+
+    async def pooled():
+        await asyncio.gather(*[
+            server.render_cached(server.chart_cache, server._chart_inflight, f"bench-{i}",
+                                 server.chart_executor, server.render_series_chart,
+                                 f"pool {i}", "Litros", fechas, valores)
+            for i in range(reports)
+        ])
+
+    report("event loop gaps, inline chart", asyncio.run(loop_gaps(inline)))
+    report("event loop gaps, chart_executor", asyncio.run(loop_gaps(pooled)))
+    report("event loop gaps, cached charts", asyncio.run(loop_gaps(pooled)))
+    server.chart_executor.shutdown()
+
+def local_herd_analytics(cabezas=10000, dias=365, runs=5):
+    """herd_summary over a synthetic year of daily milk and monthly weighings for a large herd"""
+    import numpy as np
+    import analytics
+
+    rng = np.random.default_rng(7)
+    ids = [f"bovino-{i}" for i in range(cabezas)]
+    bovino = np.repeat(np.arange(cabezas), dias)
+    dia = np.tile(np.arange(dias), cabezas) + 19000
+    leche = {
+        "bovino": bovino, "dia": dia,
+        "litros": rng.normal(18, 4, bovino.size),
+        "grasa": rng.normal(3.8, 0.3, bovino.size),
+        "proteina": rng.normal(3.3, 0.2, bovino.size),
+    }
+    pesajes = dia % 30 == 0
+    engorde = {"bovino": bovino[pesajes], "dia": dia[pesajes], "peso": 300 + (dia[pesajes] - 19000) * rng.normal(0.8, 0.2, pesajes.sum())}
+
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        analytics.herd_summary(ids, leche, engorde)
+        samples.append(time.perf_counter() - start)
+    report(f"herd_summary, {cabezas} head x {dias} days", samples)
+
+def local_geofence(posiciones=10000, potreros=50, vertices=24, runs=20):
+    """Positions per second through the geofence check and occupancy count on one core"""
+    import numpy as np
+    import geofence
+
+    rng = np.random.default_rng(11)
+    # A grid of irregular paddocks inside a farm perimeter, about 1 km across
+    lado = int(np.ceil(np.sqrt(potreros)))
+    paso = 0.01 / lado
+    angulos = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    cercas = []
+    for i in range(potreros):
+        cx, cy = -83.76 + (i % lado + 0.5) * paso, 9.74 + (i // lado + 0.5) * paso
+        radio = paso / 2 * rng.uniform(0.7, 1.0, vertices)
+        anillo = np.c_[cx + radio * np.cos(angulos), cy + radio * np.sin(angulos)]
+        cercas.append(geofence.Cerca(f"p{i}", anillo.tolist()))
+    perimetro = geofence.Cerca("f", [[-83.76, 9.74], [-83.75, 9.74], [-83.75, 9.75], [-83.76, 9.75]])
+    lng = rng.uniform(-83.761, -83.749, posiciones)
+    lat = rng.uniform(9.739, 9.751, posiciones)
+    asignado = rng.integers(-1, potreros, posiciones)
+
+    for nombre, medir in (
+        ("evaluar", lambda: geofence.evaluar(perimetro, cercas, asignado, lng, lat)),
+        ("ocupacion", lambda: geofence.ocupacion(cercas, lng, lat)),
+    ):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            medir()
+            samples.append(time.perf_counter() - start)
+        p = report(f"{nombre}, {posiciones} positions x {potreros} potreros", samples)
+        print(f"   ~{posiciones / (p['mean'] / 1000):,.0f} positions/s")
+
+def _bench_herd(fincas, bovinos_por_finca, dias):
+    """Deterministic fincas, bovinos and daily milk records shared by every backend"""
+    import random
+    import server
+
+    rng = random.Random(11)
+    hoy = datetime.now()
+    datos = {"fincas": [], "bovinos": [], "leche": []}
+    for f in range(fincas):
+        finca = server.Finca(nombre=f"Finca bench {f}", ubicacion={"lat": 9.7, "lng": -83.7})
+        datos["fincas"].append(finca.dict())
+        for b in range(bovinos_por_finca):
+            bovino = server.Bovino(finca_id=finca.id, caravana=f"B{f}-{b:05d}", raza="Holstein",
+                                   tipo_ganado=rng.choice(["leche", "carne", "dual"]), peso_kg=350.0)
+            datos["bovinos"].append(bovino.dict())
+            if bovino.tipo_ganado != "carne":
+                datos["leche"].extend(
+                    server.ProduccionLeche(bovino_id=bovino.id, leche_litros=round(rng.uniform(8, 30), 2),
+                                           fecha_registro=(hoy - timedelta(days=d)).strftime("%Y-%m-%d"),
+                                           grasa_pct=3.8, proteina_pct=3.2).dict()
+                    for d in range(dias)
+                )
+    return datos
+
+async def _open_bench_repository(backend):
+    """A repository on a scratch database, or None when the backend is unreachable"""
+    import server
+    import repositories
+
+    if backend == "mongo":
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=2000)
+        try:
+            await client.server_info()
+        except Exception as e:
+            print(f"   mongo skipped: {e.__class__.__name__}")
+            return None
+        await client.drop_database("manea_bench")
+        server.db = client["manea_bench"]
+        await server.ensure_indexes()
+        return await repositories.open_repository(
+            "mongo", db=server.db, coleccion_leche=server.COLECCION_LECHE, coleccion_engorde=server.COLECCION_ENGORDE,
+            campo_fecha=server.CAMPO_FECHA, fecha_serie=server.fecha_serie
+        )
+    if backend == "sqlite":
+        import tempfile
+        ruta = os.path.join(tempfile.mkdtemp(prefix="manea-bench-"), "bench.db")
+        return await repositories.open_repository("sqlite", f"sqlite:///{ruta}", pool_max=4)
+    if backend == "mysql":
+        if not os.environ.get("MANEA_SQL_URL"):
+            print("   mysql skipped: set MANEA_SQL_URL to a database created from mysql_schema.sql")
+            return None
+        return await repositories.open_repository("mysql", os.environ["MANEA_SQL_URL"], pool_max=10)
+    raise ValueError(backend)
+
+def local_repositories(fincas=4, bovinos_por_finca=250, dias=60, lecturas=300, concurrencia=16):
+    """The same load and read workloads through each repository backend (BENCH_BACKENDS, default mongo,sqlite,mysql)"""
+    import random
+    import server
+
+    datos = _bench_herd(fincas, bovinos_por_finca, dias)
+    print(f"   dataset: {len(datos['fincas'])} fincas, {len(datos['bovinos'])} bovinos, {len(datos['leche'])} milk records")
+    rng = random.Random(5)
+    bovino_ids = [b["id"] for b in datos["bovinos"]]
+    finca_ids = [f["id"] for f in datos["fincas"]]
+    lechera_ids = sorted({r["bovino_id"] for r in datos["leche"]})
+    hoy = datetime.now().strftime("%Y-%m-%d")
+
+    async def timed(samples, call):
+        start = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - start)
+
+    async def reads(call):
+        """`lecturas` calls, `concurrencia` in flight"""
+        samples = []
+        for i in range(0, lecturas, concurrencia):
+            await asyncio.gather(*[timed(samples, call) for _ in range(min(concurrencia, lecturas - i))])
+        return samples
+
+    async def run(backend):
+        repo = await _open_bench_repository(backend)
+        if repo is None:
+            return
+        try:
+            cargas = []
+            await timed(cargas, lambda: repo.insert_fincas(datos["fincas"]))
+            for i in range(0, len(datos["bovinos"]), 500):
+                await timed(cargas, lambda: repo.insert_bovinos(datos["bovinos"][i:i + 500]))
+            for i in range(0, len(datos["leche"]), 1000):
+                await timed(cargas, lambda: repo.insert_produccion_leche(datos["leche"][i:i + 1000]))
+            print(f"   {backend}: loaded in {sum(cargas):.2f}s")
+            if backend == "mongo":
+                # Mongo answers the dashboard and monthly report from counters the write routes keep
+                await server.reconcile_dashboard_stats()
+                await server.backfill_production_rollups()
+
+            workloads = [
+                ("get_bovino", lambda: repo.get_bovino(rng.choice(bovino_ids))),
+                ("list_bovinos page of 100", lambda: repo.list_bovinos(rng.choice(finca_ids), limit=100)),
+                ("reporte_produccion 30 days", lambda: repo.reporte_produccion(
+                    rng.choice(lechera_ids), (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d"), hoy, ["leche"])),
+                ("dashboard_stats per finca", lambda: repo.dashboard_stats(rng.choice(finca_ids), 30)),
+                ("dashboard_stats all", lambda: repo.dashboard_stats(None, 30)),
+                ("produccion_mensual per finca", lambda: repo.produccion_mensual([rng.choice(finca_ids)], None, None)),
+            ]
+            for name, call in workloads:
+                report(f"{backend} {name}", await reads(call))
+        finally:
+            await repo.close()
+
+    for backend in os.environ.get("BENCH_BACKENDS", "mongo,sqlite,mysql").split(","):
+        asyncio.run(run(backend.strip()))
+
+def local_list_encoding(n=1000, runs=50):
+    """CPU cost of encoding one 1000-row list page: model round trip plus response_model pass versus the fast path"""
+    import json
+    from typing import List
+    from pydantic import TypeAdapter
+    from starlette.responses import JSONResponse
+    import server
+
+    def stored(doc):
+        # What Motor hands back: enums as strings, no _id
+        return json.loads(json.dumps(doc, default=str))
+
+    pages = {
+        "bovinos": (server.Bovino, [stored(server.Bovino(
+            finca_id="f", caravana=f"C{i:05d}", tipo_ganado="leche", raza="Holstein", peso_kg=420.5,
+            ultima_posicion={"lat": 9.7, "lng": -83.7}).dict()) for i in range(n)]),
+        "produccion-leche": (server.ProduccionLeche, [stored(server.ProduccionLeche(
+            bovino_id=f"b{i}", fecha_registro="2025-01-01", leche_litros=21.5, grasa_pct=3.8, proteina_pct=3.2).dict())
+            for i in range(n)]),
+    }
+    for endpoint, (model, docs) in pages.items():
+        adapter = TypeAdapter(List[model])
+
+        def before():
+            # list_page built the models, then FastAPI dumped, re-validated and serialized them
+            models = [model(**doc) for doc in docs]
+            content = adapter.dump_python(adapter.validate_python([m.model_dump() for m in models]), mode="json")
+            return JSONResponse(content).body
+
+        def after():
+            defaults = server.model_defaults(model)
+            return server.FastJSONResponse([{**defaults, **doc} for doc in docs]).body
+
+        for name, encode in (("before", before), ("after", after)):
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                encode()
+                samples.append(time.perf_counter() - start)
+            p = report(f"encode GET /{endpoint} page, {name}", samples)
+            print(f"   ~{1000 / p['mean']:.0f} pages/s per core")
+
+LOCAL_BENCHMARKS = {
+    "qr-update": local_qr_update_cost,
+    "login-storm": local_login_storm,
+    "report-chart": local_report_chart,
+    "herd-analytics": local_herd_analytics,
+    "repositories": local_repositories,
+    "list-encoding": local_list_encoding,
+    "geofence": local_geofence,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Manea performance benchmarks")
+    parser.add_argument("--base-url", default="https://maneadb.preview.emergentagent.com/api")
+    parser.add_argument("--local", action="store_true", help="run in-process micro-benchmarks only")
+    parser.add_argument("benchmarks", nargs="*")
+    args = parser.parse_args()
+
+    print("🐄 Starting Manea benchmarks...")
+    print("=" * 50)
+
+    if args.local:
+        for name, bench in LOCAL_BENCHMARKS.items():
+            if not args.benchmarks or name in args.benchmarks:
+                print(f"\n⏱  {name}")
+                bench()
+        return 0
+
+    bench = ManeaAPIBenchmark(args.base_url)
+    bench.setup()
+    sequence = [
+        ("update-bovino", bench.bench_update_bovino),
+        ("login-storm", bench.bench_login_storm),
+        ("list-rps", bench.bench_list_rps),
+        ("gps-ingest", bench.bench_gps_ingest),
+        ("event-fanout", bench.bench_event_fanout),
+    ]
+    for name, func in sequence:
+        if not args.benchmarks or name in args.benchmarks:
+            print(f"\n⏱  {name}")
+            func()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
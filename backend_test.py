@@ -276,6 +276,100 @@ class ManeaAPITester:
             self.created_resources['alerta_id'] = response['id']
         return success
 
+    def test_produccion_leche_lote(self):
+        """Test bulk milk production ingestion"""
+        if not self.created_resources['bovino_id']:
+            print("❌ Cannot ingest production - no bovino available")
+            return False
+            
+        fecha = datetime.now().strftime('%Y-%m-%d')
+        filas = [
+            {"bovino_id": self.created_resources['bovino_id'], "fecha_registro": fecha, "leche_litros": 18.5},
+            {"bovino_id": self.created_resources['bovino_id'], "fecha_registro": fecha, "leche_litros": 18.5},
+            {"bovino_id": self.created_resources['bovino_id'], "fecha_registro": fecha}
+        ]
+        
+        success, response = self.run_test(
+            "Bulk Produccion Leche",
+            "POST",
+            "produccion-leche/lote",
+            200,
+            data=filas
+        )
+        
+        if success:
+            estados = [r['estado'] for r in response.get('resultados', [])]
+            print(f"   Row results: {estados}")
+            return estados == ['creado', 'duplicado', 'invalido']
+        return success
+
+    def test_produccion_leche_bovino_desconocido(self):
+        """Test that milk production for an unknown bovino is rejected"""
+        success, _ = self.run_test(
+            "Produccion Leche Unknown Bovino",
+            "POST",
+            "produccion-leche",
+            404,
+            data={"bovino_id": "no-existe", "fecha_registro": datetime.now().strftime('%Y-%m-%d'), "leche_litros": 10}
+        )
+        return success
+
+    def _next_event(self, response, evento, titulo):
+        """Read Server-Sent Events from `response` until an `evento` inserting a document
+        with this `titulo`; returns (id, data)"""
+        campos = {}
+        limite = datetime.now().timestamp() + 15
+        for linea in response.iter_lines(decode_unicode=True):
+            if datetime.now().timestamp() > limite:
+                break
+            if linea:
+                nombre, _, valor = linea.partition(": ")
+                campos[nombre] = valor
+                continue
+            if campos.get("event") == evento:
+                datos = json.loads(campos["data"])
+                if datos.get("doc", {}).get("titulo") == titulo:
+                    return campos.get("id"), datos
+            campos = {}
+        return None, None
+
+    def test_eventos(self):
+        """Test live events: a new alert is pushed, and a reconnect resumes after the last event seen.
+        Needs MongoDB running as a replica set (a single node is enough)"""
+        if not self.created_resources['bovino_id']:
+            print("❌ Cannot test eventos - no bovino available")
+            return False
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing Live Events...")
+        headers = {**self.headers, 'Authorization': f'Bearer {self.token}'}
+        alerta = {"bovino_id": self.created_resources['bovino_id'], "tipo_alerta": "control_peso"}
+        try:
+            with requests.get(f"{self.base_url}/eventos", headers=headers, stream=True, timeout=15) as response:
+                if response.status_code != 200:
+                    print(f"❌ Failed - Expected 200, got {response.status_code}")
+                    return False
+                requests.post(f"{self.base_url}/alertas", json={**alerta, "titulo": "Evento 1"}, headers=headers)
+                ultimo, datos = self._next_event(response, "alertas", "Evento 1")
+            print(f"   Pushed: {datos}")
+            
+            # Raised while disconnected; the reconnect must replay it
+            requests.post(f"{self.base_url}/alertas", json={**alerta, "titulo": "Evento 2"}, headers=headers)
+            with requests.get(f"{self.base_url}/eventos", headers={**headers, 'Last-Event-ID': ultimo},
+                              stream=True, timeout=15) as response:
+                _, reanudado = self._next_event(response, "alertas", "Evento 2")
+            print(f"   Resumed: {reanudado}")
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+        
+        if datos and reanudado:
+            self.tests_passed += 1
+            print("✅ Passed")
+            return True
+        print("❌ Failed - Events missing")
+        return False
+
     def test_delete_bovino(self):
         """Test delete cattle"""
         if not self.created_resources['bovino_id']:
@@ -309,6 +403,9 @@ def main():
         ("Update Bovino", tester.test_update_bovino),
         ("Get Alertas", tester.test_get_alertas),
         ("Create Alerta", tester.test_create_alerta),
+        ("Bulk Produccion Leche", tester.test_produccion_leche_lote),
+        ("Produccion Leche Unknown Bovino", tester.test_produccion_leche_bovino_desconocido),
+        ("Live Events", tester.test_eventos),
         ("Delete Bovino", tester.test_delete_bovino),
     ]
     
@@ -20,6 +20,8 @@ import {
 import { format, parseISO } from 'date-fns';
 import { Line } from 'react-chartjs-2';
 
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+
 const QRDisplay = ({ data }) => {
   const [chartData, setChartData] = useState(null);
   const { bovino, finca, registros_medicos, produccion_leche, produccion_engorde } = data;
@@ -350,14 +352,12 @@ const QRDisplay = ({ data }) => {
                 </CardTitle>
               </CardHeader>
               <CardContent className="text-center">
-                {bovino.qr_clave && (
-                  <img 
-                    src={`data:image/png;base64,${bovino.qr_clave}`}
-                    alt="QR Code"
-                    className="mx-auto mb-2"
-                    style={{ maxWidth: '150px' }}
-                  />
-                )}
+                <img 
+                  src={`${BACKEND_URL}/api/qr/${bovino.id}/imagen?formato=svg`}
+                  alt="QR Code"
+                  className="mx-auto mb-2"
+                  style={{ maxWidth: '150px' }}
+                />
                 <p className="text-xs text-gray-600">
                   Escanea para acceder a la información completa
                 </p>
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Frozen time.monotonic; advance it by adding to reloj[0]"""
+    import server
+    ahora = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: ahora[0])
+    return ahora
@@ -0,0 +1,183 @@
+"""In-memory stand-in for the few Motor collection calls the job queue and sweeps make"""
+import copy
+from itertools import count
+
+import pymongo
+
+_ids = count(1)
+
+
+def _leer(doc, campo):
+    for parte in campo.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(parte)
+    return doc
+
+
+def _escribir(doc, campo, valor):
+    *padres, ultimo = campo.split(".")
+    for parte in padres:
+        doc = doc.setdefault(parte, {})
+    doc[ultimo] = valor
+
+
+def _operadores(cond):
+    return isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond)
+
+
+def _cumple_op(valor, op, arg):
+    if op == "$in":
+        return valor in arg
+    if op == "$ne":
+        return valor != arg
+    if op == "$exists":
+        return (valor is not None) == arg
+    if valor is None:
+        return False
+    return {"$lt": valor < arg, "$lte": valor <= arg, "$gt": valor > arg, "$gte": valor >= arg}[op]
+
+
+def cumple(doc, filtro) -> bool:
+    for campo, cond in filtro.items():
+        if campo == "$or":
+            if not any(cumple(doc, f) for f in cond):
+                return False
+        elif _operadores(cond):
+            if not all(_cumple_op(_leer(doc, campo), op, arg) for op, arg in cond.items()):
+                return False
+        elif _leer(doc, campo) != cond:
+            return False
+    return True
+
+
+def proyectar(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    incluidos = [k for k, v in projection.items() if v and k != "_id"]
+    if incluidos:
+        salida = {k: copy.deepcopy(doc[k]) for k in incluidos if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            salida["_id"] = doc["_id"]
+        return salida
+    return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1)}
+
+
+class Resultado:
+    def __init__(self, matched_count=0, deleted_count=0):
+        self.matched_count = matched_count
+        self.deleted_count = deleted_count
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, orden):
+        self.docs = _ordenar(self.docs, orden)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, n=None):
+        return self.docs if n is None else self.docs[:n]
+
+    def __aiter__(self):
+        return self._iterar()
+
+    async def _iterar(self):
+        for doc in self.docs:
+            yield doc
+
+
+def _ordenar(docs, orden):
+    for campo, sentido in reversed(orden or []):
+        docs = sorted(docs, key=lambda d: _leer(d, campo), reverse=sentido == -1)
+    return docs
+
+
+class Coleccion:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", next(_ids))
+        self.docs.append(copy.deepcopy(doc))
+
+    def find(self, filtro=None, projection=None):
+        return Cursor([proyectar(d, projection) for d in self.docs if cumple(d, filtro or {})])
+
+    async def find_one(self, filtro=None, projection=None, sort=None):
+        docs = _ordenar([d for d in self.docs if cumple(d, filtro or {})], sort)
+        return proyectar(docs[0], projection) if docs else None
+
+    async def count_documents(self, filtro):
+        return sum(1 for d in self.docs if cumple(d, filtro))
+
+    def _aplicar(self, doc, update, insertado=False):
+        for campo, valor in update.get("$set", {}).items():
+            _escribir(doc, campo, copy.deepcopy(valor))
+        for campo, valor in update.get("$inc", {}).items():
+            _escribir(doc, campo, (_leer(doc, campo) or 0) + valor)
+        if insertado:
+            for campo, valor in update.get("$setOnInsert", {}).items():
+                _escribir(doc, campo, copy.deepcopy(valor))
+
+    async def update_one(self, filtro, update, upsert=False):
+        for doc in self.docs:
+            if cumple(doc, filtro):
+                self._aplicar(doc, update)
+                return Resultado(matched_count=1)
+        if upsert:
+            doc = {"_id": next(_ids), **{k: v for k, v in filtro.items() if not _operadores(v) and k != "$or"}}
+            self._aplicar(doc, update, insertado=True)
+            self.docs.append(doc)
+        return Resultado()
+
+    async def find_one_and_update(self, filtro, update, projection=None, sort=None,
+                                  return_document=pymongo.ReturnDocument.BEFORE):
+        docs = _ordenar([d for d in self.docs if cumple(d, filtro)], sort)
+        if not docs:
+            return None
+        antes = copy.deepcopy(docs[0])
+        self._aplicar(docs[0], update)
+        return proyectar(docs[0] if return_document == pymongo.ReturnDocument.AFTER else antes, projection)
+
+    async def delete_one(self, filtro):
+        for doc in self.docs:
+            if cumple(doc, filtro):
+                self.docs.remove(doc)
+                return Resultado(deleted_count=1)
+        return Resultado()
+
+    async def delete_many(self, filtro):
+        antes = len(self.docs)
+        self.docs = [d for d in self.docs if not cumple(d, filtro)]
+        return Resultado(deleted_count=antes - len(self.docs))
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        """$match and single-field $group only"""
+        docs = self.docs
+        for etapa in pipeline:
+            if "$match" in etapa:
+                docs = [d for d in docs if cumple(d, etapa["$match"])]
+            else:
+                claves = dict.fromkeys(_leer(d, etapa["$group"]["_id"][1:]) for d in docs)
+                docs = [{"_id": clave} for clave in claves]
+        return Cursor(docs)
+
+
+class BaseMemoria:
+    """Collections are created on first use, by attribute or by name"""
+    def __init__(self):
+        self.colecciones = {}
+
+    def __getitem__(self, nombre):
+        return self.colecciones.setdefault(nombre, Coleccion())
+
+    def __getattr__(self, nombre):
+        if nombre.startswith("_"):
+            raise AttributeError(nombre)
+        return self[nombre]
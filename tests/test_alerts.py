@@ -0,0 +1,21 @@
+"""Dedupe keys of the alert writer"""
+import pytest
+
+from server import Alerta, TipoAlerta, alert_key, semana_iso
+
+
+def test_alert_key_uses_bovino_or_potrero():
+    de_bovino = Alerta(bovino_id="b1", potrero_id="p1", tipo_alerta=TipoAlerta.PRODUCCION_BAJA, titulo="t")
+    de_potrero = Alerta(potrero_id="p1", tipo_alerta=TipoAlerta.CAPACIDAD_POTRERO, titulo="t")
+    assert alert_key(de_bovino, "2024-W07") == "produccion_baja:b1:2024-W07"
+    assert alert_key(de_potrero, "2024-03-01") == "capacidad_potrero:p1:2024-03-01"
+
+
+@pytest.mark.parametrize("fecha, semana", [
+    ("2024-02-14", "2024-W07"),
+    ("2024-01-01", "2024-W01"),
+    ("2021-01-03", "2020-W53"),
+    ("2024-12-30", "2025-W01"),
+])
+def test_semana_iso(fecha, semana):
+    assert semana_iso(fecha) == semana
@@ -0,0 +1,76 @@
+"""Herd summaries of analytics.py over small hand-checked columns"""
+import numpy as np
+
+from analytics import dias, herd_summary
+
+IDS = ["b1", "b2", "b3"]
+
+
+def columnas_leche(filas):
+    bovino, fechas, litros = zip(*filas)
+    n = len(filas)
+    return {"bovino": np.array(bovino), "dia": dias(list(fechas)), "litros": np.array(litros, dtype=np.float64),
+            "grasa": np.full(n, np.nan), "proteina": np.full(n, np.nan)}
+
+
+def columnas_engorde(filas):
+    bovino, fechas, peso = zip(*filas)
+    return {"bovino": np.array(bovino), "dia": dias(list(fechas)), "peso": np.array(peso, dtype=np.float64)}
+
+
+def vacias():
+    vacio = np.array([], dtype=np.int64)
+    return vacio, vacio, np.array([], dtype=np.float64)
+
+
+def test_empty_herd():
+    bovino, dia, valores = vacias()
+    resumen = herd_summary(IDS, {"bovino": bovino, "dia": dia, "litros": valores, "grasa": valores,
+                                 "proteina": valores},
+                           {"bovino": bovino, "dia": dia, "peso": valores})
+    assert resumen == {"leche": {"registros": 0, "animales": 0}, "engorde": {"registros": 0, "animales": 0}}
+
+
+def test_milk_summary():
+    leche = columnas_leche([
+        (0, "2024-01-01", 20.0), (0, "2024-01-02", 22.0), (1, "2024-01-01", 10.0),
+        # b2 dries off for more than SECADO_DIAS and starts a second lactation
+        (1, "2024-06-01", 12.0),
+    ])
+    bovino, dia, peso = vacias()
+    resumen = herd_summary(IDS, leche, {"bovino": bovino, "dia": dia, "peso": peso})["leche"]
+    assert resumen["registros"] == 4 and resumen["animales"] == 2
+    assert resumen["litros_totales"] == 64.0
+    assert resumen["litros_promedio_registro"] == 16.0
+    assert resumen["mejores"][0] == {"bovino_id": "b1", "litros_promedio": 21.0}
+    assert resumen["peores"][0] == {"bovino_id": "b2", "litros_promedio": 11.0}
+    assert resumen["lactancias"] == 3
+    assert [etapa["registros"] for etapa in resumen["por_etapa_lactancia"]] == [4, 0, 0]
+    assert resumen["grasa"] == {"promedio": None, "pendiente_mensual": None, "serie": []}
+
+
+def test_milk_monthly_trend():
+    leche = columnas_leche([(0, "2024-01-10", 20.0), (0, "2024-02-10", 20.0), (0, "2024-03-10", 20.0)])
+    leche["grasa"] = np.array([3.0, np.nan, 4.0])
+    bovino, dia, peso = vacias()
+    grasa = herd_summary(IDS, leche, {"bovino": bovino, "dia": dia, "peso": peso})["leche"]["grasa"]
+    assert grasa["promedio"] == 3.5
+    assert grasa["pendiente_mensual"] == 0.5
+    assert grasa["serie"] == [{"mes": "2024-01", "promedio": 3.0}, {"mes": "2024-03", "promedio": 4.0}]
+
+
+def test_weight_gain():
+    engorde = columnas_engorde([
+        (0, "2024-01-01", 300.0), (0, "2024-01-11", 310.0), (0, "2024-01-21", 320.0),
+        (1, "2024-01-01", 250.0), (1, "2024-01-11", 255.0),
+        # A single weighing gives no slope
+        (2, "2024-01-05", 400.0),
+    ])
+    bovino, dia, valores = vacias()
+    resumen = herd_summary(IDS, {"bovino": bovino, "dia": dia, "litros": valores, "grasa": valores,
+                                 "proteina": valores}, engorde)["engorde"]
+    assert resumen["registros"] == 6 and resumen["animales"] == 3
+    assert resumen["animales_con_ganancia"] == 2
+    assert resumen["ganancia_diaria_promedio_kg"] == 0.75
+    assert resumen["mejores"][0] == {"bovino_id": "b1", "ganancia_diaria_kg": 1.0}
+    assert resumen["peores"][0] == {"bovino_id": "b2", "ganancia_diaria_kg": 0.5}
@@ -0,0 +1,68 @@
+"""Vectorized point-in-polygon tests of geofence.py"""
+import numpy as np
+
+from geofence import Cerca, dentro, evaluar, fuera_de, localizar, ocupacion, preparar
+
+
+def cuadrado(id, x0, y0, lado):
+    return Cerca(id, [[x0, y0], [x0 + lado, y0], [x0 + lado, y0 + lado], [x0, y0 + lado]])
+
+
+def puntos(*coordenadas):
+    lng, lat = np.array(coordenadas, dtype=np.float64).T
+    return lng, lat
+
+
+def test_preparar_closes_ring_and_skips_missing():
+    cerca = preparar("p1", {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1]]]})
+    assert cerca.id == "p1" and cerca.x0.size == 4
+    assert cerca.caja == (0, 0, 1, 1)
+    assert preparar("p2", None) is None
+    assert preparar("p3", {"type": "Polygon", "coordinates": []}) is None
+
+
+def test_dentro_square():
+    lng, lat = puntos([0.5, 0.5], [1.5, 0.5], [-0.1, 0.5], [0.5, 2.0], [0.99, 0.01])
+    assert dentro(cuadrado("a", 0, 0, 1), lng, lat).tolist() == [True, False, False, False, True]
+
+
+def test_dentro_concave_polygon():
+    # U shape: the notch between the arms is outside
+    u = Cerca("u", [[0, 0], [3, 0], [3, 3], [2, 3], [2, 1], [1, 1], [1, 3], [0, 3]])
+    lng, lat = puntos([0.5, 2.5], [1.5, 2.5], [2.5, 2.5], [1.5, 0.5])
+    assert dentro(u, lng, lat).tolist() == [True, False, True, True]
+
+
+def test_localizar_first_match_wins():
+    cercas = [cuadrado("a", 0, 0, 2), cuadrado("b", 1, 1, 2)]
+    lng, lat = puntos([0.5, 0.5], [1.5, 1.5], [2.5, 2.5], [5, 5])
+    assert localizar(cercas, lng, lat).tolist() == [0, 0, 1, -1]
+
+
+def test_fuera_de_assigned_fence():
+    cercas = [cuadrado("a", 0, 0, 1), cuadrado("b", 2, 0, 1)]
+    lng, lat = puntos([0.5, 0.5], [2.5, 0.5], [0.5, 0.5], [9, 9])
+    asignada = np.array([0, 0, 1, -1])
+    assert fuera_de(cercas, asignada, lng, lat).tolist() == [False, True, True, False]
+
+
+def test_evaluar_outside_farm_is_not_outside_potrero():
+    perimetro = cuadrado(None, 0, 0, 10)
+    potreros = [cuadrado("a", 0, 0, 1)]
+    lng, lat = puntos([0.5, 0.5], [5, 5], [20, 20])
+    fuera_finca, fuera_potrero = evaluar(perimetro, potreros, np.array([0, 0, 0]), lng, lat)
+    assert fuera_finca.tolist() == [False, False, True]
+    assert fuera_potrero.tolist() == [False, True, False]
+
+
+def test_evaluar_without_perimeter():
+    lng, lat = puntos([5, 5])
+    fuera_finca, fuera_potrero = evaluar(None, [cuadrado("a", 0, 0, 1)], np.array([0]), lng, lat)
+    assert fuera_finca.tolist() == [False]
+    assert fuera_potrero.tolist() == [True]
+
+
+def test_ocupacion():
+    potreros = [cuadrado("a", 0, 0, 1), cuadrado("b", 2, 0, 1), cuadrado("c", 4, 0, 1)]
+    lng, lat = puntos([0.5, 0.5], [0.2, 0.8], [2.5, 0.5], [9, 9])
+    assert ocupacion(potreros, lng, lat).tolist() == [2, 1, 0]
@@ -0,0 +1,20 @@
+"""Track downsampling of the position history"""
+import numpy as np
+
+from server import downsample_track
+
+
+def test_downsample_track_keeps_last_fix_per_window():
+    t = np.array([130, 10, 70, 10, 65, 200])
+    lng = np.array([3.0, 1.0, 2.5, 1.0, 2.0, 4.0])
+    lat = -lng
+    tt, xx, yy = downsample_track(t, lng, lat, 60)
+    assert tt.tolist() == [10, 70, 130, 200]
+    assert xx.tolist() == [1.0, 2.5, 3.0, 4.0]
+    assert yy.tolist() == [-1.0, -2.5, -3.0, -4.0]
+
+
+def test_downsample_track_empty():
+    vacio = np.array([], dtype=np.int64)
+    tt, xx, yy = downsample_track(vacio, vacio.astype(float), vacio.astype(float), 60)
+    assert tt.size == xx.size == yy.size == 0
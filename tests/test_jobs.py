@@ -0,0 +1,220 @@
+"""JobQueue leasing and retries, and the orphan sweep, on an in-memory database"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from server import JobLeaseLost, JobQueue
+from tests.memoria import BaseMemoria
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    base = BaseMemoria()
+    monkeypatch.setattr(server, "db", base)
+    return base
+
+
+def hace(segundos: float) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=segundos)
+
+
+def test_claim_leases_a_job_once(memoria):
+    async def prueba():
+        cola = JobQueue(1)
+        trabajo = await cola.enqueue("x", {"a": 1}, "u1")
+        tomado = await cola.claim("w1")
+        assert tomado["id"] == trabajo["id"]
+        assert tomado["estado"] == "en_curso" and tomado["trabajador"] == "w1" and tomado["intentos"] == 1
+        assert tomado["lease_hasta"] > datetime.now(timezone.utc)
+        assert "_id" not in tomado
+        assert await cola.claim("w2") is None
+    asyncio.run(prueba())
+
+
+def test_claim_oldest_first_and_not_before_available(memoria):
+    async def prueba():
+        cola = JobQueue(1)
+        primero = await cola.enqueue("x", {})
+        segundo = await cola.enqueue("x", {})
+        await memoria.trabajos.update_one({"id": segundo["id"]}, {"$set": {"disponible_desde": hace(60)}})
+        futuro = await cola.enqueue("x", {})
+        await memoria.trabajos.update_one(
+            {"id": futuro["id"]}, {"$set": {"disponible_desde": datetime.now(timezone.utc) + timedelta(hours=1)}}
+        )
+        assert [(await cola.claim("w"))["id"] for _ in range(2)] == [segundo["id"], primero["id"]]
+        assert await cola.claim("w") is None
+    asyncio.run(prueba())
+
+
+def test_expired_lease_is_taken_over(memoria):
+    async def prueba():
+        cola = JobQueue(1)
+        await cola.enqueue("x", {})
+        muerto = await cola.claim("w1")
+        await cola.progress(muerto, set_={"paso": 1})
+        await memoria.trabajos.update_one({"id": muerto["id"]}, {"$set": {"lease_hasta": hace(1)}})
+        relevo = await cola.claim("w2")
+        assert relevo["trabajador"] == "w2" and relevo["intentos"] == 2
+        assert relevo["progreso"] == {"paso": 1}
+        with pytest.raises(JobLeaseLost):
+            await cola.progress(muerto, set_={"paso": 2})
+    asyncio.run(prueba())
+
+
+def test_progress_renews_the_lease(memoria):
+    async def prueba():
+        cola = JobQueue(1)
+        await cola.enqueue("x", {})
+        trabajo = await cola.claim("w")
+        await memoria.trabajos.update_one({"id": trabajo["id"]}, {"$set": {"lease_hasta": hace(-1)}})
+        await cola.progress(trabajo, inc={"eliminados.alertas": 3})
+        await cola.progress(trabajo, inc={"eliminados.alertas": 2})
+        guardado = await memoria.trabajos.find_one({"id": trabajo["id"]})
+        assert guardado["lease_hasta"] > datetime.now(timezone.utc) + timedelta(seconds=server.JOB_LEASE_SECONDS - 5)
+        assert guardado["progreso"] == {"eliminados": {"alertas": 5}}
+    asyncio.run(prueba())
+
+
+def test_run_one_completes(memoria):
+    async def prueba():
+        cola = JobQueue(1)
+        vistos = []
+
+        @cola.handler("x")
+        async def manejar(trabajo):
+            vistos.append(trabajo["parametros"])
+
+        await cola.enqueue("x", {"a": 1})
+        assert await cola.run_one("w")
+        assert not await cola.run_one("w")
+        assert vistos == [{"a": 1}]
+        guardado = await memoria.trabajos.find_one({})
+        assert guardado["estado"] == "completado" and guardado["lease_hasta"] is None
+        assert cola.stats()["completados"] == 1
+    asyncio.run(prueba())
+
+
+def test_failed_job_retries_with_backoff_then_gives_up(memoria):
+    async def prueba():
+        cola = JobQueue(1)
+
+        @cola.handler("x")
+        async def manejar(trabajo):
+            raise RuntimeError("sin conexión")
+
+        trabajo = await cola.enqueue("x", {})
+        for intento in range(1, server.JOB_MAX_ATTEMPTS + 1):
+            assert await cola.run_one("w")
+            guardado = await memoria.trabajos.find_one({"id": trabajo["id"]})
+            assert guardado["intentos"] == intento and guardado["error"] == "sin conexión"
+            if intento < server.JOB_MAX_ATTEMPTS:
+                assert guardado["estado"] == "pendiente"
+                espera = guardado["disponible_desde"] - datetime.now(timezone.utc)
+                assert timedelta(seconds=2 ** intento - 1) < espera <= timedelta(seconds=2 ** intento)
+                # Not ready before its backoff runs out
+                assert not await cola.run_one("w")
+                await memoria.trabajos.update_one({"id": trabajo["id"]}, {"$set": {"disponible_desde": hace(1)}})
+        assert guardado["estado"] == "fallido"
+        assert not await cola.run_one("w")
+        assert cola.stats()["reintentos"] == server.JOB_MAX_ATTEMPTS - 1 and cola.stats()["fallidos"] == 1
+    asyncio.run(prueba())
+
+
+def test_unknown_job_type_fails(memoria):
+    async def prueba():
+        cola = JobQueue(1)
+        await cola.enqueue("desconocido", {})
+        await cola.run_one("w")
+        guardado = await memoria.trabajos.find_one({})
+        assert guardado["estado"] == "pendiente" and "desconocido" in guardado["error"]
+    asyncio.run(prueba())
+
+
+def test_lost_lease_leaves_the_job_to_its_new_worker(memoria):
+    async def prueba():
+        cola = JobQueue(1)
+
+        @cola.handler("x")
+        async def manejar(trabajo):
+            await memoria.trabajos.update_one({"id": trabajo["id"]}, {"$set": {"trabajador": "otro"}})
+            await cola.progress(trabajo)
+
+        await cola.enqueue("x", {})
+        assert await cola.run_one("w")
+        guardado = await memoria.trabajos.find_one({})
+        assert guardado["estado"] == "en_curso" and guardado["trabajador"] == "otro"
+        assert cola.stats() == {"trabajadores": 0, "completados": 0, "fallidos": 0, "reintentos": 0}
+    asyncio.run(prueba())
+
+
+def test_drain_runs_every_ready_job(memoria):
+    async def prueba():
+        cola = JobQueue(1)
+        vistos = []
+
+        @cola.handler("x")
+        async def manejar(trabajo):
+            vistos.append(trabajo["parametros"]["n"])
+
+        for n in range(3):
+            await cola.enqueue("x", {"n": n})
+        await cola.drain()
+        assert sorted(vistos) == [0, 1, 2]
+    asyncio.run(prueba())
+
+
+async def cargar_granja(memoria):
+    await memoria.fincas.insert_one({"id": "f1"})
+    await memoria.potreros.insert_one({"id": "p1", "finca_id": "f1"})
+    await memoria.bovinos.insert_one({"id": "b1", "finca_id": "f1"})
+    await memoria.estadisticas_finca.insert_one({"finca_id": "f1", "alertas_activas": 5, "version": 1})
+    for alerta in [
+        {"id": "capacidad", "finca_id": "f1", "potrero_id": "p1", "bovino_id": None, "activa": True},
+        {"id": "peso", "finca_id": "f1", "bovino_id": "b1", "activa": True},
+        {"id": "legado", "bovino_id": "b1", "activa": True},
+    ]:
+        await memoria.alertas.insert_one(alerta)
+
+
+def ids_alertas(memoria):
+    return sorted(a["id"] for a in memoria.alertas.docs)
+
+
+def test_sweep_keeps_potrero_alerts(memoria):
+    async def prueba():
+        await cargar_granja(memoria)
+        await server.sweep_orphans()
+        assert ids_alertas(memoria) == ["capacidad", "legado", "peso"]
+        assert (await memoria.estadisticas_finca.find_one({"finca_id": "f1"}))["alertas_activas"] == 5
+        assert (await memoria.trabajos.find_one({}))["estado"] == "completado"
+    asyncio.run(prueba())
+
+
+def test_sweep_removes_alerts_of_deleted_parents(memoria):
+    async def prueba():
+        await cargar_granja(memoria)
+        await memoria.alertas.insert_one(
+            {"id": "geocerca", "finca_id": "f1", "potrero_id": "p9", "bovino_id": "b1", "activa": True}
+        )
+        await memoria.alertas.insert_one({"id": "potrero-borrado", "finca_id": "f1", "potrero_id": "p9", "activa": True})
+        await memoria.alertas.insert_one({"id": "resuelta", "finca_id": "f1", "bovino_id": "b9", "activa": False})
+        await memoria.alertas.insert_one({"id": "finca-borrada", "finca_id": "f9", "potrero_id": "p8", "activa": True})
+        await server.sweep_orphans()
+        # A bovino alert stays with its bovino even if its potrero is gone
+        assert ids_alertas(memoria) == ["capacidad", "geocerca", "legado", "peso"]
+        assert (await memoria.estadisticas_finca.find_one({"finca_id": "f1"}))["alertas_activas"] == 4
+        assert await memoria.estadisticas_finca.find_one({"finca_id": "f9"}) is None
+    asyncio.run(prueba())
+
+
+def test_sweep_removes_animals_of_deleted_fincas(memoria):
+    async def prueba():
+        await cargar_granja(memoria)
+        await memoria.fincas.delete_one({"id": "f1"})
+        await memoria.estadisticas_finca.delete_one({"finca_id": "f1"})
+        await server.sweep_orphans()
+        assert memoria.bovinos.docs == [] and memoria.potreros.docs == [] and memoria.alertas.docs == []
+        assert memoria.estadisticas_finca.docs == []
+    asyncio.run(prueba())
@@ -0,0 +1,34 @@
+"""Bounded in-process cache shared by the QR, user and report caches"""
+from server import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"entradas": 2, "aciertos": 3, "fallos": 1}
+
+
+def test_lru_cache_invalidate_and_clear():
+    cache = LRUCache(10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a")
+    cache.invalidate("x")
+    assert cache.get("a") is None and cache.get("b") == 2
+    cache.clear()
+    assert cache.get("b") is None
+
+
+def test_lru_cache_ttl(reloj):
+    cache = LRUCache(10, ttl=30)
+    cache.set("a", 1)
+    reloj[0] += 29
+    assert cache.get("a") == 1
+    reloj[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["entradas"] == 0
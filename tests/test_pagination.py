@@ -0,0 +1,32 @@
+"""Keyset cursors of the list endpoints"""
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from server import decode_cursor, encode_cursor, keyset_filter
+
+
+def test_cursor_round_trip():
+    valores = ["2024-03-01", 12.5, None, datetime(2024, 3, 1, 6, 30, tzinfo=timezone.utc), "b1"]
+    assert decode_cursor(encode_cursor(valores), len(valores)) == valores
+
+
+def test_cursor_is_url_safe():
+    token = encode_cursor(["??>>", "ñ"])
+    assert not set(token) & set("+/")
+
+
+@pytest.mark.parametrize("token", ["no es base64!", encode_cursor({"a": 1}), encode_cursor(["a", "b"])])
+def test_cursor_rejects_bad_tokens(token):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(token, 3)
+    assert error.value.status_code == 400
+
+
+def test_keyset_filter_branches():
+    sort = [("fecha_registro", -1), ("id", 1)]
+    assert keyset_filter(sort, ["2024-03-01", "l7"]) == {"$or": [
+        {"fecha_registro": {"$lt": "2024-03-01"}},
+        {"fecha_registro": "2024-03-01", "id": {"$gt": "l7"}},
+    ]}
@@ -0,0 +1,10 @@
+"""Low milk production rule"""
+from server import is_low_production
+
+
+def test_is_low_production():
+    anteriores = [20.0, 20.0, 20.0, 20.0]
+    assert is_low_production(15.9, anteriores)
+    assert not is_low_production(16.0, anteriores)
+    # Too few records to judge
+    assert not is_low_production(1.0, anteriores[:3])
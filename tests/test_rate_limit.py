@@ -0,0 +1,28 @@
+"""Token buckets guarding the public scan endpoint"""
+import pytest
+
+from server import TokenBucketLimiter
+
+
+def test_token_bucket_burst_then_wait(reloj):
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    assert [limiter.acquire("ip") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("ip") == pytest.approx(0.5)
+    reloj[0] += 0.5
+    assert limiter.acquire("ip") == 0
+    assert limiter.acquire("otra") == 0
+    assert limiter.stats() == {"clientes": 2, "rechazadas": 1}
+
+
+def test_token_bucket_refill_is_capped(reloj):
+    limiter = TokenBucketLimiter(rate=1, burst=2)
+    limiter.acquire("ip")
+    reloj[0] += 3600
+    assert [limiter.acquire("ip") for _ in range(3)][2] > 0
+
+
+def test_token_bucket_drops_oldest_keys():
+    limiter = TokenBucketLimiter(rate=1, burst=1, maxsize=2)
+    for clave in ("a", "b", "a", "c"):
+        limiter.acquire(clave)
+    assert list(limiter.buckets) == ["a", "c"]
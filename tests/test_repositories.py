@@ -0,0 +1,171 @@
+"""SQLRepository on the SQLite stand-in schema (aiosqlite)"""
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from repositories import open_repository
+
+HOY = datetime.now().strftime("%Y-%m-%d")
+
+
+def dias_atras(n: int) -> str:
+    return (datetime.now() - timedelta(days=n)).strftime("%Y-%m-%d")
+
+
+FINCAS = [
+    {"id": "f1", "nombre": "La Esperanza", "area_ha": 120.5, "ubicacion": {"lat": 9.75, "lng": -83.75},
+     "perimetro": [{"lat": 9.74, "lng": -83.76}, {"lat": 9.76, "lng": -83.76}, {"lat": 9.76, "lng": -83.74}],
+     "creado_en": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)},
+    {"id": "f2", "nombre": "El Roble"},
+]
+BOVINOS = [
+    {"id": "b1", "finca_id": "f1", "caravana": "001", "nombre": "Lucera", "raza": "Holstein",
+     "tipo_ganado": "leche", "fecha_nacimiento": "2020-03-15", "peso_kg": 450.0,
+     "ultima_posicion": {"lat": 9.751, "lng": -83.751}},
+    {"id": "b2", "finca_id": "f1", "caravana": "002", "tipo_ganado": "carne", "estado_venta": "vendido"},
+    {"id": "b3", "finca_id": "f1", "caravana": "003", "tipo_ganado": "dual", "estado_ganado": "muerto"},
+    {"id": "b4", "finca_id": "f2", "caravana": "001", "tipo_ganado": "leche", "raza": "Raza desconocida"},
+]
+LECHE = [
+    {"id": "l1", "bovino_id": "b1", "fecha_registro": dias_atras(2), "leche_litros": 20.0, "grasa_pct": 3.5},
+    {"id": "l2", "bovino_id": "b1", "fecha_registro": dias_atras(1), "leche_litros": 22.0, "grasa_pct": 4.5},
+    {"id": "l3", "bovino_id": "b4", "fecha_registro": dias_atras(1), "leche_litros": 10.0},
+    {"id": "l4", "bovino_id": "b1", "fecha_registro": "2020-01-10", "leche_litros": 15.0},
+]
+
+
+def run(prueba):
+    """Run `prueba(repo)` on a fresh SQLite repository loaded with the sample herd"""
+    async def main():
+        repo = await open_repository("sqlite", "sqlite://")
+        try:
+            await repo.insert_fincas(FINCAS)
+            await repo.insert_bovinos(BOVINOS)
+            await repo.insert_produccion_leche(LECHE)
+            return await prueba(repo)
+        finally:
+            await repo.close()
+    return asyncio.run(main())
+
+
+def test_finca_round_trip():
+    finca = run(lambda repo: repo.get_finca("f1"))
+    assert finca["nombre"] == "La Esperanza"
+    assert finca["area_ha"] == 120.5
+    assert finca["ubicacion"] == {"lat": 9.75, "lng": -83.75}
+    assert finca["perimetro"] == FINCAS[0]["perimetro"]
+    assert finca["creado_en"] == datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert run(lambda repo: repo.get_finca("nope")) is None
+
+
+def test_bovino_resolves_catalogs():
+    bovino = run(lambda repo: repo.get_bovino("b1"))
+    assert bovino["raza"] == "Holstein"
+    assert (bovino["tipo_ganado"], bovino["estado_ganado"], bovino["estado_venta"]) == ("leche", "activo", "disponible")
+    assert bovino["fecha_nacimiento"] == "2020-03-15"
+    assert bovino["ultima_posicion"] == {"lat": 9.751, "lng": -83.751}
+    # A breed missing from the catalog is stored without one
+    assert run(lambda repo: repo.get_bovino("b4"))["raza"] is None
+    assert run(lambda repo: repo.get_bovino("nope")) is None
+
+
+def test_list_bovinos_filters_and_pages_by_id():
+    async def prueba(repo):
+        return (
+            [b["id"] for b in await repo.list_bovinos()],
+            [b["id"] for b in await repo.list_bovinos(finca_id="f1", limit=2)],
+            [b["id"] for b in await repo.list_bovinos(finca_id="f1", despues_de="b2")],
+            [b["id"] for b in await repo.list_bovinos(tipo_ganado="leche")],
+        )
+    todos, pagina, siguiente, lecheras = run(prueba)
+    assert todos == ["b1", "b2", "b3", "b4"]
+    assert pagina == ["b1", "b2"]
+    assert siguiente == ["b3"]
+    assert lecheras == ["b1", "b4"]
+
+
+def test_duplicate_caravana_rolls_back_the_batch():
+    async def prueba(repo):
+        with pytest.raises(sqlite3.IntegrityError):
+            await repo.insert_bovinos([
+                {"id": "b5", "finca_id": "f2", "caravana": "005", "tipo_ganado": "leche"},
+                {"id": "b6", "finca_id": "f2", "caravana": "001", "tipo_ganado": "leche"},
+            ])
+        return await repo.get_bovino("b5")
+    assert run(prueba) is None
+
+
+def test_reporte_produccion_orders_and_bounds_dates():
+    reporte = run(lambda repo: repo.reporte_produccion("b1", dias_atras(30), HOY))
+    assert [p["valor"] for p in reporte["leche"]] == [20.0, 22.0]
+    assert reporte["leche"][0]["grasa_pct"] == 3.5
+    assert reporte["engorde"] == []
+    assert list(run(lambda repo: repo.reporte_produccion("b1", dias_atras(30), HOY, ["leche"]))) == ["leche"]
+
+
+def test_dashboard_stats():
+    todas = run(lambda repo: repo.dashboard_stats(None, 30))
+    assert todas["total_fincas"] == 2
+    assert todas["total_bovinos"] == 4
+    assert todas["total_litros_mes"] == 52.0  # the 2020 record is outside the window
+    # Dead animals are left out of the herd split
+    assert sorted((c["_id"], c["count"]) for c in todas["bovinos_por_tipo"]) == [("carne", 1), ("leche", 2)]
+    assert sorted((c["_id"], c["count"]) for c in todas["bovinos_por_venta"]) == [("disponible", 2), ("vendido", 1)]
+
+    finca = run(lambda repo: repo.dashboard_stats("f2", 30))
+    assert (finca["total_fincas"], finca["total_bovinos"], finca["total_litros_mes"]) == (1, 1, 10.0)
+    assert finca["alertas_activas"] == 0
+
+
+def test_produccion_mensual_view():
+    meses = run(lambda repo: repo.produccion_mensual(["f1"], None, None))
+    assert [(m["anio"], m["mes"]) for m in meses][0] == (2020, 1)
+    assert all(m["finca_nombre"] == "La Esperanza" for m in meses)
+    assert sum(m["litros_totales"] for m in meses) == 57.0
+    desde = dias_atras(2)[:7]
+    recientes = run(lambda repo: repo.produccion_mensual(None, desde, None))
+    assert {m["finca_id"] for m in recientes} == {"f1", "f2"}
+    assert all(f"{m['anio']}-{m['mes']:02d}" >= desde for m in recientes)
+    assert run(lambda repo: repo.produccion_mensual(None, None, "2020-01"))[0]["litros_totales"] == 15.0
+
+
+def test_weight_trigger_updates_bovino():
+    async def prueba(repo):
+        await repo.driver.execute_many(
+            "INSERT INTO produccion_engorde (id, bovino_id, fecha_registro, peso_kg) VALUES (?, ?, ?, ?)",
+            [("e1", "b2", HOY, 512.5)]
+        )
+        return (await repo.get_bovino("b2"))["peso_kg"], await repo.reporte_produccion("b2", HOY, HOY, ["engorde"])
+    peso, reporte = run(prueba)
+    assert peso == 512.5
+    assert reporte["engorde"] == [{"fecha_registro": HOY, "valor": 512.5}]
+
+
+def test_file_database_shares_data_across_pooled_connections(tmp_path):
+    async def main():
+        repo = await open_repository("sqlite", f"sqlite:///{tmp_path / 'manea.db'}", pool_max=3)
+        try:
+            assert len(repo.driver.conexiones) == 3
+            await repo.insert_fincas(FINCAS)
+            # Concurrent reads hold different connections and all see the committed rows
+            fincas = await asyncio.gather(*[repo.get_finca("f1") for _ in range(6)])
+            assert all(f["nombre"] == "La Esperanza" for f in fincas)
+        finally:
+            await repo.close()
+    asyncio.run(main())
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(open_repository("oracle"))
+
+
+def test_statements_are_prepared_once():
+    async def prueba(repo):
+        await repo.get_bovino("b1")
+        primero = repo.sentencias["bovino"]
+        await repo.get_bovino("b2")
+        return primero is repo.sentencias["bovino"]
+    assert run(prueba)